@@ -5,6 +5,16 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+Запуск в ASGI-режиме (сервис backend-asgi в docker-compose.yaml):
+
+    uvicorn config.asgi:application --host 0.0.0.0 --port 8001 --workers 4
+
+Асинхронные эндпоинты (lms.async_views) смонтированы под /api/async/ и ходят
+в PostgreSQL через асинхронный ORM, поэтому один процесс держит много
+одновременных соединений. Синхронные DRF-вьюхи под ASGI тоже работают,
+но выполняются через sync_to_async(thread_sensitive=True) в одном общем
+потоке, то есть по одной за раз на процесс.
 """
 
 import os
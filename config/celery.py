@@ -1,15 +1,40 @@
 import os
 from celery import Celery
 from celery.schedules import crontab
+from django.conf import settings
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-app = Celery('myproject')
+app = Celery('config')
 
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 app.autodiscover_tasks()
 
+# Периодические задачи обслуживания маршрутизируются в очередь maintenance,
+# ретранслятор outbox — в default, к коротким задачам
+
+app.conf.beat_schedule = {
+    'relay-outbox': {
+        'task': 'lms.tasks.relay_outbox',
+        'schedule': settings.OUTBOX_RELAY_INTERVAL,
+        # Пока воркер лежит, запуски не копятся в очереди: следующий всё равно заберёт весь outbox
+        'options': {'expires': settings.OUTBOX_RELAY_INTERVAL},
+    },
+    'deactivate-inactive-users': {
+        'task': 'users.tasks.deactivate_inactive_users',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'compact-payment-rollups': {
+        'task': 'users.tasks.compact_payment_rollups',
+        'schedule': crontab(hour=0, minute=30),
+    },
+    'reconcile-course-counters': {
+        'task': 'lms.tasks.reconcile_course_counters',
+        'schedule': crontab(hour=4, minute=0),
+    },
+}
+
 
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
@@ -18,6 +18,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'lms',
     'users',
     'allauth',
@@ -26,6 +27,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'lms.profiling.ProfilingMiddleware',
+    'lms.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -36,6 +39,12 @@ MIDDLEWARE = [
     'allauth.account.middleware.AccountMiddleware',
 ]
 
+# Профилирование запросов: число SQL-запросов, время БД/сериализации/ответа по эндпоинтам
+# По умолчанию только при DEBUG; заголовок X-Query-Count получают DEBUG-окружения и персонал
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', str(DEBUG)) == 'True'
+# Как часто (в секундах) процесс сбрасывает накопленные метрики в кэш
+PROFILING_FLUSH_INTERVAL = float(os.getenv('PROFILING_FLUSH_INTERVAL', 10))
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -56,9 +65,18 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
+# Соединения с БД: постоянные (CONN_MAX_AGE) с проверкой перед повторным использованием (CONN_HEALTH_CHECKS).
+# В docker-compose процессы ходят в PostgreSQL через pgbouncer в режиме transaction, у веба и Celery
+# отдельные пулы. Серверный курсор при таком пулинге не переживает транзакцию — за pgbouncer серверные
+# курсоры отключаются (DB_DISABLE_SERVER_SIDE_CURSORS=True), крупные выборки читаются порциями по ключу.
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 600))
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
 if 'DATABASE_URL' in os.environ:
     DATABASES = {
-        'default': dj_database_url.config(default=os.getenv('DATABASE_URL'), conn_max_age=600)
+        'default': dj_database_url.config(
+            default=os.getenv('DATABASE_URL'), conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=DB_CONN_HEALTH_CHECKS
+        )
     }
 else:
     DATABASES = {
@@ -69,8 +87,80 @@ else:
             'PASSWORD': os.getenv('DB_PASSWORD', 'Thirty2025'),
             'HOST': os.getenv('DB_HOST', 'localhost'),
             'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+        }
+    }
+DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = os.getenv('DB_DISABLE_SERVER_SIDE_CURSORS', 'False') == 'True'
+
+# Реплика для чтения (потоковая репликация). lms.routers.ReplicaRouter отправляет на неё чтения
+# безопасных HTTP-запросов и задач, включивших replica_reads; без реплики всё идёт в default
+if os.getenv('DATABASE_REPLICA_URL'):
+    DATABASES['replica'] = dj_database_url.parse(
+        os.getenv('DATABASE_REPLICA_URL'), conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=DB_CONN_HEALTH_CHECKS
+    )
+elif os.getenv('DB_REPLICA_HOST'):
+    # Настройки соединений те же, что у default, поэтому реплика, как и default, ходит через pgbouncer
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+    }
+if 'replica' in DATABASES:
+    DATABASES['replica']['DISABLE_SERVER_SIDE_CURSORS'] = DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS']
+    # В тестах реплика — та же база, что и default
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['lms.routers.ReplicaRouter']
+# Сколько секунд после записи чтения клиента идут в default: больше ожидаемого лага реплики
+DB_REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', 10))
+
+REDIS_HOST = os.getenv('REDIS_HOST')
+if REDIS_HOST:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': f"redis://{REDIS_HOST}:{os.getenv('REDIS_PORT') or 6379}/{os.getenv('REDIS_CACHE_DB', 1)}",
         }
     }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('LOCMEM_CACHE_MAX_ENTRIES', 10000))},
+        }
+    }
+
+# Время жизни закэшированных ответов курсов и уроков, в секундах
+LMS_RESPONSE_CACHE_TIMEOUT = int(os.getenv('LMS_RESPONSE_CACHE_TIMEOUT', 300))
+# Время жизни ключей версий владельцев: конечное, чтобы redis с volatile-lru мог их вытеснять,
+# и не меньше времени жизни ответов, иначе версия сменится раньше, чем истекут её ответы
+LMS_OWNER_VERSION_TIMEOUT = max(
+    int(os.getenv('LMS_OWNER_VERSION_TIMEOUT', 7 * 24 * 3600)), LMS_RESPONSE_CACHE_TIMEOUT + 60
+)
+
+# Время жизни кэша членства пользователя в группах (IsModerator), в секундах
+USER_GROUPS_CACHE_TIMEOUT = int(os.getenv('USER_GROUPS_CACHE_TIMEOUT', 3600))
+
+# JWT-аутентификация: кэш пользователей и версий токенов (users.authentication)
+USER_AUTH_CACHE_TIMEOUT = int(os.getenv('USER_AUTH_CACHE_TIMEOUT', 300))
+USER_AUTH_LOCAL_CACHE_TTL = float(os.getenv('USER_AUTH_LOCAL_CACHE_TTL', 5))
+USER_AUTH_LOCAL_CACHE_SIZE = int(os.getenv('USER_AUTH_LOCAL_CACHE_SIZE', 10000))
+
+# Выгрузка платежей: строк на одну порцию серверного курсора
+PAYMENT_EXPORT_CHUNK_SIZE = int(os.getenv('PAYMENT_EXPORT_CHUNK_SIZE', 2000))
+
+# Сводки платежей: сколько последних закрытых дней пересчитывает compact_payment_rollups
+PAYMENT_ROLLUP_COMPACT_DAYS = int(os.getenv('PAYMENT_ROLLUP_COMPACT_DAYS', 2))
+# Период по умолчанию для /api/payments/rollups/, в днях
+PAYMENT_ROLLUP_DEFAULT_DAYS = int(os.getenv('PAYMENT_ROLLUP_DEFAULT_DAYS', 30))
+
+# Максимум уроков в одном запросе к /api/lessons/bulk/
+LESSON_BULK_MAX_ITEMS = int(os.getenv('LESSON_BULK_MAX_ITEMS', 1000))
+
+# Массовые подписки /api/subscriptions/bulk/: максимум пар (пользователь, курс) в запросе и размер пачки INSERT/DELETE
+SUBSCRIPTION_BULK_MAX_PAIRS = int(os.getenv('SUBSCRIPTION_BULK_MAX_PAIRS', 100000))
+SUBSCRIPTION_BULK_BATCH_SIZE = int(os.getenv('SUBSCRIPTION_BULK_BATCH_SIZE', 1000))
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -99,6 +189,21 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
 
+REST_FRAMEWORK = {
+    # JWT первым: DRF берёт WWW-Authenticate у первого класса, и истёкший или неверный токен получает 401,
+    # по которому клиент обновляет токен (см. CachedJWTAuthentication.authenticate_header)
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'users.authentication.CachedJWTAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+    ],
+}
+
+SIMPLE_JWT = {
+    # Токены несут claims is_active, is_moderator и версию для отзыва
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.LmsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.LmsTokenRefreshSerializer',
+}
+
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.gmail.com')
 EMAIL_PORT = os.getenv('EMAIL_PORT', 587)
@@ -107,12 +212,77 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
-CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
-CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
+CELERY_REDIS_URL = f"redis://{REDIS_HOST or 'localhost'}:{os.getenv('REDIS_PORT') or 6379}/{os.getenv('REDIS_DB') or 0}"
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', CELERY_REDIS_URL)
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', CELERY_REDIS_URL)
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
+# Очереди: рассылки и обслуживание обрабатываются своими воркерами (docker-compose.yaml)
+# и не занимают слоты интерактивных задач из default
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_ROUTES = {
+    'lms.tasks.dispatch_course_update_email': {'queue': 'notifications'},
+    'lms.tasks.send_course_update_email': {'queue': 'notifications'},
+    'lms.tasks.send_course_update_email_chunk': {'queue': 'notifications'},
+    # Раскладка урока по лентам всех подписчиков — такая же массовая рассылка, как письма
+    'lms.tasks.fanout_lesson_to_feeds': {'queue': 'notifications'},
+    # Ретранслятор outbox короткий и истекает через OUTBOX_RELAY_INTERVAL: в notifications за долгими
+    # порциями рассылки он протухал бы в очереди, пока идёт рассылка
+    'lms.tasks.relay_outbox': {'queue': 'default'},
+    'lms.tasks.reconcile_course_counters': {'queue': 'maintenance'},
+    'users.tasks.deactivate_inactive_users': {'queue': 'maintenance'},
+    'users.tasks.compact_payment_rollups': {'queue': 'maintenance'},
+}
+# Подтверждение после выполнения: задача упавшего воркера вернётся в очередь
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+# Значение по умолчанию; воркеры очередей задают своё через --prefetch-multiplier
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.getenv('CELERY_WORKER_PREFETCH_MULTIPLIER', 1))
+CELERY_TASK_SOFT_TIME_LIMIT = int(os.getenv('CELERY_TASK_SOFT_TIME_LIMIT', 60))
+CELERY_TASK_TIME_LIMIT = int(os.getenv('CELERY_TASK_TIME_LIMIT', 90))
+CELERY_TASK_ANNOTATIONS = {
+    'lms.tasks.dispatch_course_update_email': {'soft_time_limit': 300, 'time_limit': 330},
+    'lms.tasks.send_course_update_email': {'soft_time_limit': 300, 'time_limit': 330},
+    'lms.tasks.send_course_update_email_chunk': {'soft_time_limit': 120, 'time_limit': 150},
+    'lms.tasks.reconcile_course_counters': {'soft_time_limit': 1800, 'time_limit': 1860},
+    'lms.tasks.fanout_lesson_to_feeds': {'soft_time_limit': 600, 'time_limit': 660},
+    'users.tasks.deactivate_inactive_users': {'soft_time_limit': 1800, 'time_limit': 1860},
+    'users.tasks.compact_payment_rollups': {'soft_time_limit': 1800, 'time_limit': 1860},
+}
+# Отложенные задачи (countdown дебаунса рассылок) с acks_late не должны переотправляться
+# брокером раньше срока: таймаут видимости больше самой длинной отсрочки
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'visibility_timeout': int(os.getenv('CELERY_VISIBILITY_TIMEOUT', 4 * 3600)),
+}
+
+# Рассылка об обновлении курса: размер порции адресатов на одну подзадачу
+COURSE_UPDATE_EMAIL_CHUNK_SIZE = int(os.getenv('COURSE_UPDATE_EMAIL_CHUNK_SIZE', 500))
+COURSE_UPDATE_EMAIL_MAX_RETRIES = int(os.getenv('COURSE_UPDATE_EMAIL_MAX_RETRIES', 5))
+
+# Дебаунс уведомлений об обновлении курса, в секундах: тихое окно после последней правки,
+# максимальная отсрочка от первой правки серии и минимальный интервал между рассылками по курсу
+COURSE_UPDATE_NOTIFY_QUIET_WINDOW = int(os.getenv('COURSE_UPDATE_NOTIFY_QUIET_WINDOW', 300))
+COURSE_UPDATE_NOTIFY_MAX_DELAY = int(os.getenv('COURSE_UPDATE_NOTIFY_MAX_DELAY', 1800))
+COURSE_UPDATE_NOTIFY_MIN_INTERVAL = int(os.getenv('COURSE_UPDATE_NOTIFY_MIN_INTERVAL', 3600))
+
+# Outbox событий курсов и уроков: событий в одной пачке ретранслятора и период его запуска из beat, в секундах
+OUTBOX_RELAY_BATCH_SIZE = int(os.getenv('OUTBOX_RELAY_BATCH_SIZE', 500))
+OUTBOX_RELAY_INTERVAL = float(os.getenv('OUTBOX_RELAY_INTERVAL', 5))
+
+# Лента «моё обучение»: сколько последних уроков курса попадает в ленту при подписке
+# и подписчиков в одной пачке раскладки нового урока
+FEED_BACKFILL_LESSONS = int(os.getenv('FEED_BACKFILL_LESSONS', 20))
+FEED_FANOUT_BATCH_SIZE = int(os.getenv('FEED_FANOUT_BATCH_SIZE', 1000))
+FEED_PAGE_SIZE = int(os.getenv('FEED_PAGE_SIZE', 20))
+
+# Сверка денормализованных счётчиков курсов: курсов в одной пачке
+COURSE_COUNTERS_BATCH_SIZE = int(os.getenv('COURSE_COUNTERS_BATCH_SIZE', 1000))
+
+# Деактивация неактивных пользователей: размер одной пачки UPDATE
+DEACTIVATE_USERS_BATCH_SIZE = int(os.getenv('DEACTIVATE_USERS_BATCH_SIZE', 1000))
+
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
 
 # Настройки allauth (обновлены)
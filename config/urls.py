@@ -2,8 +2,11 @@ from django.contrib import admin
 from django.urls import path
 from django.http import HttpResponse
 from lms.views import CourseViewSet, LessonListCreateView, LessonDetailView, LessonUpdateView, LessonDeleteView, \
-    SubscriptionView
-from users.views import PaymentViewSet, UserViewSet, PaymentStripeCreateAPIView
+    SubscriptionView, MetricsView, LessonBulkView, CourseSearchView, LessonSearchView, SubscriptionBulkView, FeedView
+from lms.async_views import AsyncCourseListView, AsyncCourseDetailView, AsyncLessonListCreateView, \
+    AsyncLessonDetailView, AsyncSubscriptionView
+from users.views import PaymentViewSet, UserViewSet, PaymentStripeCreateAPIView, TokenRevokeView, \
+    PaymentExportView, PaymentRollupView
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
@@ -22,22 +25,37 @@ urlpatterns = [
         {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}),
          name='course-detail'),
     path('api/lessons/', LessonListCreateView.as_view(), name='lesson-list-create'),
+    path('api/lessons/bulk/', LessonBulkView.as_view(), name='lesson-bulk'),
     path('api/lessons/<int:pk>/', LessonDetailView.as_view(), name='lesson-detail'),
     path('api/lessons/<int:pk>/update/', LessonUpdateView.as_view(), name='lesson-update'),
     path('api/lessons/<int:pk>/delete/', LessonDeleteView.as_view(), name='lesson-delete'),
     path('api/subscriptions/', SubscriptionView.as_view(), name='subscription-create'),
+    path('api/subscriptions/bulk/', SubscriptionBulkView.as_view(), name='subscription-bulk'),
     path('api/subscriptions/<int:course_id>/', SubscriptionView.as_view(), name='subscription-delete'),
-    path('api/payments/', PaymentViewSet.as_view({'get': 'list', 'post': 'create'}), name='payment-list'),
-    path('api/payments/<int:pk>/', PaymentViewSet.as_view(
-        {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}),
-         name='payment-detail'),
+    path('api/feed/', FeedView.as_view(), name='feed'),
+    path('api/search/courses/', CourseSearchView.as_view(), name='course-search'),
+    path('api/search/lessons/', LessonSearchView.as_view(), name='lesson-search'),
+    # Асинхронные аналоги для запуска под ASGI (см. config/asgi.py)
+    path('api/async/courses/', AsyncCourseListView.as_view(), name='async-course-list'),
+    path('api/async/courses/<int:pk>/', AsyncCourseDetailView.as_view(), name='async-course-detail'),
+    path('api/async/lessons/', AsyncLessonListCreateView.as_view(), name='async-lesson-list-create'),
+    path('api/async/lessons/<int:pk>/', AsyncLessonDetailView.as_view(), name='async-lesson-detail'),
+    path('api/async/subscriptions/', AsyncSubscriptionView.as_view(), name='async-subscription-create'),
+    path('api/async/subscriptions/<int:course_id>/', AsyncSubscriptionView.as_view(),
+         name='async-subscription-delete'),
+    path('api/payments/', PaymentViewSet.as_view({'get': 'list'}), name='payment-list'),
+    path('api/payments/<int:pk>/', PaymentViewSet.as_view({'get': 'retrieve'}), name='payment-detail'),
+    path('api/payments/export/', PaymentExportView.as_view(), name='payment-export'),
+    path('api/payments/rollups/', PaymentRollupView.as_view(), name='payment-rollups'),
     path('api/payments/stripe/', PaymentStripeCreateAPIView.as_view(), name='payment-stripe-create'),
     path('api/users/', UserViewSet.as_view({'get': 'list', 'post': 'create'}), name='user-list'),
     path('api/users/<int:pk>/', UserViewSet.as_view(
         {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}),
          name='user-detail'),
+    path('api/_metrics/', MetricsView.as_view(), name='metrics'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/revoke/', TokenRevokeView.as_view(), name='token_revoke'),
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/swagger/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
@@ -0,0 +1,5 @@
+#!/bin/bash
+# Выполняется образом postgres при первой инициализации базы:
+# разрешает потоковую репликацию для сервиса db-replica
+set -e
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -0,0 +1,190 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import APIException, NotAuthenticated, ParseError
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+from lms.models import Lesson, Course, Subscription
+from lms.paginators import CoursePagination, LessonPagination
+from lms.views import LESSON_READ_FIELDS, LESSON_WRITE_FIELDS, LESSON_DELETE_FIELDS
+from lms.serializers import (LessonSerializer, CourseSerializer, CourseWriteSerializer, LessonWriteSerializer,
+                             SubscriptionSerializer)
+from users.authentication import CachedJWTAuthentication
+from users.permissions import aget_owned_object
+
+# Асинхронные аналоги вьюх из lms.views для запуска под ASGI (uvicorn).
+# Все обращения к БД идут через асинхронный ORM, сериализаторы используются
+# только для проверки формы данных и вывода, без запросов к БД.
+
+
+def _json(data, status_code=status.HTTP_200_OK):
+    return JsonResponse(data, status=status_code, safe=False, encoder=JSONEncoder)
+
+
+def _empty(status_code):
+    return HttpResponse(status=status_code)
+
+
+def _authenticate(request):
+    # Как DEFAULT_AUTHENTICATION_CLASSES: сначала JWT, затем сессия
+    result = CachedJWTAuthentication().authenticate(request)
+    if result:
+        return result[0]
+    user = get_user(request)
+    if user.is_authenticated:
+        # CSRF нужен только сессии: клиенты с JWT куку не шлют
+        SessionAuthentication().enforce_csrf(request)
+    return user
+
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+    return request.POST
+
+
+class AsyncAPIView(View):
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Как APIView: CsrfViewMiddleware пропускает вьюху, CSRF проверяется в _authenticate.
+        # Атрибутом, а не csrf_exempt: в Django 4.2 декоратор оборачивает в синхронную функцию
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.user = await sync_to_async(_authenticate)(request)
+            if not request.user.is_authenticated:
+                # Как DRF для запросов без токена: без WWW-Authenticate отвечаем 403
+                return _json({'detail': NotAuthenticated.default_detail}, status.HTTP_403_FORBIDDEN)
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            response = _json({'detail': exc.detail}, exc.status_code)
+            if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+                response['WWW-Authenticate'] = CachedJWTAuthentication().authenticate_header(request)
+            return response
+        except Http404:
+            return _json({'detail': 'Not found.'}, status.HTTP_404_NOT_FOUND)
+
+    @staticmethod
+    async def get_object(queryset, **lookup):
+        try:
+            return await queryset.aget(**lookup)
+        except queryset.model.DoesNotExist:
+            raise Http404
+
+
+class AsyncCourseListView(AsyncAPIView):
+    async def get(self, request):
+        paginator = CoursePagination()
+        courses = Course.objects.filter(owner_id=request.user.id)
+        page = await paginator.apaginate_queryset(courses, Request(request))
+        return _json(paginator.get_paginated_data(CourseSerializer(page, many=True).data))
+
+    async def post(self, request):
+        serializer = CourseWriteSerializer(data=_request_data(request))
+        if not serializer.is_valid():
+            return _json(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        course = await Course.objects.acreate(owner_id=request.user.id, **serializer.validated_data)
+        return _json(CourseSerializer(course).data, status.HTTP_201_CREATED)
+
+
+class AsyncCourseDetailView(AsyncAPIView):
+    async def get(self, request, pk):
+        course = await self.get_object(Course.objects, pk=pk, owner_id=request.user.id)
+        return _json(CourseSerializer(course).data)
+
+    async def put(self, request, pk, partial=False):
+        course = await self.get_object(Course.objects, pk=pk, owner_id=request.user.id)
+        serializer = CourseWriteSerializer(course, data=_request_data(request), partial=partial)
+        if not serializer.is_valid():
+            return _json(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        for field, value in serializer.validated_data.items():
+            setattr(course, field, value)
+        await course.asave()
+        return _json(CourseSerializer(course).data)
+
+    async def patch(self, request, pk):
+        return await self.put(request, pk, partial=True)
+
+    async def delete(self, request, pk):
+        course = await self.get_object(Course.objects, pk=pk, owner_id=request.user.id)
+        await course.adelete()
+        return _empty(status.HTTP_204_NO_CONTENT)
+
+
+class AsyncLessonListCreateView(AsyncAPIView):
+    async def get(self, request):
+        paginator = LessonPagination()
+        lessons = Lesson.objects.filter(owner_id=request.user.id)
+        page = await paginator.apaginate_queryset(lessons, Request(request))
+        return _json(paginator.get_paginated_data(LessonSerializer(page, many=True).data))
+
+    async def post(self, request):
+        serializer = LessonWriteSerializer(data=_request_data(request))
+        if not serializer.is_valid():
+            return _json(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        data = dict(serializer.validated_data)
+        course_id = data.pop('course')
+        if not await Course.objects.filter(pk=course_id).aexists():
+            return _json({'course': [f'Курс {course_id} не существует.']}, status.HTTP_400_BAD_REQUEST)
+        lesson = await Lesson.objects.acreate(owner_id=request.user.id, course_id=course_id, **data)
+        return _json(LessonSerializer(lesson).data, status.HTTP_201_CREATED)
+
+
+class AsyncLessonDetailView(AsyncAPIView):
+    @staticmethod
+    async def get_lesson(request, pk, fields=LESSON_READ_FIELDS):
+        return await aget_owned_object(Lesson.objects.only(*fields), request.user, pk=pk)
+
+    async def get(self, request, pk):
+        lesson = await self.get_lesson(request, pk)
+        return _json(LessonSerializer(lesson).data)
+
+    async def put(self, request, pk):
+        lesson = await self.get_lesson(request, pk, LESSON_WRITE_FIELDS)
+        serializer = LessonWriteSerializer(lesson, data=_request_data(request), partial=True)
+        if not serializer.is_valid():
+            return _json(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        for field, value in serializer.validated_data.items():
+            if field != 'course':
+                setattr(lesson, field, value)
+        await lesson.asave()
+        return _json(LessonSerializer(lesson).data)
+
+    async def delete(self, request, pk):
+        lesson = await self.get_lesson(request, pk, LESSON_DELETE_FIELDS)
+        await lesson.adelete()
+        return _empty(status.HTTP_204_NO_CONTENT)
+
+
+class AsyncSubscriptionView(AsyncAPIView):
+    async def post(self, request):
+        course_id = _request_data(request).get('course')
+        try:
+            course_id = int(course_id)
+        except (TypeError, ValueError):
+            return _json({'course': ['Обязательное поле.']}, status.HTTP_400_BAD_REQUEST)
+        if not await Course.objects.filter(pk=course_id).aexists():
+            return _json({'course': [f'Курс {course_id} не существует.']}, status.HTTP_400_BAD_REQUEST)
+        subscription, created = await Subscription.objects.aget_or_create(user_id=request.user.id, course_id=course_id)
+        if not created:
+            return _json({'non_field_errors': ['Вы уже подписаны на этот курс.']}, status.HTTP_400_BAD_REQUEST)
+        return _json(SubscriptionSerializer(subscription).data, status.HTTP_201_CREATED)
+
+    async def delete(self, request, course_id):
+        # Удаление экземпляра, а не QuerySet: счётчик курса и лента обновляются в lms.signals
+        subscription = await Subscription.objects.filter(user_id=request.user.id, course_id=course_id).afirst()
+        if subscription is None:
+            raise Http404
+        await subscription.adelete()
+        return _empty(status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,97 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+from lms.routers import primary_reads
+
+# Счётчики попаданий/промахов общие для всех процессов: доля попаданий видна в /api/_metrics/
+CACHE_STATS = ('hits', 'misses')
+
+
+def _stats_key(name):
+    return f'lms:response-cache-stats:{name}'
+
+
+def _count(name):
+    key = _stats_key(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Первый запрос или ключ очищен
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def _version_key(owner_id):
+    return f'lms:owner-version:{owner_id}'
+
+
+def _new_version():
+    # Версия от времени, а не с 1: если ключ версии вытеснен, старые ответы не оживут
+    return int(time.time() * 1000)
+
+
+def get_owner_version(owner_id):
+    key = _version_key(owner_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), settings.LMS_OWNER_VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def bump_owner_version(owner_id):
+    key = _version_key(owner_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), settings.LMS_OWNER_VERSION_TIMEOUT)
+
+
+def invalidate_owner(owner_id):
+    if owner_id is None:
+        return
+    bump_owner_version(owner_id)
+    # Повторно после коммита: чтение, успевшее закэшировать старые данные до коммита, станет невидимым
+    transaction.on_commit(lambda: bump_owner_version(owner_id))
+
+
+def response_key(owner_id, namespace, url):
+    digest = hashlib.md5(url.encode()).hexdigest()
+    return f'lms:response:{owner_id}:{get_owner_version(owner_id)}:{namespace}:{digest}'
+
+
+def cached_response(namespace):
+    """Read-through кэш GET-ответа в пространстве ключей текущего пользователя."""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            key = response_key(request.user.pk, namespace, request.build_absolute_uri())
+            data = cache.get(key)
+            if data is not None:
+                _count('hits')
+                return Response(data)
+            _count('misses')
+            # Ответ живёт в кэше дольше лага реплики — заполняем его из default
+            with primary_reads():
+                response = method(view, request, *args, **kwargs)
+            if isinstance(response, Response) and response.status_code == 200:
+                cache.set(key, response.data, settings.LMS_RESPONSE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
+
+
+def get_cache_stats():
+    raw = cache.get_many([_stats_key(name) for name in CACHE_STATS])
+    hits, misses = (raw.get(_stats_key(name), 0) for name in CACHE_STATS)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': round(hits / total, 3) if total else 0.0}
+
+
+def reset_cache_stats():
+    cache.delete_many([_stats_key(name) for name in CACHE_STATS])
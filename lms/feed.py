@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.db import connection
+from lms.models import FeedItem, Lesson, Subscription
+
+# Лента «моё обучение» (lms.models.FeedItem) поддерживается инкрементально:
+# - подписка добавляет в ленту последние FEED_BACKFILL_LESSONS уроков курса, отписка их убирает;
+# - новый урок раскладывается по лентам подписчиков задачей lms.tasks.fanout_lesson_to_feeds;
+# - удаление урока или курса чистит ленты каскадом по внешним ключам;
+# - записи отписок мимо Subscription.delete() (QuerySet.delete(), админка) убирает reconcile_course_counters.
+# Повторная доставка безопасна: пара (user, lesson) уникальна, вставки идут с ON CONFLICT DO NOTHING.
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def add_courses_to_feeds(pairs, lessons_per_course=None):
+    """Добавляет в ленты пар (user_id, course_id) последние уроки курсов одним INSERT ... SELECT."""
+    if not pairs:
+        return 0
+    user_ids = [user_id for user_id, _ in pairs]
+    course_ids = [course_id for _, course_id in pairs]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {_table(FeedItem)} (user_id, lesson_id, course_id, created_at) '
+            f'SELECT pair.user_id, lesson.id, lesson.course_id, lesson.created_at '
+            f'FROM unnest(%s::bigint[], %s::bigint[]) AS pair (user_id, course_id) '
+            f'CROSS JOIN LATERAL ('
+            f'SELECT id, course_id, created_at FROM {_table(Lesson)} WHERE course_id = pair.course_id '
+            f'ORDER BY created_at DESC, id DESC LIMIT %s'
+            f') AS lesson '
+            f'ON CONFLICT (user_id, lesson_id) DO NOTHING',
+            [user_ids, course_ids, lessons_per_course or settings.FEED_BACKFILL_LESSONS],
+        )
+        return cursor.rowcount
+
+
+def remove_courses_from_feeds(pairs):
+    """Убирает из лент пар (user_id, course_id) уроки этих курсов."""
+    if not pairs:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {_table(FeedItem)} AS item '
+            f'USING unnest(%s::bigint[], %s::bigint[]) AS pair (user_id, course_id) '
+            f'WHERE item.user_id = pair.user_id AND item.course_id = pair.course_id',
+            [[user_id for user_id, _ in pairs], [course_id for _, course_id in pairs]],
+        )
+        return cursor.rowcount
+
+
+def fanout_lesson(lesson_id, batch_size=None):
+    """Раскладывает урок по лентам подписчиков его курса пачками по id подписки; возвращает число подписчиков."""
+    lesson = Lesson.objects.filter(pk=lesson_id).only('id', 'course_id', 'created_at').first()
+    if lesson is None:
+        return 0
+    batch_size = batch_size or settings.FEED_FANOUT_BATCH_SIZE
+    delivered = 0
+    last_id = 0
+    while True:
+        batch = list(
+            Subscription.objects.filter(course_id=lesson.course_id, id__gt=last_id)
+            .order_by('id').values_list('id', 'user_id')[:batch_size]
+        )
+        if not batch:
+            break
+        FeedItem.objects.bulk_create([
+            FeedItem(user_id=user_id, lesson_id=lesson.id, course_id=lesson.course_id, created_at=lesson.created_at)
+            for _, user_id in batch
+        ], ignore_conflicts=True)
+        delivered += len(batch)
+        last_id = batch[-1][0]
+    return delivered
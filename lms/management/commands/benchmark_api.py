@@ -0,0 +1,307 @@
+import json
+import random
+import subprocess
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.utils import timezone
+from lms.models import Course, Lesson, Subscription
+from lms.tasks import reconcile_course_counters
+from users.models import Payment, User
+from users.tasks import compact_payment_rollups
+
+BENCH_PREFIX = 'bench_'
+BENCH_PASSWORD = 'Bench_Python2025'
+
+# Сценарий нагрузки: эндпоинт и его вес в смеси запросов
+SCENARIO = (
+    ('course-list', 4),
+    ('course-detail', 4),
+    ('lesson-list', 4),
+    ('lesson-detail', 6),
+    ('subscription-toggle', 2),
+    ('payment-list', 1),
+)
+
+
+def _percentile(sorted_values, quantile):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(quantile * len(sorted_values)) - 1))
+    return round(sorted_values[index], 3)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _client_host():
+    host = next((host for host in settings.ALLOWED_HOSTS if host and host != '*'), 'localhost')
+    return host.lstrip('.')
+
+
+def _query_counter(counter):
+    def count(execute, sql, params, many, context):
+        counter[0] += 1
+        return execute(sql, params, many, context)
+    return count
+
+
+def _in_transaction():
+    # Прогон из тестов идёт внутри транзакции — закрывать соединение тогда нельзя
+    return any(conn.in_atomic_block for conn in connections.all(initialized_only=True))
+
+
+def _request_boundary():
+    # Тестовый клиент не вызывает close_old_connections на границах запроса — делаем это сами, как WSGI-хендлер
+    if not _in_transaction():
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон API: заполняет базу синтетическими данными (пользователи с префиксом bench_) '
+        'и гоняет конкурентных клиентов по эндпоинтам курсов, уроков, подписок и платежей. '
+        'Отчёт: p50/p95/p99, запросов в секунду, SQL-запросов на запрос и открытых соединений с БД. '
+        'Границы запросов отрабатываются как под WSGI-сервером: при CONN_MAX_AGE=0 каждый запрос открывает '
+        'новое соединение, сравнение с --conn-max-age 600 показывает цену установки соединения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--courses', type=int, default=100)
+        parser.add_argument('--lessons', type=int, default=1000)
+        parser.add_argument('--subscriptions', type=int, default=500)
+        parser.add_argument('--payments', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=8, help='Число параллельных клиентов')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на одного клиента')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--conn-max-age', type=int, help='CONN_MAX_AGE на время прогона (по умолчанию из настроек)')
+        parser.add_argument('--reseed', action='store_true', help='Удалить прежние bench-данные и заполнить заново')
+        parser.add_argument('--cleanup', action='store_true', help='Удалить bench-данные после прогона')
+        parser.add_argument('--output', help='Записать JSON-отчёт в файл')
+        parser.add_argument('--json', action='store_true', help='Вывести JSON-отчёт в stdout')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency и --requests должны быть положительными')
+        if options['users'] < 1 or options['courses'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь и один курс')
+
+        if options['reseed']:
+            self.cleanup()
+        if not User.objects.filter(username__startswith=BENCH_PREFIX).exists():
+            self.seed(options)
+        fixtures = self.load_fixtures()
+        conn_max_age = {alias: connections[alias].settings_dict['CONN_MAX_AGE'] for alias in connections}
+        if options['conn_max_age'] is not None:
+            for alias in connections:
+                connections[alias].settings_dict['CONN_MAX_AGE'] = options['conn_max_age']
+            # Срок жизни соединения считается при подключении — переподключаемся с новым CONN_MAX_AGE
+            if not _in_transaction():
+                connections.close_all()
+        effective_conn_max_age = connection.settings_dict['CONN_MAX_AGE']
+
+        opened = []
+
+        def count_connection(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        connection_created.connect(count_connection)
+        started = time.perf_counter()
+        try:
+            if options['concurrency'] == 1:
+                samples = [self.run_client(0, fixtures, options)]
+            else:
+                with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                    samples = list(executor.map(
+                        lambda number: self.run_client(number, fixtures, options), range(options['concurrency'])
+                    ))
+        finally:
+            connection_created.disconnect(count_connection)
+            for alias, value in conn_max_age.items():
+                connections[alias].settings_dict['CONN_MAX_AGE'] = value
+        elapsed = time.perf_counter() - started
+
+        report = self.build_report(samples, elapsed, options)
+        report['conn_max_age'] = effective_conn_max_age
+        report['db_connections_opened'] = len(opened)
+        if options['cleanup']:
+            self.cleanup()
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report)
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        password = make_password(BENCH_PASSWORD)
+        users = User.objects.bulk_create([
+            User(username=f'{BENCH_PREFIX}{i}', email=f'{BENCH_PREFIX}{i}@example.com', password=password)
+            for i in range(options['users'])
+        ], batch_size=1000)
+        courses = Course.objects.bulk_create([
+            Course(title=f'Bench course {i}', description='Benchmark course', owner=users[i % len(users)])
+            for i in range(options['courses'])
+        ], batch_size=1000)
+        lessons = Lesson.objects.bulk_create([
+            Lesson(
+                title=f'Bench lesson {i}',
+                description='Benchmark lesson',
+                course=courses[i % len(courses)],
+                owner_id=courses[i % len(courses)].owner_id,
+                video_link=f'https://www.youtube.com/watch?v=bench{i:05d}',
+            )
+            for i in range(options['lessons'])
+        ], batch_size=1000)
+        Subscription.objects.bulk_create([
+            Subscription(user=users[k % len(users)], course=courses[(k // len(users)) % len(courses)])
+            for k in range(min(options['subscriptions'], len(users) * len(courses)))
+        ], batch_size=1000, ignore_conflicts=True)
+        methods = list(Payment.PaymentMethod.values)
+        payments = []
+        for _ in range(options['payments']):
+            lesson = rng.choice(lessons) if rng.random() < 0.5 else None
+            payments.append(Payment(
+                user=rng.choice(users),
+                course=None if lesson else rng.choice(courses),
+                lesson=lesson,
+                amount=Decimal(rng.randint(100, 10000)),
+                payment_method=rng.choice(methods),
+            ))
+        Payment.objects.bulk_create(payments, batch_size=1000)
+        # bulk_create не шлёт сигналы — счётчики курсов и сводки платежей пересчитываем разом
+        reconcile_course_counters()
+        compact_payment_rollups(backfill=True, date_to=timezone.localdate().isoformat())
+
+    @staticmethod
+    def cleanup():
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+    @staticmethod
+    def load_fixtures():
+        users = list(User.objects.filter(username__startswith=BENCH_PREFIX).order_by('id'))
+        courses, lessons = defaultdict(list), defaultdict(list)
+        for course_id, owner_id in Course.objects.filter(owner__in=users).values_list('id', 'owner_id'):
+            courses[owner_id].append(course_id)
+        for lesson_id, owner_id in Lesson.objects.filter(owner__in=users).values_list('id', 'owner_id'):
+            lessons[owner_id].append(lesson_id)
+        all_courses = [course_id for ids in courses.values() for course_id in ids]
+        return {'users': users, 'courses': courses, 'lessons': lessons, 'all_courses': all_courses}
+
+    def run_client(self, number, fixtures, options):
+        rng = random.Random(options['seed'] + number)
+        user = fixtures['users'][number % len(fixtures['users'])]
+        # Исключения вьюх считаем ответами 500, а не прерываем прогон
+        client = Client(raise_request_exception=False, HTTP_HOST=_client_host())
+        client.force_login(user)
+        names, weights = zip(*SCENARIO)
+        samples = []
+        try:
+            for _ in range(options['requests']):
+                name = rng.choices(names, weights)[0]
+                samples.extend(self.request(client, name, user, fixtures, rng))
+        finally:
+            if number:
+                connection.close()
+        return samples
+
+    @staticmethod
+    def request(client, name, user, fixtures, rng):
+        if name == 'course-detail' and fixtures['courses'][user.id]:
+            calls = [(name, 'get', f"/api/courses/{rng.choice(fixtures['courses'][user.id])}/", None)]
+        elif name == 'lesson-detail' and fixtures['lessons'][user.id]:
+            calls = [(name, 'get', f"/api/lessons/{rng.choice(fixtures['lessons'][user.id])}/", None)]
+        elif name == 'subscription-toggle' and fixtures['all_courses']:
+            course_id = rng.choice(fixtures['all_courses'])
+            calls = [
+                ('subscription-create', 'post', '/api/subscriptions/', {'course': course_id}),
+                ('subscription-delete', 'delete', f'/api/subscriptions/{course_id}/', None),
+            ]
+        elif name == 'course-list':
+            calls = [(name, 'get', '/api/courses/', None)]
+        elif name == 'lesson-list':
+            calls = [(name, 'get', '/api/lessons/', None)]
+        elif name == 'payment-list':
+            calls = [(name, 'get', '/api/payments/', None)]
+        else:
+            return []
+
+        samples = []
+        for endpoint, method, url, data in calls:
+            queries = [0]
+            started = time.perf_counter()
+            _request_boundary()
+            # Запросы считаем сами: заголовок X-Query-Count отдаётся только при DEBUG и персоналу
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(_query_counter(queries)))
+                response = getattr(client, method)(url, data) if data else getattr(client, method)(url)
+            _request_boundary()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            samples.append((endpoint, elapsed_ms, response.status_code, queries[0]))
+        return samples
+
+    @staticmethod
+    def build_report(samples, elapsed, options):
+        by_endpoint = defaultdict(list)
+        for client_samples in samples:
+            for endpoint, elapsed_ms, status_code, queries in client_samples:
+                by_endpoint[endpoint].append((elapsed_ms, status_code, queries))
+
+        def summarize(rows):
+            latencies = sorted(row[0] for row in rows)
+            queries = [row[2] for row in rows if row[2] is not None]
+            return {
+                'requests': len(rows),
+                'errors': sum(1 for row in rows if row[1] >= 500),
+                'rps': round(len(rows) / elapsed, 1) if elapsed else None,
+                'p50_ms': _percentile(latencies, 0.50),
+                'p95_ms': _percentile(latencies, 0.95),
+                'p99_ms': _percentile(latencies, 0.99),
+                'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+            }
+
+        return {
+            'git_commit': _git_commit(),
+            'database': connection.vendor,
+            'conn_health_checks': connection.settings_dict['CONN_HEALTH_CHECKS'],
+            'config': {
+                key: options[key]
+                for key in ('users', 'courses', 'lessons', 'subscriptions', 'payments', 'concurrency', 'requests', 'seed')
+            },
+            'elapsed_seconds': round(elapsed, 3),
+            'total': summarize([row for rows in by_endpoint.values() for row in rows]),
+            'endpoints': {endpoint: summarize(rows) for endpoint, rows in sorted(by_endpoint.items())},
+        }
+
+    def print_report(self, report):
+        self.stdout.write(f"commit {report['git_commit']}  {report['elapsed_seconds']}s")
+        self.stdout.write(
+            f"CONN_MAX_AGE={report['conn_max_age']}  CONN_HEALTH_CHECKS={report['conn_health_checks']}  "
+            f"db connections opened: {report['db_connections_opened']}"
+        )
+        self.stdout.write(f'{"endpoint":<22}{"reqs":>7}{"err":>5}{"rps":>9}{"p50":>9}{"p95":>9}{"p99":>9}{"queries":>9}')
+        for name, row in [*report['endpoints'].items(), ('TOTAL', report['total'])]:
+            self.stdout.write(
+                f'{name:<22}{row["requests"]:>7}{row["errors"]:>5}{str(row["rps"]):>9}{str(row["p50_ms"]):>9}'
+                f'{str(row["p95_ms"]):>9}{str(row["p99_ms"]):>9}{str(row["queries_per_request"]):>9}'
+            )
@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand
+from lms.cache import get_cache_stats, reset_cache_stats
+from lms.profiling import load_metrics, reset_metrics
+from lms.tasks import get_notification_stats
+
+
+class Command(BaseCommand):
+    help = 'Число SQL-запросов и задержки по эндпоинтам, собранные ProfilingMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Вывести сырой JSON')
+        parser.add_argument('--reset', action='store_true', help='Обнулить накопленные метрики')
+        parser.add_argument('--notifications', action='store_true',
+                            help='Счётчики дебаунса рассылок об обновлении курсов')
+        parser.add_argument('--cache', action='store_true', help='Попадания и промахи кэша ответов')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            reset_metrics()
+            reset_cache_stats()
+            self.stdout.write(self.style.SUCCESS('Метрики обнулены'))
+            return
+
+        if options['notifications']:
+            self.stdout.write(json.dumps(get_notification_stats(), indent=2))
+            return
+
+        if options['cache']:
+            self.stdout.write(json.dumps(get_cache_stats(), indent=2))
+            return
+
+        report = load_metrics()
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        header = f'{"endpoint":<28}{"requests":>10}{"queries":>9}{"db ms":>9}{"ser ms":>9}{"avg ms":>9}{"p95 ms":>9}'
+        self.stdout.write(header)
+        for name, row in sorted(report.items(), key=lambda item: -item[1]['avg_queries']):
+            self.stdout.write(
+                f'{name:<28}{row["requests"]:>10}{row["avg_queries"]:>9}{row["avg_db_ms"]:>9}'
+                f'{row["avg_serializer_ms"]:>9}{row["avg_total_ms"]:>9}{str(row["p95_ms"] or ">max"):>9}'
+            )
@@ -0,0 +1,84 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from lms.models import Course, Lesson, Subscription
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN ANALYZE горячих запросов с индексами и без них. '
+        'Индексы удаляются внутри транзакции, которая затем откатывается; '
+        'DROP INDEX берёт эксклюзивную блокировку, поэтому запускать на копии базы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', type=int, help='id владельца курсов и уроков (по умолчанию владелец первого курса)')
+        parser.add_argument('--course', type=int, help='id курса для выборки подписчиков (по умолчанию первый курс)')
+        parser.add_argument('--page-size', type=int, default=10)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('EXPLAIN ANALYZE поддерживается только для PostgreSQL')
+
+        first_course = Course.objects.order_by('id').values('id', 'owner_id').first()
+        owner_id = options['owner'] or (first_course or {}).get('owner_id')
+        course_id = options['course'] or (first_course or {}).get('id')
+        if owner_id is None or course_id is None:
+            raise CommandError('Нет данных: создайте курсы или передайте --owner и --course')
+
+        queries = self.get_queries(owner_id, course_id, options['page_size'])
+        after = {name: queryset.explain(analyze=True) for name, queryset, _ in queries}
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for _, _, indexes in queries:
+                    for index in indexes:
+                        cursor.execute(f'DROP INDEX IF EXISTS {connection.ops.quote_name(index)}')
+            before = {name: queryset.explain(analyze=True) for name, queryset, _ in queries}
+            transaction.set_rollback(True)
+
+        for name, _, indexes in queries:
+            changed = self.plan_shape(before[name]) != self.plan_shape(after[name])
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {name} ({", ".join(indexes)})'))
+            self.stdout.write('-- без индексов:')
+            self.stdout.write(before[name])
+            self.stdout.write('-- с индексами:')
+            self.stdout.write(after[name])
+            if changed:
+                self.stdout.write(self.style.SUCCESS('План изменился'))
+            else:
+                self.stdout.write(self.style.WARNING('План не изменился (мало данных или статистика устарела?)'))
+
+    @staticmethod
+    def get_queries(owner_id, course_id, page_size):
+        threshold = timezone.now() - timedelta(days=30)
+        return [
+            (
+                'course-list',
+                Course.objects.filter(owner_id=owner_id).order_by('-created_at', '-id')[:page_size],
+                ['course_owner_created_idx'],
+            ),
+            (
+                'lesson-list',
+                Lesson.objects.filter(owner_id=owner_id).order_by('-created_at', '-id')[:page_size],
+                ['lesson_owner_created_idx'],
+            ),
+            (
+                'course-subscribers',
+                Subscription.objects.filter(course_id=course_id).values_list('user_id', flat=True),
+                ['subscription_course_user_idx'],
+            ),
+            (
+                'inactive-users',
+                User.objects.filter(last_login__lt=threshold, is_active=True).values_list('id', flat=True),
+                ['user_active_last_login_idx'],
+            ),
+        ]
+
+    @staticmethod
+    def plan_shape(plan):
+        # Узлы плана без стоимости и времени: сравниваем только структуру
+        lines = plan.splitlines()
+        return [line.split('(')[0].strip() for line in lines[:1] + [line for line in lines if '->' in line]]
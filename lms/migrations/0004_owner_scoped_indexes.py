@@ -0,0 +1,28 @@
+# Generated by Django 4.2.21 on 2026-10-18 10:38
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не блокирует запись в большие таблицы
+    atomic = False
+
+    dependencies = [
+        ('lms', '0003_remove_course_price_remove_lesson_video_url_and_more'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='course',
+            index=models.Index(fields=['owner', 'created_at', 'id'], name='course_owner_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='lesson',
+            index=models.Index(fields=['owner', 'created_at', 'id'], name='lesson_owner_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='subscription',
+            index=models.Index(fields=['course', 'user'], name='subscription_course_user_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.21 on 2026-10-18 10:52
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 1000
+
+
+def backfill_counters(apps, schema_editor):
+    Course = apps.get_model('lms', 'Course')
+    Lesson = apps.get_model('lms', 'Lesson')
+    Subscription = apps.get_model('lms', 'Subscription')
+
+    def count_per_course(model):
+        counts = model.objects.filter(course=OuterRef('pk')).order_by().values('course').annotate(n=Count('pk'))
+        return Coalesce(Subquery(counts.values('n')), 0)
+
+    last_id = 0
+    while True:
+        ids = list(Course.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:BATCH_SIZE])
+        if not ids:
+            break
+        Course.objects.filter(id__in=ids).update(
+            lessons_count=count_per_course(Lesson),
+            subscribers_count=count_per_course(Subscription),
+        )
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0004_owner_scoped_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='lessons_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='subscribers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
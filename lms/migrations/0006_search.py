@@ -0,0 +1,83 @@
+# Generated by Django 4.2.21 on 2026-10-18 12:10
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+from django.db.models import F, Func
+
+BATCH_SIZE = 1000
+
+# Вектор считается в БД: курс или урок, изменённый в обход ORM (bulk_update, raw SQL), не выпадет из поиска.
+# Заголовок весит больше описания; русская и английская морфология, т.к. контент смешанный.
+SEARCH_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION lms_search_vector(title text, description text) RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('russian'::regconfig, coalesce(title, '')), 'A')
+        || setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A')
+        || setweight(to_tsvector('russian'::regconfig, coalesce(description, '')), 'B')
+        || setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'B')
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION lms_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := lms_search_vector(NEW.title, NEW.description);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+TRIGGER_SQL = """
+CREATE TRIGGER {table}_search_vector_update
+    BEFORE INSERT OR UPDATE OF title, description ON {table}
+    FOR EACH ROW EXECUTE FUNCTION lms_search_vector_trigger();
+"""
+
+DROP_TRIGGER_SQL = 'DROP TRIGGER IF EXISTS {table}_search_vector_update ON {table};'
+
+DROP_FUNCTION_SQL = """
+DROP FUNCTION IF EXISTS lms_search_vector_trigger();
+DROP FUNCTION IF EXISTS lms_search_vector(text, text);
+"""
+
+
+def backfill_search_vectors(apps, schema_editor):
+    for model_name in ('Course', 'Lesson'):
+        model = apps.get_model('lms', model_name)
+        last_id = 0
+        while True:
+            ids = list(model.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:BATCH_SIZE])
+            if not ids:
+                break
+            model.objects.filter(id__in=ids).update(
+                search_vector=Func(F('title'), F('description'), function='lms_search_vector')
+            )
+            last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+    # Бэкфилл порциями без общей транзакции: каждая порция коммитится и не держит блокировки до конца
+    atomic = False
+
+    dependencies = [
+        ('lms', '0005_course_counters'),
+    ]
+
+    operations = [
+        # CREATE EXTENSION требует прав суперпользователя (или trusted-расширения в PG 13+)
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='course',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(SEARCH_FUNCTION_SQL, DROP_FUNCTION_SQL),
+        migrations.RunSQL(
+            TRIGGER_SQL.format(table='lms_course') + TRIGGER_SQL.format(table='lms_lesson'),
+            DROP_TRIGGER_SQL.format(table='lms_course') + DROP_TRIGGER_SQL.format(table='lms_lesson'),
+        ),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.21 on 2026-10-18 12:12
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('lms', '0006_search'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='course',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='course_search_vector_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='course',
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=['title'], name='course_title_trgm_idx', opclasses=['gin_trgm_ops']
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='lesson',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='lesson_search_vector_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='lesson',
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=['title'], name='lesson_title_trgm_idx', opclasses=['gin_trgm_ops']
+            ),
+        ),
+    ]
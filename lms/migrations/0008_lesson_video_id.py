@@ -0,0 +1,50 @@
+# Generated by Django 4.2.21 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+from lms.validators import youtube_video_id
+
+BATCH_SIZE = 1000
+
+
+def backfill_video_ids(apps, schema_editor):
+    Lesson = apps.get_model('lms', 'Lesson')
+    last_id = 0
+    while True:
+        lessons = list(
+            Lesson.objects.filter(id__gt=last_id, video_link__isnull=False)
+            .order_by('id').only('id', 'video_link')[:BATCH_SIZE]
+        )
+        if not lessons:
+            break
+        changed = []
+        for lesson in lessons:
+            lesson.video_id = youtube_video_id(lesson.video_link)
+            if lesson.video_id:
+                changed.append(lesson)
+        Lesson.objects.bulk_update(changed, ['video_id'])
+        last_id = lessons[-1].id
+
+
+class Migration(migrations.Migration):
+    # Бэкфилл порциями без общей транзакции, как в 0006_search
+    atomic = False
+
+    dependencies = [
+        ('lms', '0007_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='video_id',
+            field=models.CharField(blank=True, editable=False, max_length=11, null=True),
+        ),
+        # URLField и так проверяет URLValidator'ом, явный валидатор запускал его второй раз
+        migrations.AlterField(
+            model_name='lesson',
+            name='video_link',
+            field=models.URLField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_video_ids, migrations.RunPython.noop),
+    ]
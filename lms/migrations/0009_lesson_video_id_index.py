@@ -0,0 +1,21 @@
+# Generated by Django 4.2.21 on 2026-10-18 13:06
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('lms', '0008_lesson_video_id'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='lesson',
+            index=models.Index(
+                condition=models.Q(video_id__isnull=False), fields=['video_id'], name='lesson_video_id_idx'
+            ),
+        ),
+    ]
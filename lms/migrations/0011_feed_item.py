@@ -0,0 +1,65 @@
+# Generated by Django 4.2.21 on 2026-10-18 14:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+BACKFILL_LESSONS = 20
+
+# Как lms.feed.add_courses_to_feeds, но для пачки подписок по id
+BACKFILL_SQL = '''
+INSERT INTO lms_feeditem (user_id, lesson_id, course_id, created_at)
+SELECT subscription.user_id, lesson.id, lesson.course_id, lesson.created_at
+FROM lms_subscription AS subscription
+CROSS JOIN LATERAL (
+    SELECT id, course_id, created_at FROM lms_lesson WHERE course_id = subscription.course_id
+    ORDER BY created_at DESC, id DESC LIMIT %s
+) AS lesson
+WHERE subscription.id = ANY(%s)
+ON CONFLICT (user_id, lesson_id) DO NOTHING
+'''
+
+
+def backfill_feeds(apps, schema_editor):
+    Subscription = apps.get_model('lms', 'Subscription')
+    last_id = 0
+    while True:
+        ids = list(
+            Subscription.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:BATCH_SIZE]
+        )
+        if not ids:
+            break
+        schema_editor.execute(BACKFILL_SQL, [BACKFILL_LESSONS, ids])
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+    # Бэкфилл порциями без общей транзакции, как в 0006_search
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('lms', '0010_outbox_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='lms.course')),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='lms.lesson')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at', 'id'], name='feed_item_user_created_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='feeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'lesson'), name='feed_item_user_lesson_key'),
+        ),
+        migrations.RunPython(backfill_feeds, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,61 @@
-from django.db import models
-from django.core.validators import URLValidator
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.dispatch import Signal
+from lms.validators import youtube_video_id
 from users.models import User
 from django.utils import timezone
 
+
+# Шлются из delete() экземпляра вместо post_delete: приёмник post_delete отключил бы быстрое каскадное
+# удаление, и удаление курса или пользователя грузило бы и обрабатывало каждый урок и подписку по строке.
+# Каскады обрабатываются в lms.signals одним сгруппированным запросом
+lesson_deleted = Signal()
+subscription_deleted = Signal()
+
+
+class SearchableManager(models.Manager):
+    # tsvector нужен только поиску, обычные выборки его не читают
+    def get_queryset(self):
+        return super().get_queryset().defer('search_vector')
+
+
 class Course(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField(default="", null=False)  # Добавляем default и null=False
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='courses')
     created_at = models.DateTimeField(default=timezone.now)  # Временно nullable
     updated_at = models.DateTimeField(auto_now=True)
+    # Денормализованные счётчики, поддерживаются lms.services.adjust_course_counters
+    lessons_count = models.PositiveIntegerField(default=0)
+    subscribers_count = models.PositiveIntegerField(default=0)
+    # Заполняется триггером БД из title и description (ru + en), см. миграцию 0006_search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = SearchableManager()
+
+    class Meta:
+        indexes = [
+            # Список курсов владельца с keyset-пагинацией по (created_at, id)
+            models.Index(fields=['owner', 'created_at', 'id'], name='course_owner_created_idx'),
+            GinIndex(fields=['search_vector'], name='course_search_vector_idx'),
+            # Нечёткий поиск по названию при опечатках (pg_trgm)
+            GinIndex(fields=['title'], name='course_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
+
+    COUNTER_FIELDS = ('lessons_count', 'subscribers_count')
+
+    def save(self, *args, **kwargs):
+        # post_save пишет событие в OutboxEvent: изменение и событие коммитятся вместе
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # Счётчики меняются только атомарными UPDATE (adjust_course_counters, reconcile_course_counters):
+        # сохранение существующего курса не перезаписывает их значениями, прочитанными раньше. save() при
+        # этом не меняется: вставка (копия через pk = None, курс, удалённый параллельно) пишет их как обычно
+        values = [value for value in values if value[0].name not in self.COUNTER_FIELDS]
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
 
     def __str__(self):
         return self.title
@@ -18,9 +65,38 @@ class Lesson(models.Model):
     description = models.TextField()
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='lessons')
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='lessons')
-    video_link = models.URLField(validators=[URLValidator()], blank=True, null=True)
+    video_link = models.URLField(blank=True, null=True)
+    # Канонический id ролика YouTube из video_link: одно и то же видео по разным ссылкам ищется по индексу
+    video_id = models.CharField(max_length=11, blank=True, null=True, editable=False)
     created_at = models.DateTimeField(default=timezone.now)  # Временно nullable
     updated_at = models.DateTimeField(auto_now=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = SearchableManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'created_at', 'id'], name='lesson_owner_created_idx'),
+            GinIndex(fields=['search_vector'], name='lesson_search_vector_idx'),
+            GinIndex(fields=['title'], name='lesson_title_trgm_idx', opclasses=['gin_trgm_ops']),
+            models.Index(fields=['video_id'], name='lesson_video_id_idx', condition=models.Q(video_id__isnull=False)),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Без загруженной ссылки (only()/defer()) id не трогаем, чтобы не дочитывать поле отдельным запросом
+        if 'video_link' not in self.get_deferred_fields():
+            self.video_id = youtube_video_id(self.video_link)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'video_link' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'video_id'}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            lesson_deleted.send(sender=Lesson, instance=self)
+        return result
 
     def __str__(self):
         return self.title
@@ -32,6 +108,55 @@ class Subscription(models.Model):
 
     class Meta:
         unique_together = ('user', 'course')
+        indexes = [
+            # Подписчики курса без обращения к таблице (index-only scan) для рассылок
+            models.Index(fields=['course', 'user'], name='subscription_course_user_idx'),
+        ]
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            subscription_deleted.send(sender=Subscription, instance=self)
+        return result
+
+    def __str__(self):
+        return f"{self.user.username} subscribed to {self.course.title}"
+
+
+class OutboxEvent(models.Model):
+    """
+    Транзакционный outbox: событие пишется в той же транзакции, что и изменение,
+    а в Celery его передаёт lms.tasks.relay_outbox. Доставка — хотя бы один раз.
+    """
+    COURSE_UPDATED = 'course.updated'
+    LESSON_CREATED = 'lesson.created'
+
+    topic = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.topic} {self.payload}"
+
+
+class FeedItem(models.Model):
+    """
+    Материализованная лента «моё обучение»: урок курса, на который подписан пользователь.
+    Заполняется инкрементально (см. lms.feed), чтение страницы — по индексу (user, created_at, id).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feed_items')
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='+')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+')
+    # Время создания урока: по нему лента упорядочена
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'lesson'], name='feed_item_user_lesson_key'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='feed_item_user_created_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} subscribed to {self.course.title}"
\ No newline at end of file
+        return f"{self.user_id}: {self.lesson_id}"
@@ -1,13 +1,175 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
 
+from django.conf import settings
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
 
-class CoursePagination(PageNumberPagination):
-    page_size = 5
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset-пагинация по (ordering_field, id): без COUNT(*) и OFFSET,
+    стоимость страницы не зависит от её номера.
+    Параметр ?stream=ndjson отдаёт всю выборку потоком NDJSON.
+    """
+    ordering_field = 'created_at'
+    page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
+    cursor_query_param = 'cursor'
+    stream_query_param = 'stream'
+    stream_chunk_size = 500
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size, queryset = self.prepare_page(queryset, request)
+        return self.finish_page(list(queryset[:page_size + 1]), page_size)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_size, queryset = self.prepare_page(queryset, request)
+        return self.finish_page([row async for row in queryset[:page_size + 1]], page_size)
+
+    def prepare_page(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        return page_size, self.filter_after(self.order(queryset), self.decode_cursor(request))
+
+    def finish_page(self, rows, page_size):
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.next_position = self.position(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def position(self, row):
+        return getattr(row, self.ordering_field), row.pk
+
+    def order(self, queryset):
+        return queryset.order_by(f'-{self.ordering_field}', '-id')
+
+    def filter_after(self, queryset, position):
+        if position is None:
+            return queryset
+        value, pk = position
+        return queryset.filter(
+            Q(**{f'{self.ordering_field}__lt': value}) | Q(**{self.ordering_field: value, 'id__lt': pk})
+        )
+
+    @staticmethod
+    def encode_value(value):
+        return value.isoformat()
+
+    @staticmethod
+    def decode_value(raw):
+        return parse_datetime(raw)
 
+    def encode_cursor(self, position):
+        value, pk = position
+        raw = f'{self.encode_value(value)}|{pk}'.encode()
+        return base64.urlsafe_b64encode(raw).decode()
 
-class LessonPagination(PageNumberPagination):
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = base64.urlsafe_b64decode(encoded.encode()).decode().split('|')
+            value = self.decode_value(value)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+    def is_streaming(self, request):
+        return request.query_params.get(self.stream_query_param) == 'ndjson'
+
+    def get_streaming_response(self, queryset, serializer_class, request):
+        position = self.decode_cursor(request)
+        response = StreamingHttpResponse(
+            self.iter_ndjson(self.order(queryset), serializer_class, position),
+            content_type='application/x-ndjson',
+        )
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def iter_ndjson(self, queryset, serializer_class, position=None):
+        # Читаем порциями по ключу, а не OFFSET'ом: память и время на порцию постоянны
+        while True:
+            rows = list(self.filter_after(queryset, position)[:self.stream_chunk_size])
+            for row in rows:
+                yield json.dumps(serializer_class(row).data, cls=JSONEncoder, ensure_ascii=False) + '\n'
+            if len(rows) < self.stream_chunk_size:
+                return
+            position = self.position(rows[-1])
+
+
+class CoursePagination(KeysetPagination):
+    page_size = 5
+
+
+class LessonPagination(KeysetPagination):
     page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+
+
+class FeedPagination(KeysetPagination):
+    page_size = settings.FEED_PAGE_SIZE
+    max_page_size = 50
+
+
+class SearchPagination(KeysetPagination):
+    # Порядок по релевантности: rank — аннотация запроса (ts_rank или similarity)
+    ordering_field = 'rank'
+    page_size = 20
+    max_page_size = 50
+
+    @staticmethod
+    def encode_value(value):
+        return repr(float(value))
+
+    @staticmethod
+    def decode_value(raw):
+        value = float(raw)
+        if value != value or value in (float('inf'), float('-inf')):
+            raise ValueError(raw)
+        return value
@@ -0,0 +1,230 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.urls import URLResolver, get_resolver
+
+# Верхние границы корзин гистограмм; последняя корзина — всё, что больше
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50)
+SUM_FIELDS = ('requests', 'queries', 'db_us', 'serializer_us', 'total_us')
+UNRESOLVED = '<unresolved>'
+
+_current = ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+
+def _bucket(value, bounds):
+    for index, bound in enumerate(bounds):
+        if value <= bound:
+            return index
+    return len(bounds)
+
+
+class MetricsRecorder:
+    """Агрегаты по эндпоинтам копятся в процессе и периодически сбрасываются в кэш через incr."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flushed_at = time.monotonic()
+
+    def record(self, view_name, profile, total_time):
+        total_ms = total_time * 1000
+        with self._lock:
+            counters = self._pending.setdefault(view_name, {})
+            values = {
+                'requests': 1,
+                'queries': profile.queries,
+                'db_us': int(profile.db_time * 1_000_000),
+                'serializer_us': int(profile.serializer_time * 1_000_000),
+                'total_us': int(total_time * 1_000_000),
+                f'latency_{_bucket(total_ms, LATENCY_BUCKETS_MS)}': 1,
+                f'queries_{_bucket(profile.queries, QUERY_BUCKETS)}': 1,
+            }
+            for field, value in values.items():
+                counters[field] = counters.get(field, 0) + value
+            if time.monotonic() - self._flushed_at < settings.PROFILING_FLUSH_INTERVAL:
+                return
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        self.flush(pending)
+
+    @staticmethod
+    def flush(pending):
+        for view_name, counters in pending.items():
+            for field, value in counters.items():
+                key = _metric_key(view_name, field)
+                cache.add(key, 0, None)
+                try:
+                    cache.incr(key, value)
+                except ValueError:
+                    cache.set(key, value, None)
+
+
+recorder = MetricsRecorder()
+
+
+def _metric_key(view_name, field):
+    return f'profiling:{view_name}:{field}'
+
+
+def _metric_fields():
+    return (
+        SUM_FIELDS
+        + tuple(f'latency_{index}' for index in range(len(LATENCY_BUCKETS_MS) + 1))
+        + tuple(f'queries_{index}' for index in range(len(QUERY_BUCKETS) + 1))
+    )
+
+
+def _view_names(patterns, namespace=''):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            nested = f'{namespace}{pattern.namespace}:' if pattern.namespace else namespace
+            yield from _view_names(pattern.url_patterns, nested)
+        elif pattern.name:
+            yield namespace + pattern.name
+
+
+def _percentile(histogram, bounds, total, quantile):
+    threshold = quantile * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= threshold:
+            return bounds[index] if index < len(bounds) else None
+    return None
+
+
+def load_metrics():
+    """Сводка по всем эндпоинтам из кэша: средние, гистограммы и оценки p50/p95/p99."""
+    view_names = sorted(set(_view_names(get_resolver().url_patterns))) + [UNRESOLVED]
+    keys = [_metric_key(name, field) for name in view_names for field in _metric_fields()]
+    raw = cache.get_many(keys)
+    report = {}
+    for name in view_names:
+        values = {field: raw.get(_metric_key(name, field), 0) for field in _metric_fields()}
+        requests = values['requests']
+        if not requests:
+            continue
+        latency = [values[f'latency_{index}'] for index in range(len(LATENCY_BUCKETS_MS) + 1)]
+        queries = [values[f'queries_{index}'] for index in range(len(QUERY_BUCKETS) + 1)]
+        report[name] = {
+            'requests': requests,
+            'avg_queries': round(values['queries'] / requests, 2),
+            'avg_db_ms': round(values['db_us'] / requests / 1000, 3),
+            'avg_serializer_ms': round(values['serializer_us'] / requests / 1000, 3),
+            'avg_total_ms': round(values['total_us'] / requests / 1000, 3),
+            'p50_ms': _percentile(latency, LATENCY_BUCKETS_MS, requests, 0.50),
+            'p95_ms': _percentile(latency, LATENCY_BUCKETS_MS, requests, 0.95),
+            'p99_ms': _percentile(latency, LATENCY_BUCKETS_MS, requests, 0.99),
+            'latency_histogram_ms': dict(zip([*map(str, LATENCY_BUCKETS_MS), 'inf'], latency)),
+            'queries_histogram': dict(zip([*map(str, QUERY_BUCKETS), 'inf'], queries)),
+        }
+    return report
+
+
+def reset_metrics():
+    view_names = list(_view_names(get_resolver().url_patterns)) + [UNRESOLVED]
+    cache.delete_many([_metric_key(name, field) for name in view_names for field in _metric_fields()])
+
+
+def _count_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.db_time += time.perf_counter() - started
+        profile.queries += 1
+
+
+@contextmanager
+def serializer_timer():
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    profile.serializer_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.serializer_depth -= 1
+        # Вложенные сериализаторы уже учтены во внешнем
+        if profile.serializer_depth == 0:
+            profile.serializer_time += time.perf_counter() - started
+
+
+class ProfiledSerializerMixin:
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
+
+
+def _install_query_counter(connection, **kwargs):
+    # Обёртка висит на соединении постоянно и считает запросы только внутри профилируемого запроса.
+    # Так учитываются и запросы из потоков sync_to_async асинхронных вьюх.
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(_install_query_counter)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        for connection in connections.all():
+            _install_query_counter(connection)
+        profile = RequestProfile()
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, profile, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, profile, time.perf_counter() - started)
+
+    @staticmethod
+    def finish(request, response, profile, total_time):
+        match = getattr(request, 'resolver_match', None)
+        recorder.record(match.view_name if match and match.url_name else UNRESOLVED, profile, total_time)
+        if settings.DEBUG or getattr(getattr(request, 'user', None), 'is_staff', False):
+            response['X-Query-Count'] = str(profile.queries)
+        return response
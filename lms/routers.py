@@ -0,0 +1,130 @@
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Чтения уходят на реплику только там, где это явно разрешено: в безопасных HTTP-запросах
+# (ReplicaRoutingMiddleware) и в задачах под replica_reads. Всё остальное — команды, shell,
+# задачи по умолчанию — читает из default, как и без роутера.
+# Read-your-writes: после записи чтения того же запроса и следующие DB_REPLICA_STICKY_SECONDS
+# секунд чтения того же клиента идут в default.
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_current = ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    def __init__(self, replica, sticky=True):
+        self.replica = replica
+        self.sticky = sticky
+        self.wrote = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if state is None or not state.replica or state.wrote or not settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        # Внутри транзакции читаем то же, во что пишем
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None and state.sticky:
+            state.wrote = True
+        # Явно: объект, прочитанный с реплики, иначе сохранялся бы туда же
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db in settings.DATABASE_REPLICAS else None
+
+
+@contextmanager
+def replica_reads(sticky=True):
+    """
+    Чтения внутри блока идут на реплику — для задач Celery, которым допустим лаг реплики.
+    sticky=False оставляет чтения на реплике и после записи: годится, если запись сама
+    перепроверяет условия в default.
+    """
+    token = _current.set(RoutingState(replica=True, sticky=sticky))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Чтения внутри блока идут в default, даже если запрос читает с реплики: для данных, которые
+    надолго кладутся в общий кэш — иначе отставшее значение реплики переживёт её лаг.
+    """
+    state = _current.get()
+    if state is None or not state.replica:
+        yield
+        return
+    state.replica = False
+    try:
+        yield
+    finally:
+        state.replica = True
+
+
+def _client_key(request):
+    # Клиент — JWT из заголовка или сессионная кука; пользователя из БД ради этого не загружаем
+    credentials = request.headers.get('Authorization') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credentials:
+        return None
+    return f'db:pinned:{hashlib.blake2b(credentials.encode(), digest_size=16).hexdigest()}'
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key = _client_key(request)
+        safe = request.method in SAFE_METHODS
+        state = RoutingState(replica=safe and not (key and cache.get(key)))
+        token = _current.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        if key and (state.wrote or not safe):
+            cache.set(key, 1, settings.DB_REPLICA_STICKY_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        key = _client_key(request)
+        safe = request.method in SAFE_METHODS
+        state = RoutingState(replica=safe and not (key and await cache.aget(key)))
+        token = _current.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        if key and (state.wrote or not safe):
+            await cache.aset(key, 1, settings.DB_REPLICA_STICKY_SECONDS)
+        return response
@@ -1,21 +1,71 @@
+from django.core.exceptions import FieldDoesNotExist
 from rest_framework import serializers
-from lms.models import Lesson, Subscription, Course
+from lms.models import FeedItem, Lesson, Subscription, Course
+from lms.profiling import ProfiledSerializerMixin
+from lms.validators import validate_many
 
 
-class CourseSerializer(serializers.ModelSerializer):
+def _serializer_paths(serializer, model, prefix=''):
+    # (select_related, prefetch_related, only); only = None, если есть поле не из модели
+    select, prefetch, columns = [], [], []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            # Метод или свойство: неизвестно, какие колонки им нужны, only() не применяем
+            columns = None
+            continue
+        path = prefix + field.source
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        if isinstance(nested, serializers.ModelSerializer):
+            if model_field.many_to_many or model_field.one_to_many or nested is not field:
+                prefetch.append(path)
+                continue
+            select.append(path)
+            nested_select, nested_prefetch, nested_columns = _serializer_paths(
+                nested, model_field.related_model, f'{path}__'
+            )
+            select += nested_select
+            prefetch += nested_prefetch
+            if columns is not None:
+                columns = None if nested_columns is None else columns + [path] + nested_columns
+        elif model_field.many_to_many or model_field.one_to_many:
+            prefetch.append(path)
+        elif columns is not None:
+            # PrimaryKeyRelatedField читает только <fk>_id, JOIN не нужен
+            columns.append(path)
+    return select, prefetch, columns
+
+
+def optimize_queryset(queryset, serializer_class):
+    """
+    select_related/prefetch_related и only() по объявленным полям сериализатора:
+    вложенные сериализаторы подтягиваются в том же запросе, читаются только выводимые колонки.
+    """
+    select, prefetch, columns = _serializer_paths(serializer_class(), queryset.model)
+    queryset = queryset.select_related(*select).prefetch_related(*prefetch)
+    return queryset.only(*columns) if columns else queryset
+
+
+class CourseSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Course
-        fields = ['id', 'title', 'description', 'owner']
+        fields = ['id', 'title', 'description', 'owner', 'lessons_count', 'subscribers_count']
+        # Денормализованные счётчики из строки курса: без COUNT(*) на каждый курс
+        read_only_fields = ['lessons_count', 'subscribers_count']
 
 
-class LessonSerializer(serializers.ModelSerializer):
+class LessonSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     course = serializers.PrimaryKeyRelatedField(queryset=Course.objects.all())
 
     class Meta:
         model = Lesson
-        fields = ['id', 'title', 'description', 'video_link', 'course', 'owner']
+        fields = ['id', 'title', 'description', 'video_link', 'video_id', 'course', 'owner']
         extra_kwargs = {
             'owner': {'read_only': True},
+            'video_id': {'read_only': True},
             'course': {'required': True}
         }
 
@@ -24,7 +74,48 @@ class LessonSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class CourseWriteSerializer(CourseSerializer):
+    # Владелец всегда берётся из запроса, проверка поля не ходит в БД
+    owner = serializers.PrimaryKeyRelatedField(read_only=True)
+
+
+class LessonWriteSerializer(LessonSerializer):
+    # Только форма данных; существование курса проверяет вызывающий код
+    course = serializers.IntegerField()
+
+
+class LessonBulkItemSerializer(LessonWriteSerializer):
+    # Курс проверяется одним запросом на всю пачку в lms.services.bulk_save_lessons
+    id = serializers.IntegerField(required=False)
+    course = serializers.IntegerField(required=False)
+    # Ссылка проверяется не здесь, а разом на всю пачку в validate_video_links
+    video_link = serializers.CharField(max_length=200, required=False, allow_null=True, allow_blank=True)
+
+    def validate(self, attrs):
+        if 'id' not in attrs and 'course' not in attrs:
+            raise serializers.ValidationError({'course': ['Обязательное поле.']})
+        return attrs
+
+    @staticmethod
+    def validate_video_links(items):
+        """
+        Проверяет ссылки провалидированных элементов пачки и проставляет им video_id.
+        Возвращает {позиция в items: сообщения} для некорректных ссылок.
+        """
+        video_ids, errors = validate_many([item.get('video_link') for item in items])
+        for item, video_id in zip(items, video_ids):
+            if 'video_link' in item:
+                item['video_id'] = video_id
+        return errors
+
+
+class SubscriptionBulkSerializer(serializers.Serializer):
+    # Пары — декартово произведение users x courses; без users подписывается сам пользователь
+    courses = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+    users = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, required=False)
+
+
+class SubscriptionSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
     course = serializers.PrimaryKeyRelatedField(queryset=Course.objects.all())
 
@@ -33,4 +124,20 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'course']
         extra_kwargs = {
             'user': {'read_only': True}
-        }
\ No newline at end of file
+        }
+
+
+class FeedCourseSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Course
+        fields = ['id', 'title']
+
+
+class FeedItemSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    # Урок и курс подтягиваются JOIN'ом по первичным ключам (см. optimize_queryset)
+    lesson = LessonSerializer(read_only=True)
+    course = FeedCourseSerializer(read_only=True)
+
+    class Meta:
+        model = FeedItem
+        fields = ['id', 'lesson', 'course', 'created_at']
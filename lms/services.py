@@ -0,0 +1,160 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from lms.cache import invalidate_owner
+from lms.feed import add_courses_to_feeds, remove_courses_from_feeds
+from lms.models import Course, Lesson, OutboxEvent, Subscription
+
+
+def adjust_course_counters(field, deltas):
+    """
+    Атомарно сдвигает денормализованный счётчик курса (lessons_count или subscribers_count).
+    deltas — {course_id: изменение}. Одно UPDATE ... SET field = field + delta на все курсы,
+    без чтения строки; значение не уходит ниже нуля даже при рассинхронизации.
+    """
+    deltas = {course_id: delta for course_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    delta = Case(
+        *(When(pk=course_id, then=Value(course_delta)) for course_id, course_delta in deltas.items()),
+        default=Value(0), output_field=IntegerField(),
+    )
+    Course.objects.filter(pk__in=deltas).update(**{field: Greatest(F(field) + delta, 0)})
+    # Счётчики входят в ответы курсов, кэшированные у владельца курса
+    for owner_id in Course.objects.filter(pk__in=deltas).values_list('owner_id', flat=True).distinct():
+        invalidate_owner(owner_id)
+
+
+def notify_course_updated(course_ids):
+    # Один INSERT в outbox в транзакции изменения, без похода к брокеру из запроса.
+    # Откатившиеся правки не рассылаются; в Celery события передаёт lms.tasks.relay_outbox
+    OutboxEvent.objects.bulk_create([
+        OutboxEvent(topic=OutboxEvent.COURSE_UPDATED, payload={'course_id': course_id})
+        for course_id in sorted(set(course_ids))
+    ])
+
+
+def publish_lessons_created(lesson_ids):
+    # Раскладка по лентам подписчиков — в воркере, запрос платит только INSERT в outbox
+    OutboxEvent.objects.bulk_create([
+        OutboxEvent(topic=OutboxEvent.LESSON_CREATED, payload={'lesson_id': lesson_id}) for lesson_id in lesson_ids
+    ])
+
+
+def bulk_save_lessons(owner, items):
+    """
+    Создаёт и обновляет уроки пачкой. items — провалидированные данные
+    LessonBulkItemSerializer; элементы с id обновляются, без id создаются.
+    Возвращает (results, errors): результаты по индексам элементов либо ошибки по индексам.
+    Пока есть хоть одна ошибка, ничего не записывается.
+    """
+    course_ids = {item['course'] for item in items if 'id' not in item}
+    known_courses = set(Course.objects.filter(id__in=course_ids).values_list('id', flat=True))
+    update_ids = [item['id'] for item in items if 'id' in item]
+    existing = Lesson.objects.filter(owner=owner, id__in=update_ids).in_bulk()
+
+    errors = []
+    for index, item in enumerate(items):
+        if 'id' in item and item['id'] not in existing:
+            errors.append({'index': index, 'errors': {'id': ['Урок не найден.']}})
+        elif 'id' not in item and item['course'] not in known_courses:
+            errors.append({'index': index, 'errors': {'course': [f'Курс {item["course"]} не существует.']}})
+    if errors:
+        return [], errors
+
+    to_create = []
+    to_update = {}
+    update_fields = {'updated_at'}
+    now = timezone.now()
+    for item in items:
+        fields = {key: value for key, value in item.items() if key not in ('id', 'course')}
+        if 'id' in item:
+            lesson = existing[item['id']]
+            for key, value in fields.items():
+                setattr(lesson, key, value)
+            lesson.updated_at = now
+            update_fields.update(fields)
+            to_update[lesson.id] = lesson
+        else:
+            to_create.append(Lesson(owner=owner, course_id=item['course'], **fields))
+
+    with transaction.atomic():
+        created = Lesson.objects.bulk_create(to_create)
+        if to_update:
+            Lesson.objects.bulk_update(to_update.values(), sorted(update_fields))
+        # bulk-операции не шлют post_save, кэш и счётчики обновляем явно
+        invalidate_owner(owner.id)
+        adjust_course_counters('lessons_count', Counter(lesson.course_id for lesson in created))
+        publish_lessons_created([lesson.id for lesson in created])
+        notify_course_updated([lesson.course_id for lesson in [*created, *to_update.values()]])
+
+    created = iter(created)
+    results = []
+    for index, item in enumerate(items):
+        if 'id' in item:
+            results.append({'index': index, 'id': item['id'], 'status': 'updated'})
+        else:
+            results.append({'index': index, 'id': next(created).id, 'status': 'created'})
+    return results, []
+
+
+def _subscription_batches(pairs, batch_size):
+    # Повторы пар убираем заранее, порядок сохраняется
+    pairs = list(dict.fromkeys(pairs))
+    batch_size = batch_size or settings.SUBSCRIPTION_BULK_BATCH_SIZE
+    for start in range(0, len(pairs), batch_size):
+        batch = pairs[start:start + batch_size]
+        yield len(batch), [user_id for user_id, _ in batch], [course_id for _, course_id in batch]
+
+
+def subscribe_many(pairs, batch_size=None):
+    """
+    Подписывает пары (user_id, course_id) пачками: один INSERT ... ON CONFLICT DO NOTHING на пачку,
+    уже существующие подписки пропускаются. Пользователи и курсы должны существовать.
+    Счётчики, кэш и ленты обновляются один раз на пачку. Возвращает (created, skipped).
+    """
+    table = connection.ops.quote_name(Subscription._meta.db_table)
+    created = skipped = 0
+    for size, user_ids, course_ids in _subscription_batches(pairs, batch_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, course_id, created_at) '
+                f'SELECT pair.user_id, pair.course_id, %s '
+                f'FROM unnest(%s::bigint[], %s::bigint[]) AS pair (user_id, course_id) '
+                f'ON CONFLICT (user_id, course_id) DO NOTHING RETURNING user_id, course_id',
+                [timezone.now(), user_ids, course_ids],
+            )
+            subscribed = cursor.fetchall()
+            per_course = Counter(course_id for _, course_id in subscribed)
+            # bulk-операции не шлют post_save: счётчики, кэш и ленты — явно, один раз на пачку
+            adjust_course_counters('subscribers_count', per_course)
+            add_courses_to_feeds(subscribed)
+        created += sum(per_course.values())
+        skipped += size - sum(per_course.values())
+    return created, skipped
+
+
+def unsubscribe_many(pairs, batch_size=None):
+    """Удаляет подписки пар (user_id, course_id) пачками, отсутствующие пропускает. Возвращает (deleted, skipped)."""
+    table = connection.ops.quote_name(Subscription._meta.db_table)
+    deleted = skipped = 0
+    for size, user_ids, course_ids in _subscription_batches(pairs, batch_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} AS subscription '
+                f'USING unnest(%s::bigint[], %s::bigint[]) AS pair (user_id, course_id) '
+                f'WHERE subscription.user_id = pair.user_id AND subscription.course_id = pair.course_id '
+                f'RETURNING subscription.user_id, subscription.course_id',
+                [user_ids, course_ids],
+            )
+            unsubscribed = cursor.fetchall()
+            per_course = Counter(course_id for _, course_id in unsubscribed)
+            adjust_course_counters('subscribers_count', {course_id: -n for course_id, n in per_course.items()})
+            remove_courses_from_feeds(unsubscribed)
+        deleted += sum(per_course.values())
+        skipped += size - sum(per_course.values())
+    return deleted, skipped
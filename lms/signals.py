@@ -0,0 +1,95 @@
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from lms.cache import invalidate_owner
+from lms.feed import add_courses_to_feeds, remove_courses_from_feeds
+from lms.models import Course, Lesson, Subscription, lesson_deleted, subscription_deleted
+from lms.services import adjust_course_counters, notify_course_updated, publish_lessons_created
+from users.models import User
+
+
+@receiver([post_save, post_delete], sender=Course)
+def invalidate_course_cache(sender, instance, **kwargs):
+    invalidate_owner(instance.owner_id)
+
+
+@receiver([post_save, lesson_deleted], sender=Lesson)
+def invalidate_lesson_cache(sender, instance, **kwargs):
+    invalidate_owner(instance.owner_id)
+
+
+@receiver(pre_delete, sender=Course)
+def invalidate_course_lesson_owners(sender, instance, **kwargs):
+    # Уроки курса удаляются каскадом без сигналов: кэш сбрасываем их владельцам, кроме владельца курса
+    owner_ids = (
+        Lesson.objects.filter(course=instance).exclude(owner_id=instance.owner_id)
+        .values_list('owner_id', flat=True).distinct()
+    )
+    for owner_id in owner_ids:
+        invalidate_owner(owner_id)
+
+
+@receiver(pre_delete, sender=User)
+def release_user_course_counters(sender, instance, **kwargs):
+    # Уроки и подписки пользователя удаляются каскадом без сигналов. Счётчики его собственных курсов
+    # не важны — курсы удаляются тем же каскадом; счётчики чужих сдвигаются одним UPDATE на поле,
+    # записи лент уходят каскадом по внешним ключам FeedItem
+    for field, model, user_field in (('lessons_count', Lesson, 'owner'), ('subscribers_count', Subscription, 'user')):
+        rows = (
+            model.objects.filter(**{user_field: instance}).exclude(course__owner=instance)
+            .values('course_id').annotate(removed=Count('id')).values_list('course_id', 'removed')
+        )
+        adjust_course_counters(field, {course_id: -removed for course_id, removed in rows})
+
+
+@receiver(post_save, sender=Course)
+def notify_course_subscribers(sender, instance, created, **kwargs):
+    if not created:
+        notify_course_updated([instance.pk])
+
+
+@receiver(post_save, sender=Lesson)
+def increment_lessons_count(sender, instance, created, **kwargs):
+    if created:
+        adjust_course_counters('lessons_count', {instance.course_id: 1})
+
+
+@receiver(post_save, sender=Lesson)
+def notify_lesson_course_subscribers(sender, instance, **kwargs):
+    notify_course_updated([instance.course_id])
+
+
+@receiver(post_save, sender=Lesson)
+def add_lesson_to_feeds(sender, instance, created, **kwargs):
+    if created:
+        publish_lessons_created([instance.pk])
+
+
+@receiver(lesson_deleted, sender=Lesson)
+def decrement_lessons_count(sender, instance, **kwargs):
+    adjust_course_counters('lessons_count', {instance.course_id: -1})
+
+
+def invalidate_subscription_cache(instance):
+    # Создание и удаление сбрасывают кэш владельца курса в adjust_course_counters
+    owner_id = Course.objects.filter(pk=instance.course_id).values_list('owner_id', flat=True).first()
+    invalidate_owner(owner_id)
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_saved(sender, instance, created, **kwargs):
+    if created:
+        adjust_course_counters('subscribers_count', {instance.course_id: 1})
+        add_courses_to_feeds([(instance.user_id, instance.course_id)])
+    else:
+        invalidate_subscription_cache(instance)
+
+
+@receiver(subscription_deleted, sender=Subscription)
+def decrement_subscribers_count(sender, instance, **kwargs):
+    adjust_course_counters('subscribers_count', {instance.course_id: -1})
+
+
+@receiver(subscription_deleted, sender=Subscription)
+def remove_course_from_feed(sender, instance, **kwargs):
+    remove_courses_from_feeds([(instance.user_id, instance.course_id)])
@@ -1,23 +1,270 @@
+import json
+import logging
+import smtplib
+import time
+
 from celery import shared_task
-from django.core.mail import send_mail
-from .models import Course, Subscription
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .cache import invalidate_owner
+from .feed import fanout_lesson
+from .models import Course, FeedItem, Lesson, OutboxEvent, Subscription
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
+# SMTP-соединение живёт в процессе воркера и переиспользуется между порциями
+_mail_connection = None
+
+
+def _get_mail_connection():
+    global _mail_connection
+    if _mail_connection is None:
+        _mail_connection = get_connection(fail_silently=False)
+    _mail_connection.open()
+    return _mail_connection
+
+
+def _reset_mail_connection():
+    global _mail_connection
+    if _mail_connection is not None:
+        try:
+            _mail_connection.close()
+        except Exception:
+            pass
+    _mail_connection = None
+
+
+# Счётчики диспетчера уведомлений об обновлении курса, общие для всех процессов
+NOTIFY_STATS = ('requested', 'scheduled', 'coalesced', 'postponed', 'rate_limited', 'sent')
+
+
+def _notify_pending_key(course_id):
+    # Есть, пока для курса запланирована задача; значение — время первой правки пачки
+    return f'lms:notify-pending:{course_id}'
+
+
+def _notify_last_edit_key(course_id):
+    return f'lms:notify-last-edit:{course_id}'
+
+
+def _notify_sent_key(course_id):
+    return f'lms:notify-sent:{course_id}'
+
+
+def _notify_stat(name):
+    key = f'lms:notify-stats:{name}'
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def _notify_marker_timeout():
+    # Маркер переживает самую долгую отсрочку; если задача потерялась, он всё равно истечёт
+    return settings.COURSE_UPDATE_NOTIFY_MAX_DELAY + settings.COURSE_UPDATE_NOTIFY_MIN_INTERVAL + 60
+
+
+def get_notification_stats():
+    raw = cache.get_many([f'lms:notify-stats:{name}' for name in NOTIFY_STATS])
+    return {name: raw.get(f'lms:notify-stats:{name}', 0) for name in NOTIFY_STATS}
+
+
+def schedule_course_update_email(course_id):
+    """
+    Ставит рассылку об обновлении курса с дебаунсом: серия правок схлопывается в одну задачу,
+    которая уходит после тихого окна без правок (но не позже COURSE_UPDATE_NOTIFY_MAX_DELAY).
+    """
+    now = time.time()
+    _notify_stat('requested')
+    cache.set(_notify_last_edit_key(course_id), now, _notify_marker_timeout())
+    # add атомарен: задачу ставит только первая правка серии
+    if cache.add(_notify_pending_key(course_id), now, _notify_marker_timeout()):
+        try:
+            dispatch_course_update_email.apply_async((course_id,), countdown=settings.COURSE_UPDATE_NOTIFY_QUIET_WINDOW)
+        except Exception:
+            # Задача не ушла: без маркера повтор из outbox поставит её заново, а не схлопнется
+            cache.delete(_notify_pending_key(course_id))
+            raise
+        _notify_stat('scheduled')
+    else:
+        _notify_stat('coalesced')
+
+
+@shared_task
+def dispatch_course_update_email(course_id):
+    now = time.time()
+    first_edit = cache.get(_notify_pending_key(course_id))
+    if first_edit is None:
+        return f"No pending update email for course {course_id}"
+    last_edit = cache.get(_notify_last_edit_key(course_id), first_edit)
+
+    # Правки ещё идут: ждём конца тихого окна, но не дольше максимальной отсрочки
+    quiet_left = last_edit + settings.COURSE_UPDATE_NOTIFY_QUIET_WINDOW - now
+    delay_left = first_edit + settings.COURSE_UPDATE_NOTIFY_MAX_DELAY - now
+    countdown = min(quiet_left, delay_left)
+    if countdown > 0:
+        dispatch_course_update_email.apply_async((course_id,), countdown=countdown)
+        _notify_stat('postponed')
+        return f"Postponed update email for course {course_id} by {countdown:.0f}s"
+
+    # Не чаще одной рассылки на курс за COURSE_UPDATE_NOTIFY_MIN_INTERVAL
+    if not cache.add(_notify_sent_key(course_id), now, settings.COURSE_UPDATE_NOTIFY_MIN_INTERVAL):
+        sent_at = cache.get(_notify_sent_key(course_id), now)
+        countdown = max(1, sent_at + settings.COURSE_UPDATE_NOTIFY_MIN_INTERVAL - now)
+        dispatch_course_update_email.apply_async((course_id,), countdown=countdown)
+        _notify_stat('rate_limited')
+        return f"Rate limited update email for course {course_id}, retry in {countdown:.0f}s"
+
+    # Маркер снимается до рассылки: правки во время неё запланируют следующую
+    cache.delete(_notify_pending_key(course_id))
+    if not Course.objects.filter(pk=course_id).exists():
+        return f"Course {course_id} was deleted, update email skipped"
+    _notify_stat('sent')
+    return send_course_update_email(course_id)
+
 
 @shared_task
 def send_course_update_email(course_id):
-    course = Course.objects.get(id=course_id)
-    subscriptions = Subscription.objects.filter(course=course)
-    recipients = [subscription.user.email for subscription in subscriptions if subscription.user.email]
-
-    if recipients:
-        subject = f"Course Updated: {course.title}"
-        message = f"The course '{course.title}' has been updated. Check out the new content!"
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipients,
-            fail_silently=False,
+    course = Course.objects.only('title').get(id=course_id)
+    subject = f"Course Updated: {course.title}"
+    message = f"The course '{course.title}' has been updated. Check out the new content!"
+
+    # Порции по id подписки, а не серверный курсор: за pgbouncer в режиме transaction он не переживает транзакцию
+    subscriptions = (
+        Subscription.objects
+        .filter(course_id=course_id)
+        .exclude(user__email='')
+        .order_by('id')
+        .values_list('id', 'user__email')
+    )
+    chunk_size = settings.COURSE_UPDATE_EMAIL_CHUNK_SIZE
+    chunks = 0
+    total = 0
+    last_id = 0
+    while True:
+        batch = list(subscriptions.filter(id__gt=last_id)[:chunk_size])
+        if not batch:
+            break
+        send_course_update_email_chunk.delay(course_id, [email for _, email in batch], subject, message)
+        chunks += 1
+        total += len(batch)
+        last_id = batch[-1][0]
+    return f"Queued update email for course {course_id} to {total} users in {chunks} chunks"
+
+
+@shared_task(bind=True, max_retries=settings.COURSE_UPDATE_EMAIL_MAX_RETRIES, default_retry_delay=60)
+def send_course_update_email_chunk(self, course_id, recipients, subject, message):
+    started = time.monotonic()
+    messages = [
+        EmailMessage(subject=subject, body=message, from_email=settings.DEFAULT_FROM_EMAIL, to=[email])
+        for email in recipients
+    ]
+    sent = 0
+    connection = _get_mail_connection()
+    for index, email_message in enumerate(messages):
+        try:
+            sent += connection.send_messages([email_message])
+        except (smtplib.SMTPException, OSError) as exc:
+            _reset_mail_connection()
+            # Повтор только для неотправленного хвоста: уже доставленным письмо второй раз не уходит
+            raise self.retry(
+                args=(course_id, recipients[index:], subject, message),
+                exc=exc, countdown=self.default_retry_delay * 2 ** self.request.retries,
+            )
+
+    elapsed = time.monotonic() - started
+    rate = sent / elapsed if elapsed else float(sent)
+    logger.info(
+        'Course %s update chunk: sent %s/%s emails in %.3fs (%.1f msg/s, attempt %s)',
+        course_id, sent, len(recipients), elapsed, rate, self.request.retries + 1,
+    )
+    return {'course_id': course_id, 'sent': sent, 'seconds': round(elapsed, 3), 'per_second': round(rate, 1)}
+
+
+def _count_per_course(model):
+    counts = model.objects.filter(course=OuterRef('pk')).order_by().values('course').annotate(n=Count('pk'))
+    return Coalesce(Subquery(counts.values('n')), 0)
+
+
+@shared_task
+def reconcile_course_counters(batch_size=None, start_after_id=0):
+    batch_size = batch_size or settings.COURSE_COUNTERS_BATCH_SIZE
+    # Пачки курсов по возрастанию id; пересчёт и запись — один UPDATE с подзапросами,
+    # поэтому инкременты, пришедшие между чтением и записью, не теряются
+    repaired = 0
+    pruned = 0
+    last_id = start_after_id
+    while True:
+        ids = list(Course.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        # QuerySet.delete() и массовое удаление в админке не шлют subscription_deleted: записи лент
+        # отписавшихся так удалением остаются, пока их не уберёт этот проход
+        _, deleted = FeedItem.objects.filter(course_id__in=ids).exclude(Exists(
+            Subscription.objects.filter(user_id=OuterRef('user_id'), course_id=OuterRef('course_id'))
+        )).delete()
+        pruned += deleted.get(FeedItem._meta.label, 0)
+        drifted = (
+            Course.objects
+            .filter(id__in=ids)
+            .annotate(actual_lessons=_count_per_course(Lesson), actual_subscribers=_count_per_course(Subscription))
+            .exclude(lessons_count=F('actual_lessons'), subscribers_count=F('actual_subscribers'))
         )
-    return f"Sent update email for course {course_id} to {len(recipients)} users"
+        owner_ids = set(drifted.values_list('owner_id', flat=True))
+        if owner_ids:
+            repaired += Course.objects.filter(id__in=drifted.values('id')).update(
+                lessons_count=_count_per_course(Lesson),
+                subscribers_count=_count_per_course(Subscription),
+            )
+            for owner_id in owner_ids:
+                invalidate_owner(owner_id)
+        last_id = ids[-1]
+        logger.info('Reconciled course counters up to id %s (%s repaired so far)', last_id, repaired)
+    return f"Repaired counters of {repaired} courses, pruned {pruned} orphaned feed items (last id {last_id})"
+
+
+# Обработчики событий outbox по темам; событие без обработчика считается доставленным
+OUTBOX_HANDLERS = {
+    OutboxEvent.COURSE_UPDATED: lambda payload: schedule_course_update_email(payload['course_id']),
+    OutboxEvent.LESSON_CREATED: lambda payload: fanout_lesson_to_feeds.delay(payload['lesson_id']),
+}
+
+
+@shared_task
+def fanout_lesson_to_feeds(lesson_id):
+    delivered = fanout_lesson(lesson_id)
+    return f"Lesson {lesson_id} added to feeds of {delivered} subscribers"
+
+
+@shared_task
+def relay_outbox(batch_size=None):
+    """
+    Передаёт события outbox в Celery пачками. Пачка выбирается с SKIP LOCKED, поэтому параллельные
+    запуски не мешают друг другу, и удаляется в той же транзакции. Если брокер недоступен, транзакция
+    откатывается и пачка уйдёт при следующем запуске: доставка хотя бы один раз, обработчики идемпотентны.
+    """
+    batch_size = batch_size or settings.OUTBOX_RELAY_BATCH_SIZE
+    relayed = 0
+    while True:
+        with transaction.atomic():
+            events = list(OutboxEvent.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+            if not events:
+                break
+            # Одинаковые события пачки (серия правок одного курса) передаются один раз
+            unique = {(event.topic, json.dumps(event.payload, sort_keys=True)): event for event in events}
+            for event in unique.values():
+                handler = OUTBOX_HANDLERS.get(event.topic)
+                if handler is None:
+                    logger.warning('No outbox handler for topic %s, event %s dropped', event.topic, event.id)
+                    continue
+                handler(event.payload)
+            OutboxEvent.objects.filter(id__in=[event.id for event in events]).delete()
+        relayed += len(events)
+        if len(events) < batch_size:
+            break
+    return f"Relayed {relayed} outbox events"
@@ -1,7 +1,31 @@
+import json
+import smtplib
+from io import StringIO
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from celery.exceptions import Retry
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, router, transaction
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.response import Response
 from rest_framework.test import APIClient
-from lms.models import Course, Lesson, Subscription
+from config.celery import app as celery_app
+from lms.models import Course, FeedItem, Lesson, OutboxEvent, Subscription
+from lms.cache import bump_owner_version, cached_response, get_cache_stats, get_owner_version
+from lms.routers import ReplicaRoutingMiddleware, replica_reads
+from lms.validators import validate_many, youtube_video_id
+from lms.tasks import (_reset_mail_connection, dispatch_course_update_email, fanout_lesson_to_feeds,
+                       get_notification_stats, reconcile_course_counters, relay_outbox, schedule_course_update_email,
+                       send_course_update_email, send_course_update_email_chunk)
 
 
 class LessonTests(TestCase):
@@ -138,3 +162,1137 @@ class SubscriptionTests(TestCase):
         self.client.logout()
         response = self.client.post('/api/subscriptions/', {'course': self.course.id})
         self.assertEqual(response.status_code, 403)
+
+    def test_subscribe_twice(self):
+        self.client.post('/api/subscriptions/', {'course': self.course.id})
+        response = self.client.post('/api/subscriptions/', {'course': self.course.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.user.subscriptions.count(), 1)
+
+
+class SubscriptionBulkTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='user1',
+            email='user1@example.com',
+            password='User1_Python2025'
+        )
+        self.admin = get_user_model().objects.create_user(
+            username='admin',
+            email='admin@example.com',
+            password='Admin_Python2025',
+            is_staff=True
+        )
+        self.students = [
+            get_user_model().objects.create_user(username=f'student{i}', email=f'student{i}@example.com')
+            for i in range(3)
+        ]
+        self.courses = [
+            Course.objects.create(title=f'Course {i}', description='D', owner=self.admin) for i in range(2)
+        ]
+        self.course_ids = [course.id for course in self.courses]
+        self.student_ids = [student.id for student in self.students]
+
+    def test_self_subscribe_and_unsubscribe(self):
+        self.client.force_login(self.user)
+        Subscription.objects.create(user=self.user, course=self.courses[0])
+        response = self.client.post('/api/subscriptions/bulk/', {'courses': self.course_ids}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'created': 1, 'skipped': 1})
+        self.assertEqual(self.user.subscriptions.count(), 2)
+
+        response = self.client.delete('/api/subscriptions/bulk/', {'courses': self.course_ids}, format='json')
+        self.assertEqual(response.data, {'deleted': 2, 'skipped': 0})
+        self.assertFalse(self.user.subscriptions.exists())
+
+    def test_campaign_requires_staff(self):
+        self.client.force_login(self.user)
+        payload = {'courses': self.course_ids, 'users': self.student_ids}
+        self.assertEqual(self.client.post('/api/subscriptions/bulk/', payload, format='json').status_code, 403)
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_campaign_counters_and_notifications(self):
+        self.client.force_login(self.admin)
+        payload = {'courses': self.course_ids, 'users': self.student_ids}
+        with patch('lms.services.adjust_course_counters') as adjust:
+            response = self.client.post('/api/subscriptions/bulk/', payload, format='json')
+        self.assertEqual(response.data, {'created': 6, 'skipped': 0})
+        # Один сдвиг счётчиков на пачку, а не на каждую подписку
+        adjust.assert_called_once_with('subscribers_count', {course_id: 3 for course_id in self.course_ids})
+
+        Course.objects.filter(id__in=self.course_ids).update(subscribers_count=0)
+        Subscription.objects.all().delete()
+        response = self.client.post('/api/subscriptions/bulk/', payload, format='json')
+        self.assertEqual(response.data, {'created': 6, 'skipped': 0})
+        self.assertEqual(
+            list(Course.objects.filter(id__in=self.course_ids).values_list('subscribers_count', flat=True)), [3, 3]
+        )
+        response = self.client.delete(
+            '/api/subscriptions/bulk/', {'courses': self.course_ids[:1], 'users': self.student_ids}, format='json'
+        )
+        self.assertEqual(response.data, {'deleted': 3, 'skipped': 0})
+        self.courses[0].refresh_from_db()
+        self.assertEqual(self.courses[0].subscribers_count, 0)
+
+    def test_queries_do_not_grow_with_batch(self):
+        self.client.force_login(self.admin)
+        more = [get_user_model().objects.create_user(username=f'extra{i}', email=f'extra{i}@example.com').id
+                for i in range(20)]
+        with CaptureQueriesContext(connection) as small:
+            self.client.post('/api/subscriptions/bulk/', {'courses': self.course_ids, 'users': self.student_ids},
+                             format='json')
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post('/api/subscriptions/bulk/', {'courses': self.course_ids, 'users': more},
+                                        format='json')
+        self.assertEqual(response.data['created'], 40)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_unknown_course_rejected(self):
+        self.client.force_login(self.admin)
+        payload = {'courses': [self.course_ids[0], self.course_ids[-1] + 1000], 'users': self.student_ids}
+        response = self.client.post('/api/subscriptions/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('courses', response.data)
+        self.assertFalse(Subscription.objects.exists())
+
+    @override_settings(SUBSCRIPTION_BULK_BATCH_SIZE=4)
+    def test_batches(self):
+        self.client.force_login(self.admin)
+        Subscription.objects.create(user=self.students[0], course=self.courses[0])
+        payload = {'courses': self.course_ids, 'users': self.student_ids}
+        response = self.client.post('/api/subscriptions/bulk/', payload, format='json')
+        self.assertEqual(response.data, {'created': 5, 'skipped': 1})
+        self.assertEqual(Subscription.objects.count(), 6)
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='user1',
+            email='user1@example.com',
+            password='User1_Python2025'
+        )
+        self.client.force_login(self.user)
+        self.course = Course.objects.create(
+            title='Test Course',
+            description='Test Description',
+            owner=self.user
+        )
+        # Одинаковый created_at у всех уроков проверяет разрешение коллизий по id
+        created_at = self.course.created_at
+        self.lessons = [
+            Lesson.objects.create(
+                title=f'Lesson {i}',
+                description='Description',
+                course=self.course,
+                owner=self.user,
+                created_at=created_at
+            )
+            for i in range(7)
+        ]
+
+    def test_lesson_cursor_pagination(self):
+        response = self.client.get('/api/lessons/', {'page_size': 3})
+        self.assertEqual(response.status_code, 200)
+        seen = [item['id'] for item in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen.extend(item['id'] for item in response.data['results'])
+        self.assertEqual(seen, sorted((lesson.id for lesson in self.lessons), reverse=True))
+
+    def test_course_pagination_last_page(self):
+        response = self.client.get('/api/courses/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/lessons/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_lesson_ndjson_stream(self):
+        response = self.client.get('/api/lessons/', {'stream': 'ndjson'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), len(self.lessons))
+
+
+class CourseUpdateEmailTests(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user(
+            username='owner',
+            email='owner@example.com',
+            password='Owner_Python2025'
+        )
+        self.course = Course.objects.create(
+            title='Test Course',
+            description='Test Description',
+            owner=self.owner
+        )
+        for i in range(5):
+            user = get_user_model().objects.create_user(
+                username=f'student{i}',
+                email=f'student{i}@example.com',
+                password='Student_Python2025'
+            )
+            Subscription.objects.create(user=user, course=self.course)
+
+    @override_settings(COURSE_UPDATE_EMAIL_CHUNK_SIZE=2)
+    def test_fan_out_in_chunks(self):
+        with patch('lms.tasks.send_course_update_email_chunk.delay') as delay:
+            send_course_update_email(self.course.id)
+        chunks = [call.args[1] for call in delay.call_args_list]
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(
+            sorted(email for chunk in chunks for email in chunk),
+            [f'student{i}@example.com' for i in range(5)]
+        )
+
+    def test_chunk_retry_resends_only_undelivered_tail(self):
+        def send_messages(messages):
+            if messages[0].to == ['c@example.com']:
+                raise smtplib.SMTPServerDisconnected('gone')
+            return len(messages)
+
+        _reset_mail_connection()
+        connection = SimpleNamespace(send_messages=send_messages, open=lambda: None, close=lambda: None)
+        with patch('lms.tasks.get_connection', return_value=connection), \
+                patch.object(send_course_update_email_chunk, 'retry', side_effect=Retry()) as retry:
+            with self.assertRaises(Retry):
+                send_course_update_email_chunk(
+                    self.course.id, ['a@example.com', 'b@example.com', 'c@example.com', 'd@example.com'], 'S', 'B'
+                )
+        self.assertEqual(retry.call_args.kwargs['args'], (self.course.id, ['c@example.com', 'd@example.com'], 'S', 'B'))
+
+    def test_chunk_sends_one_message_per_recipient(self):
+        result = send_course_update_email_chunk(
+            self.course.id, ['a@example.com', 'b@example.com'], 'Subject', 'Body'
+        )
+        self.assertEqual(result['sent'], 2)
+        self.assertEqual([message.to for message in mail.outbox], [['a@example.com'], ['b@example.com']])
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='user1',
+            email='user1@example.com',
+            password='User1_Python2025'
+        )
+        self.client.force_login(self.user)
+        self.course = Course.objects.create(
+            title='Test Course',
+            description='Test Description',
+            owner=self.user
+        )
+
+    def test_repeat_read_skips_database(self):
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(f'/api/courses/{self.course.id}/')
+        hits = get_cache_stats()['hits']
+        with CaptureQueriesContext(connection) as second:
+            response = self.client.get(f'/api/courses/{self.course.id}/')
+        self.assertEqual(response.data['title'], 'Test Course')
+        self.assertEqual(get_cache_stats()['hits'], hits + 1)
+        self.assertFalse(any('lms_course' in query['sql'] for query in second.captured_queries))
+        self.assertTrue(any('lms_course' in query['sql'] for query in first.captured_queries))
+
+    def test_write_invalidates_cached_response(self):
+        self.client.get(f'/api/courses/{self.course.id}/')
+        self.client.patch(f'/api/courses/{self.course.id}/', {'title': 'Renamed'})
+        response = self.client.get(f'/api/courses/{self.course.id}/')
+        self.assertEqual(response.data['title'], 'Renamed')
+
+    def test_version_keys_expire_after_responses(self):
+        with patch.object(cache, 'add', wraps=cache.add) as add, patch.object(cache, 'set', wraps=cache.set) as set_:
+            get_owner_version(self.user.id + 1000)
+            bump_owner_version(self.user.id + 2000)
+        for call in (add.call_args, set_.call_args):
+            self.assertEqual(call.args[2], settings.LMS_OWNER_VERSION_TIMEOUT)
+        self.assertGreater(settings.LMS_OWNER_VERSION_TIMEOUT, settings.LMS_RESPONSE_CACHE_TIMEOUT)
+
+    def test_lesson_list_invalidated_on_create(self):
+        self.assertEqual(self.client.get('/api/lessons/').data['results'], [])
+        Lesson.objects.create(title='Lesson', description='Description', course=self.course, owner=self.user)
+        self.assertEqual(len(self.client.get('/api/lessons/').data['results']), 1)
+
+
+class ExplainHotQueriesCommandTests(TestCase):
+    def test_reports_every_hot_query(self):
+        user = get_user_model().objects.create_user(
+            username='user1',
+            email='user1@example.com',
+            password='User1_Python2025'
+        )
+        Course.objects.create(title='Test Course', description='Test Description', owner=user)
+        out = StringIO()
+        call_command('explain_hot_queries', stdout=out)
+        for name in ('course-list', 'lesson-list', 'course-subscribers', 'inactive-users'):
+            self.assertIn(f'== {name}', out.getvalue())
+        # Индексы, удалённые для сравнения, возвращаются откатом транзакции
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, 'lms_lesson')
+        self.assertIn('lesson_owner_created_idx', constraints)
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_FLUSH_INTERVAL=0)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='admin',
+            email='admin@example.com',
+            password='Admin_Python2025',
+            is_staff=True
+        )
+        self.client.force_login(self.user)
+        self.course = Course.objects.create(
+            title='Test Course',
+            description='Test Description',
+            owner=self.user
+        )
+
+    def test_query_count_header(self):
+        response = self.client.get(f'/api/courses/{self.course.id}/')
+        self.assertGreater(int(response['X-Query-Count']), 0)
+
+    def test_query_count_header_only_for_staff(self):
+        self.user.is_staff = False
+        self.user.save()
+        response = self.client.get(f'/api/courses/{self.course.id}/')
+        self.assertNotIn('X-Query-Count', response)
+
+    def test_metrics_endpoint_reports_per_url_name(self):
+        self.client.get(f'/api/courses/{self.course.id}/')
+        self.client.get(f'/api/courses/{self.course.id}/')
+        response = self.client.get('/api/_metrics/')
+        self.assertEqual(response.status_code, 200)
+        row = response.data['course-detail']
+        self.assertEqual(row['requests'], 2)
+        self.assertGreater(row['avg_queries'], 0)
+        self.assertEqual(sum(row['latency_histogram_ms'].values()), 2)
+
+    def test_metrics_endpoint_reports_response_cache(self):
+        self.client.get(f'/api/courses/{self.course.id}/')
+        self.client.get(f'/api/courses/{self.course.id}/')
+        response = self.client.get('/api/_metrics/')
+        self.assertEqual(response.data['response_cache'], {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+        out = StringIO()
+        call_command('endpoint_metrics', '--cache', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['hits'], 1)
+
+    def test_metrics_endpoint_requires_staff(self):
+        self.user.is_staff = False
+        self.user.save()
+        response = self.client.get('/api/_metrics/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_endpoint_metrics_command(self):
+        self.client.get(f'/api/courses/{self.course.id}/')
+        out = StringIO()
+        call_command('endpoint_metrics', '--json', stdout=out)
+        self.assertIn('course-detail', json.loads(out.getvalue()))
+
+
+class BenchmarkApiCommandTests(TestCase):
+    def test_machine_readable_report(self):
+        cache.clear()
+        out = StringIO()
+        call_command(
+            'benchmark_api', '--users=2', '--courses=4', '--lessons=8', '--subscriptions=4', '--payments=4',
+            '--concurrency=1', '--requests=30', '--json', stdout=out
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['total']['requests'], sum(row['requests'] for row in report['endpoints'].values()))
+        self.assertIn('lesson-detail', report['endpoints'])
+        self.assertEqual(report['endpoints']['lesson-detail']['errors'], 0)
+        self.assertIsNotNone(report['endpoints']['lesson-detail']['queries_per_request'])
+        self.assertEqual(Lesson.objects.filter(owner__username__startswith='bench_').count(), 8)
+
+
+class BenchmarkConnectionReuseTests(TransactionTestCase):
+    databases = '__all__'
+
+    def run_benchmark(self, conn_max_age):
+        out = StringIO()
+        call_command(
+            'benchmark_api', '--users=1', '--courses=2', '--lessons=2', '--subscriptions=1', '--payments=1',
+            '--concurrency=1', '--requests=10', f'--conn-max-age={conn_max_age}', '--json', stdout=out
+        )
+        return json.loads(out.getvalue())
+
+    def test_persistent_connections_skip_reconnects(self):
+        cache.clear()
+        per_request = self.run_benchmark(0)
+        persistent = self.run_benchmark(600)
+        self.assertEqual(per_request['conn_max_age'], 0)
+        self.assertGreaterEqual(per_request['db_connections_opened'], per_request['total']['requests'])
+        self.assertLessEqual(persistent['db_connections_opened'], len(settings.DATABASES))
+        self.assertEqual(persistent['total']['errors'], 0)
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], settings.DATABASES['default']['CONN_MAX_AGE'])
+
+
+class LessonBulkTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='user1',
+            email='user1@example.com',
+            password='User1_Python2025'
+        )
+        self.client.force_login(self.user)
+        self.course = Course.objects.create(
+            title='Test Course',
+            description='Test Description',
+            owner=self.user
+        )
+
+    def lessons_payload(self, count):
+        return [
+            {'title': f'Lesson {i}', 'description': 'Description', 'course': self.course.id}
+            for i in range(count)
+        ]
+
+    def test_bulk_create_constant_queries(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.post('/api/lessons/bulk/', self.lessons_payload(2), format='json')
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post('/api/lessons/bulk/', self.lessons_payload(50), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 50)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertEqual(Lesson.objects.filter(owner=self.user).count(), 52)
+
+    def test_bulk_ndjson(self):
+        body = '\n'.join(json.dumps(item) for item in self.lessons_payload(3)) + '\n'
+        response = self.client.post('/api/lessons/bulk/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result['status'] for result in response.data['results']], ['created'] * 3)
+
+    def test_bulk_update(self):
+        lesson = Lesson.objects.create(title='Old', description='Description', course=self.course, owner=self.user)
+        response = self.client.post('/api/lessons/bulk/', [{'id': lesson.id, 'title': 'New'}], format='json')
+        self.assertEqual(response.status_code, 200)
+        lesson.refresh_from_db()
+        self.assertEqual(lesson.title, 'New')
+
+    def test_bulk_is_all_or_nothing(self):
+        payload = self.lessons_payload(2) + [{'title': 'No course', 'description': 'Description'}]
+        payload.append({'title': 'Bad course', 'description': 'Description', 'course': self.course.id + 1000})
+        response = self.client.post('/api/lessons/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [2])
+        self.assertFalse(Lesson.objects.exists())
+        response = self.client.post('/api/lessons/bulk/', [payload[0], payload[3]], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertFalse(Lesson.objects.exists())
+
+    def test_bulk_update_foreign_lesson(self):
+        other = get_user_model().objects.create_user(
+            username='user2',
+            email='user2@example.com',
+            password='User2_Python2025'
+        )
+        lesson = Lesson.objects.create(title='Foreign', description='Description', course=self.course, owner=other)
+        response = self.client.post('/api/lessons/bulk/', [{'id': lesson.id, 'title': 'Hijacked'}], format='json')
+        self.assertEqual(response.status_code, 400)
+        lesson.refresh_from_db()
+        self.assertEqual(lesson.title, 'Foreign')
+
+    def test_bulk_validates_links_once_per_batch(self):
+        payload = self.lessons_payload(3)
+        payload[0]['video_link'] = 'https://youtu.be/dQw4w9WgXcQ?t=42'
+        payload[1]['video_link'] = 'invalid-link'
+        payload[2]['video_link'] = 'invalid-link'
+        with patch('lms.serializers.validate_many', wraps=validate_many) as validator:
+            response = self.client.post('/api/lessons/bulk/', payload, format='json')
+        self.assertEqual(validator.call_count, 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertIn('video_link', response.data['errors'][0]['errors'])
+
+        payload[1]['video_link'] = payload[2]['video_link'] = 'https://example.com/video'
+        response = self.client.post('/api/lessons/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        lesson = Lesson.objects.get(pk=response.data['results'][0]['id'])
+        self.assertEqual(lesson.video_id, 'dQw4w9WgXcQ')
+
+        response = self.client.post('/api/lessons/bulk/', [{'id': lesson.id, 'video_link': ''}], format='json')
+        self.assertEqual(response.status_code, 200)
+        lesson.refresh_from_db()
+        self.assertIsNone(lesson.video_id)
+
+
+class VideoLinkTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='user1',
+            email='user1@example.com',
+            password='User1_Python2025'
+        )
+        self.client.force_login(self.user)
+        self.course = Course.objects.create(title='Test Course', description='Test Description', owner=self.user)
+
+    def test_canonical_video_id(self):
+        for link in (
+            'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+            'https://youtu.be/dQw4w9WgXcQ?t=10',
+            'https://www.youtube.com/watch?feature=share&v=dQw4w9WgXcQ#t=1',
+            'https://m.youtube.com/shorts/dQw4w9WgXcQ',
+            'youtube.com/embed/dQw4w9WgXcQ',
+        ):
+            self.assertEqual(youtube_video_id(link), 'dQw4w9WgXcQ', link)
+        for link in ('https://example.com/watch?v=dQw4w9WgXcQ', 'https://youtu.be/short', None, ''):
+            self.assertIsNone(youtube_video_id(link), link)
+
+    def test_validate_many(self):
+        video_ids, errors = validate_many([
+            'https://youtu.be/dQw4w9WgXcQ', 'https://example.com/video', 'invalid-link', None,
+            'youtube.com/watch?v=dQw4w9WgXcQ', 'https://youtu.be/dQw4w9WgXcQ broken',
+        ])
+        self.assertEqual(video_ids, ['dQw4w9WgXcQ', None, None, None, None, None])
+        self.assertEqual(sorted(errors), [2, 4, 5])
+
+    def test_video_id_follows_link_and_filters_duplicates(self):
+        response = self.client.post('/api/lessons/', {
+            'title': 'Lesson', 'description': 'D', 'course': self.course.id,
+            'video_link': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=5',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['video_id'], 'dQw4w9WgXcQ')
+        Lesson.objects.create(title='Other', description='D', course=self.course, owner=self.user,
+                              video_link='https://example.com/video')
+
+        response = self.client.get('/api/lessons/', {'video': 'https://youtu.be/dQw4w9WgXcQ'})
+        self.assertEqual([row['title'] for row in response.data['results']], ['Lesson'])
+
+        lesson_id = response.data['results'][0]['id']
+        response = self.client.put(f'/api/lessons/{lesson_id}/', {'video_link': 'https://example.com/other'})
+        self.assertIsNone(response.data['video_id'])
+        self.assertFalse(Lesson.objects.filter(video_id='dQw4w9WgXcQ').exists())
+
+
+class AsyncViewsTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='user1',
+            email='user1@example.com',
+            password='User1_Python2025'
+        )
+        self.user2 = get_user_model().objects.create_user(
+            username='user2',
+            email='user2@example.com',
+            password='User2_Python2025'
+        )
+        self.async_client.force_login(self.user)
+        self.course = Course.objects.create(
+            title='Test Course',
+            description='Test Description',
+            owner=self.user
+        )
+        self.lesson = Lesson.objects.create(
+            title='Test Lesson',
+            description='Test Description',
+            course=self.course,
+            owner=self.user
+        )
+
+    async def test_course_list_and_create(self):
+        response = await self.async_client.post(
+            '/api/async/courses/', {'title': 'Async Course', 'description': 'Description'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        response = await self.async_client.get('/api/async/courses/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([course['title'] for course in response.json()['results']], ['Async Course', 'Test Course'])
+
+    async def test_lesson_detail_update_delete(self):
+        response = await self.async_client.put(
+            f'/api/async/lessons/{self.lesson.id}/', {'title': 'Updated'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'Updated')
+        response = await self.async_client.delete(f'/api/async/lessons/{self.lesson.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(await Lesson.objects.filter(id=self.lesson.id).aexists())
+
+    async def test_lesson_not_owner(self):
+        await sync_to_async(self.async_client.force_login)(self.user2)
+        response = await self.async_client.get(f'/api/async/lessons/{self.lesson.id}/')
+        self.assertEqual(response.status_code, 403)
+
+    async def test_lesson_create_unknown_course(self):
+        response = await self.async_client.post(
+            '/api/async/lessons/', {'title': 'Lesson', 'description': 'Description', 'course': self.course.id + 1000},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    async def test_subscribe_and_unsubscribe(self):
+        response = await self.async_client.post('/api/async/subscriptions/', {'course': self.course.id})
+        self.assertEqual(response.status_code, 201)
+        response = await self.async_client.post('/api/async/subscriptions/', {'course': self.course.id})
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.delete(f'/api/async/subscriptions/{self.course.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(await Subscription.objects.filter(user=self.user).aexists())
+
+    async def test_unauthenticated(self):
+        await sync_to_async(self.async_client.logout)()
+        response = await self.async_client.get('/api/async/lessons/')
+        self.assertEqual(response.status_code, 403)
+
+
+class LessonOwnershipQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='user1',
+            email='user1@example.com',
+            password='User1_Python2025'
+        )
+        self.user2 = get_user_model().objects.create_user(
+            username='user2',
+            email='user2@example.com',
+            password='User2_Python2025'
+        )
+        self.course = Course.objects.create(
+            title='Test Course',
+            description='Test Description',
+            owner=self.user
+        )
+        self.lesson = Lesson.objects.create(
+            title='Test Lesson',
+            description='Test Description',
+            course=self.course,
+            owner=self.user
+        )
+
+    @staticmethod
+    def table_queries(context, table):
+        return [query['sql'] for query in context.captured_queries if f'FROM "{table}"' in query['sql']]
+
+    def test_owner_read_is_single_lesson_query(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/api/lessons/{self.lesson.id}/')
+        self.assertEqual(response.status_code, 200)
+        lesson_queries = self.table_queries(context, 'lms_lesson')
+        self.assertEqual(len(lesson_queries), 1)
+        self.assertIn('"lms_lesson"."owner_id" =', lesson_queries[0])
+        # Пользователь грузится только аутентификацией, не через lesson.owner
+        self.assertEqual(len(self.table_queries(context, 'users_user')), 1)
+
+    def test_foreign_lesson_does_not_load_row(self):
+        self.client.force_login(self.user2)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.put(f'/api/lessons/{self.lesson.id}/update/', {'title': 'Hijacked'})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(len(self.table_queries(context, 'lms_lesson')), 2)
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.title, 'Test Lesson')
+
+    def test_missing_lesson(self):
+        self.client.force_login(self.user)
+        response = self.client.delete(f'/api/lessons/{self.lesson.id + 1000}/delete/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_update_refreshes_updated_at(self):
+        self.client.force_login(self.user)
+        before = self.lesson.updated_at
+        self.client.put(f'/api/lessons/{self.lesson.id}/', {'title': 'Updated'})
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.title, 'Updated')
+        self.assertGreater(self.lesson.updated_at, before)
+
+
+class CourseCountersTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='user1',
+            email='user1@example.com',
+            password='User1_Python2025'
+        )
+        self.client.force_login(self.user)
+        self.course = Course.objects.create(
+            title='Test Course',
+            description='Test Description',
+            owner=self.user
+        )
+
+    def test_counters_follow_lessons_and_subscriptions(self):
+        self.client.post('/api/lessons/', {'title': 'Lesson', 'description': 'D', 'course': self.course.id})
+        self.client.post('/api/lessons/bulk/', [
+            {'title': f'Lesson {i}', 'description': 'D', 'course': self.course.id} for i in range(3)
+        ], format='json')
+        self.client.post('/api/subscriptions/', {'course': self.course.id})
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.lessons_count, self.course.subscribers_count), (4, 1))
+
+        Lesson.objects.filter(course=self.course).first().delete()
+        self.client.delete(f'/api/subscriptions/{self.course.id}/')
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.lessons_count, self.course.subscribers_count), (3, 0))
+
+    def test_list_exposes_counters_without_count_queries(self):
+        Lesson.objects.create(title='Lesson', description='D', course=self.course, owner=self.user)
+        # Кэш ответа по курсам сбрасывается вместе со счётчиком
+        self.client.get('/api/courses/')
+        Subscription.objects.create(user=self.user, course=self.course)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/courses/')
+        result = response.data['results'][0]
+        self.assertEqual((result['lessons_count'], result['subscribers_count']), (1, 1))
+        self.assertFalse([q for q in context.captured_queries if 'COUNT(' in q['sql'].upper()])
+
+    def test_counters_are_read_only(self):
+        response = self.client.patch(f'/api/courses/{self.course.id}/', {'lessons_count': 100})
+        self.assertEqual(response.status_code, 200)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.lessons_count, 0)
+
+    def test_update_keeps_counter_changes_made_after_load(self):
+        def load_then_add_lesson(queryset, **lookup):
+            course = get_object_or_404(queryset, **lookup)
+            # Урок создан параллельно, пока запрос держит курс в памяти
+            Lesson.objects.create(title='Lesson', description='D', course=self.course, owner=self.user)
+            return course
+
+        with patch('lms.views.get_object_or_404', side_effect=load_then_add_lesson):
+            response = self.client.put(
+                f'/api/courses/{self.course.id}/', {'title': 'New', 'description': 'D', 'owner': self.user.id}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.title, self.course.lessons_count), ('New', 1))
+
+    def test_save_still_inserts_copies_and_deleted_rows(self):
+        Lesson.objects.create(title='Lesson', description='D', course=self.course, owner=self.user)
+        self.course.refresh_from_db()
+        original_id = self.course.pk
+        self.course.pk = None
+        self.course.save()
+        self.assertNotEqual(self.course.pk, original_id)
+        self.assertEqual(Course.objects.get(pk=self.course.pk).lessons_count, 1)
+
+        Course.objects.filter(pk=self.course.pk).delete()
+        self.course.title = 'Restored'
+        self.course.save()
+        self.assertEqual(Course.objects.get(pk=self.course.pk).title, 'Restored')
+
+    def delete_course_queries(self, rows):
+        course = Course.objects.create(title=f'Course {rows}', description='D', owner=self.user)
+        for i in range(rows):
+            student = get_user_model().objects.create_user(
+                username=f'student{rows}_{i}', email=f'student{rows}_{i}@example.com', password='Student_Python2025'
+            )
+            Subscription.objects.create(user=student, course=course)
+            Lesson.objects.create(title=f'Lesson {i}', description='D', course=course, owner=self.user)
+        with CaptureQueriesContext(connection) as context:
+            course.delete()
+        self.assertFalse(Subscription.objects.filter(course_id=course.id).exists())
+        self.assertFalse(FeedItem.objects.filter(course_id=course.id).exists())
+        return len(context.captured_queries)
+
+    def test_course_delete_cascades_without_per_row_queries(self):
+        self.assertEqual(self.delete_course_queries(2), self.delete_course_queries(20))
+
+    def test_user_delete_releases_counters_of_other_courses(self):
+        student = get_user_model().objects.create_user(
+            username='student', email='student@example.com', password='Student_Python2025'
+        )
+        Subscription.objects.create(user=student, course=self.course)
+        Lesson.objects.create(title='Guest lesson', description='D', course=self.course, owner=student)
+        Subscription.objects.create(user=self.user, course=self.course)
+        student.delete()
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.lessons_count, self.course.subscribers_count), (0, 1))
+        self.assertFalse(FeedItem.objects.filter(user=student.id).exists())
+
+    def test_reconcile_repairs_drift(self):
+        other = Course.objects.create(title='Other', description='D', owner=self.user)
+        Lesson.objects.create(title='Lesson', description='D', course=self.course, owner=self.user)
+        Subscription.objects.create(user=self.user, course=other)
+        Course.objects.filter(pk=self.course.pk).update(lessons_count=7)
+        Course.objects.filter(pk=other.pk).update(subscribers_count=0)
+
+        result = reconcile_course_counters(batch_size=1)
+        self.assertIn('Repaired counters of 2 courses', result)
+        self.course.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.course.lessons_count, self.course.subscribers_count), (1, 0))
+        self.assertEqual((other.lessons_count, other.subscribers_count), (0, 1))
+        self.assertIn('Repaired counters of 0 courses', reconcile_course_counters())
+
+    def test_reconcile_prunes_feed_items_of_bulk_deleted_subscriptions(self):
+        Lesson.objects.create(title='Lesson', description='D', course=self.course, owner=self.user)
+        Subscription.objects.create(user=self.user, course=self.course)
+        self.assertTrue(FeedItem.objects.filter(user=self.user).exists())
+        Subscription.objects.filter(user=self.user).delete()
+        self.assertIn('pruned 1 orphaned feed items', reconcile_course_counters())
+        self.assertFalse(FeedItem.objects.exists())
+
+
+@override_settings(COURSE_UPDATE_NOTIFY_QUIET_WINDOW=300, COURSE_UPDATE_NOTIFY_MIN_INTERVAL=3600)
+class CourseUpdateNotificationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = get_user_model().objects.create_user(
+            username='owner',
+            email='owner@example.com',
+            password='Owner_Python2025'
+        )
+        self.course = Course.objects.create(
+            title='Test Course',
+            description='Test Description',
+            owner=self.owner
+        )
+        self.lessons = [
+            Lesson.objects.create(title=f'Lesson {i}', description='D', course=self.course, owner=self.owner)
+            for i in range(5)
+        ]
+
+    @patch('lms.tasks.fanout_lesson_to_feeds.delay')
+    def test_burst_of_edits_is_coalesced(self, fanout):
+        with patch('lms.tasks.dispatch_course_update_email.apply_async') as apply_async:
+            for lesson in self.lessons:
+                lesson.title += ' (edited)'
+                lesson.save()
+            self.course.title = 'Renamed'
+            self.course.save()
+            relay_outbox()
+            # Правка уже после ретрансляции схлопывается дебаунсом
+            self.course.save()
+            relay_outbox()
+        apply_async.assert_called_once_with((self.course.id,), countdown=300)
+        stats = get_notification_stats()
+        self.assertEqual((stats['scheduled'], stats['coalesced']), (1, 1))
+
+    def test_dispatch_waits_for_quiet_window(self):
+        with patch('lms.tasks.dispatch_course_update_email.apply_async') as apply_async:
+            schedule_course_update_email(self.course.id)
+            result = dispatch_course_update_email(self.course.id)
+        self.assertIn('Postponed', result)
+        self.assertGreater(apply_async.call_args.kwargs['countdown'], 0)
+
+    @override_settings(COURSE_UPDATE_NOTIFY_QUIET_WINDOW=0)
+    def test_dispatch_sends_once_then_rate_limits(self):
+        with patch('lms.tasks.dispatch_course_update_email.apply_async') as apply_async, \
+                patch('lms.tasks.send_course_update_email') as send:
+            schedule_course_update_email(self.course.id)
+            dispatch_course_update_email(self.course.id)
+            # Маркер снят: следующая правка планирует новую задачу
+            schedule_course_update_email(self.course.id)
+            result = dispatch_course_update_email(self.course.id)
+        send.assert_called_once_with(self.course.id)
+        self.assertEqual(apply_async.call_count, 3)
+        self.assertIn('Rate limited', result)
+        self.assertEqual(get_notification_stats()['rate_limited'], 1)
+        self.assertIn('No pending', dispatch_course_update_email(self.course.id + 1000))
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = get_user_model().objects.create_user(
+            username='owner',
+            email='owner@example.com',
+            password='Owner_Python2025'
+        )
+        self.course = Course.objects.create(title='Test Course', description='Test Description', owner=self.owner)
+
+    def test_write_path_only_inserts_event(self):
+        with patch('lms.tasks.dispatch_course_update_email.apply_async') as apply_async:
+            self.course.title = 'Renamed'
+            self.course.save()
+            Lesson.objects.create(title='Lesson', description='D', course=self.course, owner=self.owner)
+        apply_async.assert_not_called()
+        lesson = Lesson.objects.get()
+        self.assertEqual(list(OutboxEvent.objects.order_by('id').values_list('topic', 'payload')), [
+            (OutboxEvent.COURSE_UPDATED, {'course_id': self.course.id}),
+            (OutboxEvent.COURSE_UPDATED, {'course_id': self.course.id}),
+            (OutboxEvent.LESSON_CREATED, {'lesson_id': lesson.id}),
+        ])
+
+    def test_event_rolls_back_with_change(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.course.title = 'Renamed'
+            self.course.save()
+            raise RuntimeError
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_relay_keeps_events_when_broker_fails(self):
+        other = Course.objects.create(title='Other', description='D', owner=self.owner)
+        for course in (self.course, other, self.course):
+            course.save()
+        with patch('lms.tasks.dispatch_course_update_email.apply_async', side_effect=ConnectionError) as apply_async:
+            with self.assertRaises(ConnectionError):
+                relay_outbox()
+        self.assertEqual(OutboxEvent.objects.count(), 3)
+        apply_async.assert_called_once()
+
+        # Неудачная постановка не оставляет маркер: повтор ставит задачу, а не схлопывается
+        with patch('lms.tasks.dispatch_course_update_email.apply_async') as apply_async:
+            self.assertIn('Relayed 3 outbox events', relay_outbox(batch_size=2))
+        self.assertEqual([call.args[0] for call in apply_async.call_args_list], [(self.course.id,), (other.id,)])
+        self.assertFalse(OutboxEvent.objects.exists())
+
+
+class FeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.owner = get_user_model().objects.create_user(
+            username='owner',
+            email='owner@example.com',
+            password='Owner_Python2025'
+        )
+        self.student = get_user_model().objects.create_user(
+            username='student',
+            email='student@example.com',
+            password='Student_Python2025'
+        )
+        self.client.force_login(self.student)
+        self.course = Course.objects.create(title='Python', description='D', owner=self.owner)
+        self.other = Course.objects.create(title='Django', description='D', owner=self.owner)
+        self.lessons = [
+            Lesson.objects.create(title=f'Lesson {i}', description='D', course=self.course, owner=self.owner)
+            for i in range(3)
+        ]
+
+    def relay(self):
+        # Раскладка урока выполняется сразу, без брокера
+        with patch('lms.tasks.fanout_lesson_to_feeds.delay', side_effect=fanout_lesson_to_feeds), \
+                patch('lms.tasks.schedule_course_update_email'):
+            relay_outbox()
+
+    def feed_titles(self, **params):
+        response = self.client.get('/api/feed/', params)
+        self.assertEqual(response.status_code, 200)
+        return [item['lesson']['title'] for item in response.data['results']]
+
+    @override_settings(FEED_BACKFILL_LESSONS=2)
+    def test_subscribe_backfills_latest_lessons(self):
+        self.relay()
+        self.assertEqual(self.feed_titles(), [])
+        self.client.post('/api/subscriptions/', {'course': self.course.id})
+        self.assertEqual(self.feed_titles(), ['Lesson 2', 'Lesson 1'])
+
+    def test_new_lessons_fan_out_to_subscribers(self):
+        Subscription.objects.create(user=self.student, course=self.course)
+        Subscription.objects.create(user=self.student, course=self.other)
+        Lesson.objects.create(title='Fresh', description='D', course=self.other, owner=self.owner)
+        self.client.force_login(self.owner)
+        self.client.post('/api/lessons/bulk/', [{'title': 'Bulk', 'description': 'D', 'course': self.course.id}],
+                         format='json')
+        self.client.force_login(self.student)
+        self.relay()
+        self.assertEqual(self.feed_titles(), ['Bulk', 'Fresh', 'Lesson 2', 'Lesson 1', 'Lesson 0'])
+        self.assertEqual(self.feed_titles(course=self.other.id), ['Fresh'])
+        response = self.client.get('/api/feed/')
+        self.assertEqual(response.data['results'][0]['course'], {'id': self.course.id, 'title': 'Python'})
+        # Повторная доставка события не дублирует записи
+        self.assertIn('of 1 subscribers', fanout_lesson_to_feeds(self.lessons[0].id))
+        self.assertEqual(len(self.feed_titles()), 5)
+
+    def test_unsubscribe_and_delete_trim_feed(self):
+        self.client.post('/api/subscriptions/', {'course': self.course.id})
+        self.lessons[0].delete()
+        self.assertEqual(self.feed_titles(), ['Lesson 2', 'Lesson 1'])
+        self.client.delete(f'/api/subscriptions/{self.course.id}/')
+        self.assertEqual(self.feed_titles(), [])
+
+    def test_bulk_subscriptions_update_feeds(self):
+        self.client.force_login(self.owner)
+        self.owner.is_staff = True
+        self.owner.save()
+        payload = {'courses': [self.course.id], 'users': [self.student.id]}
+        self.client.post('/api/subscriptions/bulk/', payload, format='json')
+        self.client.force_login(self.student)
+        self.assertEqual(len(self.feed_titles()), 3)
+        self.client.delete('/api/subscriptions/bulk/', {'courses': [self.course.id]}, format='json')
+        self.assertEqual(self.feed_titles(), [])
+
+    def test_feed_read_is_single_query_per_page(self):
+        Subscription.objects.create(user=self.student, course=self.course)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/feed/', {'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+        feed_queries = [q for q in context.captured_queries if 'lms_feeditem' in q['sql']]
+        self.assertEqual(len(feed_queries), 1)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([item['lesson']['title'] for item in response.data['results']], ['Lesson 0'])
+
+
+class CeleryRoutingTests(TestCase):
+    def test_tasks_are_routed_to_dedicated_queues(self):
+        routes = {
+            'lms.tasks.send_course_update_email_chunk': 'notifications',
+            'lms.tasks.dispatch_course_update_email': 'notifications',
+            'lms.tasks.fanout_lesson_to_feeds': 'notifications',
+            'lms.tasks.relay_outbox': 'default',
+            'users.tasks.deactivate_inactive_users': 'maintenance',
+            'config.celery.debug_task': 'default',
+        }
+        for task, queue in routes.items():
+            self.assertEqual(celery_app.amqp.router.route({}, task)['queue'].name, queue)
+        self.assertTrue(celery_app.conf.task_acks_late)
+        scheduled = {entry['task'] for entry in celery_app.conf.beat_schedule.values()}
+        self.assertIn('users.tasks.deactivate_inactive_users', scheduled)
+        self.assertEqual(celery_app.conf.beat_schedule['relay-outbox']['schedule'], settings.OUTBOX_RELAY_INTERVAL)
+        self.assertLess(celery_app.conf.task_annotations['lms.tasks.send_course_update_email_chunk']['soft_time_limit'],
+                        celery_app.conf.broker_transport_options['visibility_timeout'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], DB_REPLICA_STICKY_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def handle(self, method, write=False, **headers):
+        routes = []
+
+        def view(request):
+            routes.append(router.db_for_read(Course))
+            if write:
+                router.db_for_write(Course)
+                routes.append(router.db_for_read(Course))
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(getattr(self.factory, method)('/api/courses/', **headers))
+        return routes
+
+    def test_safe_reads_go_to_replica_until_write(self):
+        self.assertEqual(self.handle('get', write=True, HTTP_AUTHORIZATION='Bearer a'), ['replica', 'default'])
+        # Чтения того же клиента после записи остаются в default, другие клиенты читают с реплики
+        self.assertEqual(self.handle('get', HTTP_AUTHORIZATION='Bearer a'), ['default'])
+        self.assertEqual(self.handle('get', HTTP_AUTHORIZATION='Bearer b'), ['replica'])
+
+    def test_unsafe_request_pins_client_to_primary(self):
+        self.factory.cookies['sessionid'] = 'session'
+        self.assertEqual(self.handle('post'), ['default'])
+        self.assertEqual(self.handle('get'), ['default'])
+        cache.clear()
+        self.assertEqual(self.handle('get'), ['replica'])
+
+    def test_cache_fills_read_from_primary(self):
+        routes = []
+
+        class View:
+            @cached_response('replica-test')
+            def get(self, request):
+                routes.append(router.db_for_read(Course))
+                return Response({})
+
+        def view(request):
+            request.user = SimpleNamespace(pk=1)
+            View().get(request)
+            routes.append(router.db_for_read(Course))
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(self.factory.get('/api/courses/'))
+        self.assertEqual(routes, ['default', 'replica'])
+
+    def test_tasks_opt_into_replica_reads(self):
+        self.assertEqual(router.db_for_read(Course), 'default')
+        with replica_reads(sticky=False):
+            router.db_for_write(Course)
+            self.assertEqual(router.db_for_read(Course), 'replica')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Course), 'replica')
+            router.db_for_write(Course)
+            self.assertEqual(router.db_for_read(Course), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'lms'))
+        self.assertTrue(router.allow_migrate('default', 'lms'))
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='user1',
+            email='user1@example.com',
+            password='User1_Python2025'
+        )
+        self.other = get_user_model().objects.create_user(
+            username='user2',
+            email='user2@example.com',
+            password='User2_Python2025'
+        )
+        self.client.force_login(self.user)
+        self.python = Course.objects.create(
+            title='Программирование на Python', description='Основы языка и библиотеки', owner=self.other
+        )
+        self.django = Course.objects.create(
+            title='Web development with Django', description='Building web applications', owner=self.other
+        )
+        self.guitar = Course.objects.create(title='Гитара', description='Аккорды и python-скрипты', owner=self.other)
+
+    def test_courses_ranked_by_stem_in_both_languages(self):
+        response = self.client.get('/api/search/courses/', {'q': 'программированию'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['mode'], 'fts')
+        self.assertEqual([row['id'] for row in response.data['results']], [self.python.id])
+
+        response = self.client.get('/api/search/courses/', {'q': 'applications'})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.django.id])
+
+        # Совпадение в названии весит больше, чем в описании
+        response = self.client.get('/api/search/courses/', {'q': 'python'})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.python.id, self.guitar.id])
+        self.assertGreater(response.data['results'][0]['rank'], response.data['results'][1]['rank'])
+
+    def test_vector_follows_updates(self):
+        self.python.title = 'Kotlin для начинающих'
+        self.python.save()
+        response = self.client.get('/api/search/courses/', {'q': 'kotlin'})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.python.id])
+        self.assertNotIn('search_vector', response.data['results'][0])
+
+    def test_typo_falls_back_to_trigram(self):
+        response = self.client.get('/api/search/courses/', {'q': 'Djngo development'})
+        self.assertEqual(response.data['mode'], 'trigram')
+        self.assertEqual([row['id'] for row in response.data['results']], [self.django.id])
+
+    def test_cursor_pagination(self):
+        for i in range(3):
+            Course.objects.create(title=f'Python {i}', description='Python', owner=self.other)
+        response = self.client.get('/api/search/courses/', {'q': 'python', 'page_size': 2})
+        seen = [row['id'] for row in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen += [row['id'] for row in response.data['results']]
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_lessons_scoped_to_own_and_subscribed(self):
+        own_course = Course.objects.create(title='Own', description='D', owner=self.user)
+        own = Lesson.objects.create(title='Декораторы', description='D', course=own_course, owner=self.user)
+        subscribed = Lesson.objects.create(title='Декораторы Python', description='D', course=self.python,
+                                           owner=self.other)
+        Lesson.objects.create(title='Декораторы Django', description='D', course=self.django, owner=self.other)
+        Subscription.objects.create(user=self.user, course=self.python)
+        Subscription.objects.create(user=self.other, course=own_course)
+
+        response = self.client.get('/api/search/lessons/', {'q': 'декораторы'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({row['id'] for row in response.data['results']}, {own.id, subscribed.id})
+
+    def test_short_query_rejected(self):
+        self.assertEqual(self.client.get('/api/search/courses/', {'q': 'p'}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/search/courses/', {'q': 'python'}).status_code, 403)
@@ -1,11 +1,66 @@
 from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
 import re
 
+# Шаблоны компилируются один раз при импорте, а не на каждый вызов
+YOUTUBE_LINK_RE = re.compile(r'^(https?://)?(www\.)?(youtube\.com|youtu\.be)/.+$')
+# watch?v=, embed/, shorts/, live/, v/ и короткие ссылки youtu.be; id ролика — 11 символов
+YOUTUBE_VIDEO_RE = re.compile(
+    r'^(?P<scheme>https?://)?(?:(?:www|m|music)\.)?'
+    r'(?:youtube\.com/(?:watch\?(?:[^#\s]*&)?v=|embed/|shorts/|live/|v/)|youtu\.be/)'
+    r'(?P<id>[A-Za-z0-9_-]{11})(?P<rest>(?:[?&#/]\S*)?)$'
+)
+
+YOUTUBE_LINK_MESSAGE = (
+    'Ссылки на сторонние ресурсы запрещены. Разрешены только ссылки на YouTube (youtube.com или youtu.be).'
+)
+
+_url_validator = URLValidator()
+
 
 def validate_youtube_link(value):
     if not value:
         return
-    youtube_regex = r'^(https?://)?(www\.)?(youtube\.com|youtu\.be)/.+$'
-    if not re.match(youtube_regex, value):
-        raise ValidationError(
-            'Ссылки на сторонние ресурсы запрещены. Разрешены только ссылки на YouTube (youtube.com или youtu.be).')
+    if not YOUTUBE_LINK_RE.match(value):
+        raise ValidationError(YOUTUBE_LINK_MESSAGE)
+
+
+def youtube_video_id(value):
+    """id ролика YouTube из ссылки любого вида или None, если это не ссылка на ролик."""
+    if not value:
+        return None
+    match = YOUTUBE_VIDEO_RE.match(value)
+    return match['id'] if match else None
+
+
+def clean_video_link(value):
+    """Проверяет ссылку на видео как URLField и возвращает канонический id ролика YouTube (или None)."""
+    if not value:
+        return None
+    match = YOUTUBE_VIDEO_RE.match(value)
+    if match and match['scheme']:
+        # Ссылка на ролик со схемой уже корректный URL — полная проверка URLValidator не нужна
+        return match['id']
+    _url_validator(value)
+    return match['id'] if match else None
+
+
+def validate_many(values):
+    """
+    Пакетная проверка ссылок: одинаковые значения проверяются один раз.
+    Возвращает (video_ids, errors): id роликов по порядку значений и {индекс: сообщения}.
+    """
+    checked = {}
+    video_ids = []
+    errors = {}
+    for index, value in enumerate(values):
+        if value not in checked:
+            try:
+                checked[value] = (clean_video_link(value), None)
+            except ValidationError as exc:
+                checked[value] = (None, exc.messages)
+        video_id, messages = checked[value]
+        video_ids.append(video_id)
+        if messages:
+            errors[index] = messages
+    return video_ids, errors
@@ -1,11 +1,28 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, viewsets
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.exceptions import NotAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.exceptions import NotAuthenticated, PermissionDenied
+from rest_framework.parsers import JSONParser
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import IntegrityError, transaction
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
 from django.shortcuts import get_object_or_404
-from lms.models import Lesson, Course, Subscription
-from lms.serializers import LessonSerializer, SubscriptionSerializer, CourseSerializer
+from lms.models import FeedItem, Lesson, Course, Subscription
+from lms.serializers import (LessonSerializer, SubscriptionSerializer, CourseSerializer, LessonBulkItemSerializer,
+                             SubscriptionBulkSerializer, FeedItemSerializer, optimize_queryset)
+from lms.parsers import NDJSONParser
+from lms.services import bulk_save_lessons, subscribe_many, unsubscribe_many
+from lms.validators import youtube_video_id
+from users.groups import is_moderator
+from users.models import User
+from users.permissions import get_owned_object
+from lms.paginators import CoursePagination, FeedPagination, LessonPagination, SearchPagination
+from lms.cache import cached_response, get_cache_stats
+from lms.profiling import load_metrics
 
 
 class IsAuthenticatedCustom(IsAuthenticated):
@@ -19,11 +36,16 @@ class CourseViewSet(viewsets.GenericViewSet):
     permission_classes = [IsAuthenticatedCustom]
     serializer_class = CourseSerializer
     queryset = Course.objects.all()
+    pagination_class = CoursePagination
 
+    @cached_response('course-list')
     def list(self, request):
         courses = self.queryset.filter(owner=request.user)
-        serializer = self.get_serializer(courses, many=True)
-        return Response(serializer.data)
+        if self.paginator.is_streaming(request):
+            return self.paginator.get_streaming_response(courses, self.get_serializer_class(), request)
+        page = self.paginate_queryset(courses)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def create(self, request):
         serializer = self.get_serializer(data=request.data)
@@ -32,6 +54,7 @@ class CourseViewSet(viewsets.GenericViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @cached_response('course-detail')
     def retrieve(self, request, pk=None):
         course = get_object_or_404(self.queryset, pk=pk, owner=request.user)
         serializer = self.get_serializer(course)
@@ -62,10 +85,21 @@ class CourseViewSet(viewsets.GenericViewSet):
 class LessonListCreateView(APIView):
     permission_classes = [IsAuthenticatedCustom]
 
+    pagination_class = LessonPagination
+
+    @cached_response('lesson-list')
     def get(self, request):
         lessons = Lesson.objects.filter(owner=request.user)
-        serializer = LessonSerializer(lessons, many=True)
-        return Response(serializer.data)
+        video = request.query_params.get('video')
+        if video:
+            # ?video= принимает ссылку любого вида или сам id ролика
+            lessons = lessons.filter(video_id=youtube_video_id(video) or video)
+        paginator = self.pagination_class()
+        if paginator.is_streaming(request):
+            return paginator.get_streaming_response(lessons, LessonSerializer, request)
+        page = paginator.paginate_queryset(lessons, request, view=self)
+        serializer = LessonSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request):
         serializer = LessonSerializer(data=request.data)
@@ -75,57 +109,98 @@ class LessonListCreateView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class LessonDetailView(APIView):
+class LessonBulkView(APIView):
     permission_classes = [IsAuthenticatedCustom]
+    parser_classes = [JSONParser, NDJSONParser]
 
-    def get(self, request, pk):
-        lesson = get_object_or_404(Lesson, pk=pk)
-        if lesson.owner != request.user:
-            return Response(status=status.HTTP_403_FORBIDDEN)
-        serializer = LessonSerializer(lesson)
-        return Response(serializer.data)
+    def post(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'detail': 'Ожидается список уроков.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.LESSON_BULK_MAX_ITEMS:
+            return Response(
+                {'detail': f'Не больше {settings.LESSON_BULK_MAX_ITEMS} уроков за запрос.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-    def put(self, request, pk):
-        lesson = get_object_or_404(Lesson, pk=pk)
-        if lesson.owner != request.user:
-            return Response(status=status.HTTP_403_FORBIDDEN)
+        validated = []
+        indexes = []
+        errors = []
+        for index, item in enumerate(items):
+            partial = isinstance(item, dict) and 'id' in item
+            serializer = LessonBulkItemSerializer(data=item, partial=partial)
+            if serializer.is_valid():
+                validated.append(serializer.validated_data)
+                indexes.append(index)
+            else:
+                errors.append({'index': index, 'errors': serializer.errors})
+        for position, messages in LessonBulkItemSerializer.validate_video_links(validated).items():
+            errors.append({'index': indexes[position], 'errors': {'video_link': messages}})
+        if errors:
+            errors.sort(key=lambda error: error['index'])
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        results, errors = bulk_save_lessons(request.user, validated)
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        created = sum(1 for result in results if result['status'] == 'created')
+        return Response(
+            {'created': created, 'updated': len(results) - created, 'results': results},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+
+# Поля урока, которые нужны сериализатору; при записи ещё updated_at для auto_now
+LESSON_READ_FIELDS = ('id', 'title', 'description', 'video_link', 'video_id', 'course', 'owner')
+LESSON_WRITE_FIELDS = LESSON_READ_FIELDS + ('updated_at',)
+LESSON_DELETE_FIELDS = ('id', 'course', 'owner')
+
+
+class OwnedLessonMixin:
+    @staticmethod
+    def get_lesson(request, pk, fields=LESSON_READ_FIELDS):
+        return get_owned_object(Lesson.objects.only(*fields), request.user, pk=pk)
+
+    def update_lesson(self, request, pk):
+        lesson = self.get_lesson(request, pk, LESSON_WRITE_FIELDS)
         serializer = LessonSerializer(lesson, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    def delete(self, request, pk):
-        lesson = get_object_or_404(Lesson, pk=pk)
-        if lesson.owner != request.user:
-            return Response(status=status.HTTP_403_FORBIDDEN)
-        lesson.delete()
+    def delete_lesson(self, request, pk):
+        self.get_lesson(request, pk, LESSON_DELETE_FIELDS).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class LessonUpdateView(APIView):
+class LessonDetailView(OwnedLessonMixin, APIView):
     permission_classes = [IsAuthenticatedCustom]
 
+    @cached_response('lesson-detail')
+    def get(self, request, pk):
+        serializer = LessonSerializer(self.get_lesson(request, pk))
+        return Response(serializer.data)
+
     def put(self, request, pk):
-        lesson = get_object_or_404(Lesson, pk=pk)
-        if lesson.owner != request.user:
-            return Response(status=status.HTTP_403_FORBIDDEN)
-        serializer = LessonSerializer(lesson, data=request.data, partial=True)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return self.update_lesson(request, pk)
 
+    def delete(self, request, pk):
+        return self.delete_lesson(request, pk)
 
-class LessonDeleteView(APIView):
+
+class LessonUpdateView(OwnedLessonMixin, APIView):
+    permission_classes = [IsAuthenticatedCustom]
+
+    def put(self, request, pk):
+        return self.update_lesson(request, pk)
+
+
+class LessonDeleteView(OwnedLessonMixin, APIView):
     permission_classes = [IsAuthenticatedCustom]
 
     def delete(self, request, pk):
-        lesson = get_object_or_404(Lesson, pk=pk)
-        if lesson.owner != request.user:
-            return Response(status=status.HTTP_403_FORBIDDEN)
-        lesson.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.delete_lesson(request, pk)
 
 
 class SubscriptionView(APIView):
@@ -133,12 +208,179 @@ class SubscriptionView(APIView):
 
     def post(self, request):
         serializer = SubscriptionSerializer(data={'user': request.user.id, 'course': request.data.get('course')})
-        if serializer.is_valid():
-            serializer.save(user=request.user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        # Уникальность проверяет сама БД, без отдельного запроса на существование подписки
+        try:
+            with transaction.atomic():
+                serializer.save(user=request.user)
+        except IntegrityError:
+            return Response(
+                {'non_field_errors': ['Вы уже подписаны на этот курс.']}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, course_id):
         subscription = get_object_or_404(Subscription, user=request.user, course_id=course_id)
         subscription.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def _exact_rank(expression):
+    # ts_rank и similarity возвращают real; в курсор должно попасть его точное double-представление,
+    # иначе округлённое значение при сравнении снова вернёт последнюю строку страницы
+    return Cast(expression, FloatField())
+
+
+class SubscriptionBulkView(APIView):
+    """
+    Массовая подписка (POST) и отписка (DELETE) пар users x courses.
+    Подписывать других пользователей (users) могут только персонал и модераторы.
+    """
+    permission_classes = [IsAuthenticatedCustom]
+
+    def post(self, request):
+        pairs, error = self.get_pairs(request, check_exists=True)
+        if error:
+            return error
+        created, skipped = subscribe_many(pairs)
+        return Response(
+            {'created': created, 'skipped': skipped},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+    def delete(self, request):
+        pairs, error = self.get_pairs(request)
+        if error:
+            return error
+        deleted, skipped = unsubscribe_many(pairs)
+        return Response({'deleted': deleted, 'skipped': skipped})
+
+    @staticmethod
+    def get_pairs(request, check_exists=False):
+        serializer = SubscriptionBulkSerializer(data=request.data)
+        if not serializer.is_valid():
+            return None, Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        courses = list(dict.fromkeys(serializer.validated_data['courses']))
+        users = serializer.validated_data.get('users')
+        if users is None:
+            users = [request.user.id]
+        elif not (request.user.is_staff or is_moderator(request.user)):
+            raise PermissionDenied()
+        else:
+            users = list(dict.fromkeys(users))
+        if len(users) * len(courses) > settings.SUBSCRIPTION_BULK_MAX_PAIRS:
+            return None, Response(
+                {'detail': f'Не больше {settings.SUBSCRIPTION_BULK_MAX_PAIRS} подписок за запрос.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if check_exists:
+            # Существование курсов и пользователей — одним запросом на всю пачку
+            errors = {}
+            known = set(Course.objects.filter(id__in=courses).values_list('id', flat=True))
+            if missing := [course_id for course_id in courses if course_id not in known]:
+                errors['courses'] = [f'Курсы не существуют: {missing}.']
+            if users != [request.user.id]:
+                known = set(User.objects.filter(id__in=users).values_list('id', flat=True))
+                if missing := [user_id for user_id in users if user_id not in known]:
+                    errors['users'] = [f'Пользователи не существуют: {missing}.']
+            if errors:
+                return None, Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        return [(user_id, course_id) for user_id in users for course_id in courses], None
+
+
+class FeedView(APIView):
+    """Лента «моё обучение»: новые уроки курсов, на которые подписан пользователь, от свежих к старым."""
+    permission_classes = [IsAuthenticatedCustom]
+    pagination_class = FeedPagination
+
+    def get(self, request):
+        items = optimize_queryset(FeedItem.objects.filter(user_id=request.user.id), FeedItemSerializer)
+        course_id = request.query_params.get('course')
+        if course_id and course_id.isdigit():
+            items = items.filter(course_id=course_id)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(items, request, view=self)
+        return paginator.get_paginated_response(FeedItemSerializer(page, many=True).data)
+
+
+class SearchView(APIView):
+    """
+    Полнотекстовый поиск (?q=) с ранжированием по ts_rank. Если по словам ничего не нашлось,
+    ищем по похожести названия (pg_trgm) — это ловит опечатки. Режим фиксируется в ссылке next.
+    """
+    permission_classes = [IsAuthenticatedCustom]
+    pagination_class = SearchPagination
+    # Наследники задают queryset и serializer_class
+    queryset = None
+    serializer_class = None
+    min_query_length = 2
+
+    def get_queryset(self):
+        # .all() — новый QuerySet на каждый запрос, как в GenericAPIView
+        return self.queryset.all()
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if len(query) < self.min_query_length:
+            return Response(
+                {'q': [f'Не короче {self.min_query_length} символов.']}, status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset = optimize_queryset(self.get_queryset(), self.serializer_class)
+        paginator = self.pagination_class()
+        mode = request.query_params.get('mode')
+        page = None
+        if mode != 'trigram':
+            mode = 'fts'
+            page = paginator.paginate_queryset(self.full_text(queryset, query), request, view=self)
+        # На первой странице без совпадений переключаемся на нечёткий поиск
+        if mode == 'trigram' or (not page and paginator.cursor_query_param not in request.query_params):
+            mode = 'trigram'
+            page = paginator.paginate_queryset(self.trigram(queryset, query), request, view=self)
+
+        results = self.serializer_class(page, many=True).data
+        for item, row in zip(results, page):
+            item['rank'] = round(row.rank, 6)
+        data = paginator.get_paginated_data(results)
+        if data['next'] and mode == 'trigram':
+            data['next'] = replace_query_param(data['next'], 'mode', mode)
+        data['mode'] = mode
+        return Response(data)
+
+    @staticmethod
+    def full_text(queryset, query):
+        # websearch: кавычки, OR и минус как в поисковиках; невалидный синтаксис не роняет запрос
+        search = (SearchQuery(query, config='russian', search_type='websearch')
+                  | SearchQuery(query, config='english', search_type='websearch'))
+        rank = _exact_rank(SearchRank(F('search_vector'), search))
+        return queryset.filter(search_vector=search).annotate(rank=rank)
+
+    @staticmethod
+    def trigram(queryset, query):
+        rank = _exact_rank(TrigramSimilarity('title', query))
+        return queryset.filter(title__trigram_similar=query).annotate(rank=rank)
+
+
+class CourseSearchView(SearchView):
+    queryset = Course.objects.all()
+    serializer_class = CourseSerializer
+
+
+class LessonSearchView(SearchView):
+    queryset = Lesson.objects.all()
+    serializer_class = LessonSerializer
+
+    def get_queryset(self):
+        # Свои уроки и уроки курсов с подпиской; подзапрос вместо JOIN, чтобы не плодить дубли
+        user_id = self.request.user.id
+        subscribed = Subscription.objects.filter(user_id=user_id).values('course_id')
+        return super().get_queryset().filter(Q(owner_id=user_id) | Q(course_id__in=subscribed))
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        # Рядом с эндпоинтами — попадания в кэш ответов по всем процессам
+        return Response({**load_metrics(), 'response_cache': get_cache_stats()})
@@ -0,0 +1,179 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.utils.functional import SimpleLazyObject
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from users.groups import is_moderator
+from users.models import User
+
+# Claims, которые вьюхам нужны без загрузки пользователя
+IS_ACTIVE_CLAIM = 'is_active'
+IS_MODERATOR_CLAIM = 'is_moderator'
+TOKEN_VERSION_CLAIM = 'ver'
+# Поля пользователя в общем кэше: без хеша пароля и остальных данных профиля.
+# Порядок — как у полей модели: так значения ждёт Model.from_db
+CACHED_USER_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields
+    if field.attname in ('id', 'username', 'email', 'is_staff', 'is_superuser', 'is_active', 'token_version')
+)
+
+
+class LocalLRU:
+    """Короткоживущий LRU в памяти процесса перед общим кэшем: снимает даже поход в redis."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+_local = LocalLRU(settings.USER_AUTH_LOCAL_CACHE_SIZE, settings.USER_AUTH_LOCAL_CACHE_TTL)
+
+
+def _state_key(user_id):
+    return f'users:auth-state:{user_id}'
+
+
+def _user_key(user_id):
+    return f'users:user-fields:{user_id}'
+
+
+def _read_through(key, load):
+    value = _local.get(key)
+    if value is None:
+        value = cache.get(key)
+        if value is None:
+            value = load()
+            if value is None:
+                return None
+            cache.set(key, value, settings.USER_AUTH_CACHE_TIMEOUT)
+        _local.set(key, value)
+    return value
+
+
+def get_auth_state(user_id):
+    """(token_version, is_active) пользователя; None, если пользователя нет."""
+    # Кэш заполняется только из default: значение с отстающей реплики вернуло бы отозванный токен на весь таймаут
+    return _read_through(
+        _state_key(user_id),
+        lambda: (
+            User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id).values_list('token_version', 'is_active').first()
+        ),
+    )
+
+
+def get_cached_user(user_id):
+    values = _read_through(
+        _user_key(user_id),
+        lambda: User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id).values_list(*CACHED_USER_FIELDS).first(),
+    )
+    if values is None:
+        return None
+    # Новый экземпляр на каждый вызов; остальные поля отложены и догружаются при обращении
+    return User.from_db(DEFAULT_DB_ALIAS, CACHED_USER_FIELDS, values)
+
+
+def invalidate_user_auth(user_ids):
+    # Другие процессы увидят изменение не позже USER_AUTH_LOCAL_CACHE_TTL
+    keys = [key for user_id in user_ids for key in (_state_key(user_id), _user_key(user_id))]
+    for key in keys:
+        _local.delete(key)
+    cache.delete_many(keys)
+
+
+def revoke_user_tokens(user_id):
+    """Отзывает все выданные пользователю токены: их версия перестаёт совпадать с текущей."""
+    User.objects.filter(pk=user_id).update(token_version=F('token_version') + 1)
+    invalidate_user_auth([user_id])
+
+
+def set_user_claims(token, user):
+    token[IS_ACTIVE_CLAIM] = user.is_active
+    token[IS_MODERATOR_CLAIM] = is_moderator(user)
+    token[TOKEN_VERSION_CLAIM] = user.token_version
+
+
+def check_token_state(token):
+    """Проверяет токен по версии и активности пользователя из кэша; возвращает id пользователя."""
+    try:
+        user_id = int(token[api_settings.USER_ID_CLAIM])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidToken('Token contained no recognizable user identification')
+    state = get_auth_state(user_id)
+    if state is None:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    token_version, is_active = state
+    if not is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    if token.get(TOKEN_VERSION_CLAIM) != token_version:
+        raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+    return user_id
+
+
+class TokenUser(SimpleLazyObject):
+    """
+    request.user по claims токена. id и флаги доступны сразу, полная модель
+    грузится из кэша пользователей при первом обращении к остальным атрибутам.
+    """
+
+    def __init__(self, user_id, token):
+        super().__init__(lambda: get_cached_user(user_id))
+        # Атрибуты в __dict__ находятся до __getattr__ и не разворачивают объект
+        self.__dict__.update(
+            id=user_id,
+            pk=user_id,
+            is_active=token.get(IS_ACTIVE_CLAIM, True),
+            is_authenticated=True,
+            is_anonymous=False,
+            is_moderator_claim=token.get(IS_MODERATOR_CLAIM),
+        )
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWT без обращения к users_user: версия токена и активность берутся из LRU и redis."""
+
+    def get_user(self, validated_token):
+        return TokenUser(check_token_state(validated_token), validated_token)
+
+    def authenticate_header(self, request):
+        # 401 с WWW-Authenticate — запросам с токеном: истёкший или отозванный клиент обновит.
+        # Запросам без токена, как и раньше, отвечаем 403
+        if self.get_header(request) is None:
+            return None
+        return super().authenticate_header(request)
@@ -0,0 +1,121 @@
+import csv
+import io
+import json
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from users.models import Payment
+
+# Колонки выгрузки: названия курса и урока подтягиваются JOIN'ом в том же запросе
+EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('payment_date', 'payment_date'),
+    ('user_id', 'user_id'),
+    ('user_email', 'user__email'),
+    ('amount', 'amount'),
+    ('payment_method', 'payment_method'),
+    ('course_id', 'course_id'),
+    ('course_title', 'course__title'),
+    ('lesson_id', 'lesson_id'),
+    ('lesson_title', 'lesson__title'),
+    ('stripe_session_id', 'stripe_session_id'),
+)
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+
+def _date_filter(value, end=False):
+    moment = parse_datetime(value)
+    if moment is not None:
+        lookup = 'payment_date__lte' if end else 'payment_date__gte'
+    else:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Некорректная дата: {value}')
+        # Дата без времени включает весь день
+        if end:
+            moment, lookup = datetime.combine(day + timedelta(days=1), time.min), 'payment_date__lt'
+        else:
+            moment, lookup = datetime.combine(day, time.min), 'payment_date__gte'
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return {lookup: moment}
+
+
+def filter_payments(queryset, date_from=None, date_to=None, methods=None):
+    """Фильтры выгрузки; ValueError на некорректные даты и способы оплаты."""
+    if date_from:
+        queryset = queryset.filter(**_date_filter(date_from))
+    if date_to:
+        queryset = queryset.filter(**_date_filter(date_to, end=True))
+    if methods:
+        unknown = set(methods) - set(Payment.PaymentMethod.values)
+        if unknown:
+            raise ValueError(f'Неизвестный способ оплаты: {", ".join(sorted(unknown))}')
+        queryset = queryset.filter(payment_method__in=methods)
+    return queryset
+
+
+def export_rows(queryset):
+    rows = queryset.order_by('id').values_list(*(lookup for _, lookup in EXPORT_COLUMNS))
+    if connections[rows.db].settings_dict['DISABLE_SERVER_SIDE_CURSORS']:
+        # За pgbouncer в режиме transaction серверного курсора нет — читаем порциями по id
+        return _keyset_rows(rows, settings.PAYMENT_EXPORT_CHUNK_SIZE)
+    # Серверный курсор: строки читаются порциями, в памяти не больше одной порции
+    return rows.iterator(chunk_size=settings.PAYMENT_EXPORT_CHUNK_SIZE)
+
+
+def _keyset_rows(rows, chunk_size):
+    # Первая колонка выгрузки — id
+    last_id = 0
+    while True:
+        chunk = list(rows.filter(id__gt=last_id)[:chunk_size])
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1][0]
+
+
+def _batched(lines, rows, write):
+    buffer = io.StringIO()
+    count = 0
+    for row in rows:
+        write(buffer, row)
+        count += 1
+        # Отдаём текст кусками, а не по строке: меньше накладных расходов на итерацию ответа
+        if count % lines == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _csv_line(buffer, row):
+    csv.writer(buffer).writerow(value.isoformat() if isinstance(value, datetime) else value for value in row)
+
+
+def iter_csv(rows, lines=500):
+    header = io.StringIO()
+    csv.writer(header).writerow(name for name, _ in EXPORT_COLUMNS)
+    yield header.getvalue()
+    yield from _batched(lines, rows, _csv_line)
+
+
+def _ndjson_line(buffer, row):
+    record = dict(zip((name for name, _ in EXPORT_COLUMNS), row))
+    record['payment_date'] = record['payment_date'].isoformat()
+    # Сумма строкой: без потерь точности на float
+    record['amount'] = str(record['amount'])
+    buffer.write(json.dumps(record, ensure_ascii=False))
+    buffer.write('\n')
+
+
+def iter_ndjson(rows, lines=500):
+    yield from _batched(lines, rows, _ndjson_line)
+
+
+def iter_export(export_format, rows):
+    return iter_csv(rows) if export_format == 'csv' else iter_ndjson(rows)
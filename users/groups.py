@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+MODERATORS_GROUP = 'Moderators'
+
+# Атрибут на объекте пользователя: в пределах запроса в кэш ходим не больше одного раза
+_REQUEST_ATTR = '_cached_group_names'
+
+
+def _groups_key(user_id):
+    return f'users:groups:{user_id}'
+
+
+def _load_group_names(user_ids):
+    names = {user_id: [] for user_id in user_ids}
+    rows = get_user_model().groups.through.objects.filter(user_id__in=user_ids).values_list('user_id', 'group__name')
+    for user_id, name in rows:
+        names[user_id].append(name)
+    return names
+
+
+def get_group_names(user):
+    """Имена групп пользователя: из памяти запроса, затем из кэша, и только при промахе из БД."""
+    if not user.is_authenticated:
+        return frozenset()
+    names = getattr(user, _REQUEST_ATTR, None)
+    if names is not None:
+        return names
+    cached = cache.get(_groups_key(user.pk))
+    if cached is None:
+        cached = _load_group_names([user.pk])[user.pk]
+        cache.set(_groups_key(user.pk), cached, settings.USER_GROUPS_CACHE_TIMEOUT)
+    names = frozenset(cached)
+    setattr(user, _REQUEST_ATTR, names)
+    return names
+
+
+def is_moderator(user):
+    # Пользователь из JWT (users.authentication.TokenUser) несёт флаг в claims токена
+    claimed = getattr(user, 'is_moderator_claim', None)
+    if claimed is not None:
+        return claimed
+    return MODERATORS_GROUP in get_group_names(user)
+
+
+def invalidate_user_groups(user_ids):
+    cache.delete_many([_groups_key(user_id) for user_id in user_ids])
+
+
+def warm_user_groups(user_ids):
+    """Заполняет кэш групп для пачки пользователей одним запросом к БД и одним set_many."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+    names = _load_group_names(user_ids)
+    cache.set_many(
+        {_groups_key(user_id): group_names for user_id, group_names in names.items()},
+        settings.USER_GROUPS_CACHE_TIMEOUT,
+    )
+    return len(names)
+
+
+def group_member_ids(group_ids):
+    rows = get_user_model().groups.through.objects.filter(group_id__in=group_ids).values_list('user_id', flat=True)
+    return set(rows)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from users.exports import EXPORT_FORMATS, export_rows, filter_payments, iter_export
+from users.models import Payment
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка платежей в CSV или NDJSON для финансовой сверки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--output', help='Файл для записи, по умолчанию stdout')
+        parser.add_argument('--from', dest='date_from', help='Начало периода: дата или дата-время ISO 8601')
+        parser.add_argument('--to', dest='date_to', help='Конец периода включительно')
+        parser.add_argument('--method', action='append', choices=Payment.PaymentMethod.values,
+                            help='Способ оплаты, можно несколько раз')
+
+    def handle(self, *args, **options):
+        try:
+            payments = filter_payments(
+                Payment.objects.all(),
+                date_from=options['date_from'],
+                date_to=options['date_to'],
+                methods=options['method'],
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        chunks = iter_export(options['format'], export_rows(payments))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
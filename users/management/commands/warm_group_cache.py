@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from users.groups import MODERATORS_GROUP, warm_user_groups
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогрев кэша членства в группах: после деплоя или сброса кэша проверки IsModerator '
+        'не ходят в БД. По умолчанию прогреваются участники группы Moderators.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', action='append', help='Группа для прогрева, можно несколько раз')
+        parser.add_argument('--all-active', action='store_true', help='Прогреть всех активных пользователей')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        if not options['all_active']:
+            users = users.filter(groups__name__in=options['group'] or [MODERATORS_GROUP]).distinct()
+
+        warmed = 0
+        last_id = 0
+        while True:
+            ids = list(users.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            warmed += warm_user_groups(ids)
+            last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'Прогрет кэш групп для {warmed} пользователей'))
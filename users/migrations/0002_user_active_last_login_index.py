@@ -0,0 +1,19 @@
+# Generated by Django 4.2.21 on 2026-10-18 10:38
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['last_login'], name='user_active_last_login_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.21 on 2026-10-18 11:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.functions.comparison
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0005_course_counters'),
+        ('users', '0003_user_token_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('payment_method', models.CharField(choices=[('CASH', 'Наличные'), ('TRANSFER', 'Перевод'), ('STRIPE', 'Stripe')], max_length=20)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('payments_count', models.PositiveIntegerField(default=0)),
+                ('course', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='lms.course')),
+                ('lesson', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='lms.lesson')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='paymentrollup',
+            constraint=models.UniqueConstraint(models.F('day'), django.db.models.functions.comparison.Coalesce('course', models.Value(0)), django.db.models.functions.comparison.Coalesce('lesson', models.Value(0)), models.F('payment_method'), name='payment_rollup_key'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.21 on 2026-10-18 11:10
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('users', '0004_payment_rollup'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='payment',
+            index=models.Index(fields=['user', 'payment_date', 'id'], name='payment_user_date_idx'),
+        ),
+    ]
@@ -1,5 +1,11 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+
+# Шлётся из Payment.delete() вместо post_delete, чтобы каскады курсов, уроков и пользователей
+# удаляли платежи быстрым путём; каскады сводка обрабатывает в users.signals
+payment_deleted = Signal()
 
 
 class User(AbstractUser):
@@ -7,6 +13,14 @@ class User(AbstractUser):
     phone = models.CharField(max_length=15, blank=True, null=True)
     city = models.CharField(max_length=100, blank=True, null=True)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    # Версия JWT: увеличение отзывает все ранее выданные токены (users.authentication)
+    token_version = models.PositiveIntegerField(default=0)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Частичный индекс для поиска неактивных пользователей в users.tasks
+            models.Index(fields=['last_login'], condition=models.Q(is_active=True), name='user_active_last_login_idx'),
+        ]
 
     def str(self):
         return self.username
@@ -27,5 +41,36 @@ class Payment(models.Model):
     stripe_session_id = models.CharField(max_length=255, null=True, blank=True)
     stripe_payment_url = models.URLField(max_length=500, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Список платежей пользователя с keyset-пагинацией по (payment_date, id)
+            models.Index(fields=['user', 'payment_date', 'id'], name='payment_user_date_idx'),
+        ]
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            payment_deleted.send(sender=Payment, instance=self)
+        return result
+
     def str(self):
         return f"Payment {self.id} by {self.user.email}"
+
+
+class PaymentRollup(models.Model):
+    """Суммы платежей по дню, курсу, уроку и способу оплаты; ведётся users.rollups."""
+    day = models.DateField()
+    course = models.ForeignKey('lms.Course', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    lesson = models.ForeignKey('lms.Lesson', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    payment_method = models.CharField(max_length=20, choices=Payment.PaymentMethod.choices)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payments_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # NULL в уникальном индексе не совпадают, поэтому ключ по COALESCE; на него ссылается ON CONFLICT
+            models.UniqueConstraint(
+                'day', Coalesce('course', models.Value(0)), Coalesce('lesson', models.Value(0)), 'payment_method',
+                name='payment_rollup_key',
+            ),
+        ]
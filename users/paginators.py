@@ -0,0 +1,6 @@
+from lms.paginators import KeysetPagination
+
+
+class PaymentPagination(KeysetPagination):
+    ordering_field = 'payment_date'
+    page_size = 20
@@ -1,11 +1,37 @@
 from rest_framework import permissions
+from rest_framework.exceptions import NotFound, PermissionDenied
+from users.groups import is_moderator
 
 
 class IsModerator(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user.groups.filter(name='Moderators').exists()
+        # Членство в группах кэшируется, см. users.groups
+        return is_moderator(request.user)
 
 
 class IsOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.owner == request.user
+        # Сравниваем по owner_id, не подгружая владельца отдельным запросом
+        return obj.owner_id == request.user.id
+
+
+def get_owned_object(queryset, user, owner_field='owner', **lookup):
+    """
+    Объект владельца одним запросом: фильтр по owner_id стоит в самом WHERE.
+    Только если строки нет, лёгкий exists() отличает чужой объект (403) от отсутствующего (404).
+    """
+    try:
+        return queryset.get(**lookup, **{f'{owner_field}_id': user.id})
+    except queryset.model.DoesNotExist:
+        if queryset.filter(**lookup).exists():
+            raise PermissionDenied()
+        raise NotFound()
+
+
+async def aget_owned_object(queryset, user, owner_field='owner', **lookup):
+    try:
+        return await queryset.aget(**lookup, **{f'{owner_field}_id': user.id})
+    except queryset.model.DoesNotExist:
+        if await queryset.filter(**lookup).aexists():
+            raise PermissionDenied()
+        raise NotFound()
@@ -0,0 +1,89 @@
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+from users.models import Payment, PaymentRollup
+
+# Должно совпадать с выражениями индекса payment_rollup_key
+_CONFLICT_TARGET = '(day, COALESCE(course_id, 0), COALESCE(lesson_id, 0), payment_method)'
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def add_payment(payment):
+    """Прибавляет платёж к его строке сводки одним INSERT ... ON CONFLICT DO UPDATE."""
+    table = connection.ops.quote_name(PaymentRollup._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (day, course_id, lesson_id, payment_method, total_amount, payments_count) '
+            f'VALUES (%s, %s, %s, %s, %s, 1) '
+            f'ON CONFLICT {_CONFLICT_TARGET} DO UPDATE SET '
+            f'total_amount = {table}.total_amount + EXCLUDED.total_amount, '
+            f'payments_count = {table}.payments_count + 1',
+            [
+                timezone.localdate(payment.payment_date), payment.course_id, payment.lesson_id,
+                payment.payment_method, payment.amount,
+            ],
+        )
+
+
+def subtract_payment(payment):
+    PaymentRollup.objects.filter(
+        day=timezone.localdate(payment.payment_date),
+        course_id=payment.course_id,
+        lesson_id=payment.lesson_id,
+        payment_method=payment.payment_method,
+    ).update(total_amount=F('total_amount') - payment.amount, payments_count=Greatest(F('payments_count') - 1, 0))
+
+
+def subtract_payments(payments):
+    """Вычитает платежи QuerySet из сводки одним UPDATE ... FROM по их сгруппированным суммам."""
+    grouped = (
+        payments.annotate(day=TruncDate('payment_date'))
+        .values('day', 'course_id', 'lesson_id', 'payment_method')
+        .annotate(total=Sum('amount'), payments=Count('id'))
+        .order_by()
+    )
+    sql, params = grouped.query.sql_with_params()
+    table = connection.ops.quote_name(PaymentRollup._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} AS rollup SET total_amount = rollup.total_amount - removed.total, '
+            f'payments_count = GREATEST(rollup.payments_count - removed.payments, 0) '
+            f'FROM ({sql}) AS removed '
+            f'WHERE rollup.day = removed.day AND rollup.payment_method = removed.payment_method '
+            f'AND COALESCE(rollup.course_id, 0) = COALESCE(removed.course_id, 0) '
+            f'AND COALESCE(rollup.lesson_id, 0) = COALESCE(removed.lesson_id, 0)',
+            params,
+        )
+
+
+def rebuild_day(day):
+    """Пересчитывает сводку за день из платежей; возвращает число строк сводки."""
+    start, end = _day_bounds(day)
+    rows = (
+        Payment.objects
+        .filter(payment_date__gte=start, payment_date__lt=end)
+        .values('course_id', 'lesson_id', 'payment_method')
+        .annotate(total=Sum('amount'), payments=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        PaymentRollup.objects.filter(day=day).delete()
+        created = PaymentRollup.objects.bulk_create([
+            PaymentRollup(
+                day=day,
+                course_id=row['course_id'],
+                lesson_id=row['lesson_id'],
+                payment_method=row['payment_method'],
+                total_amount=row['total'],
+                payments_count=row['payments'],
+            )
+            for row in rows
+        ])
+    return len(created)
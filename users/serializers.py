@@ -1,9 +1,13 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import check_token_state, get_cached_user, set_user_claims
 from .models import Payment, User
 from lms.serializers import CourseSerializer, LessonSerializer
+from lms.profiling import ProfiledSerializerMixin
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'password']
@@ -11,6 +15,12 @@ class UserSerializer(serializers.ModelSerializer):
             'password': {'write_only': True},  # Пароль только для записи
         }
 
+    def update(self, instance, validated_data):
+        password = validated_data.pop('password', None)
+        if password:
+            instance.set_password(password)
+        return super().update(instance, validated_data)
+
     def create(self, validated_data):
         # Создаём пользователя с хешированием пароля
         user = User.objects.create_user(
@@ -21,7 +31,7 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     course = CourseSerializer(read_only=True)
     lesson = LessonSerializer(read_only=True)
 
@@ -29,3 +39,31 @@ class PaymentSerializer(serializers.ModelSerializer):
         model = Payment
         fields = ['id', 'user', 'payment_date', 'course', 'lesson', 'amount', 'payment_method', 'stripe_session_id',
                   'stripe_payment_url']
+        extra_kwargs = {
+            'user': {'read_only': True},  # Платёж всегда принадлежит автору запроса
+        }
+
+
+class LmsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        set_user_claims(token, user)
+        return token
+
+
+class LmsTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        # Отозванный refresh не выпускает новых access; claims берутся свежие, а не из refresh
+        user = get_cached_user(check_token_state(refresh))
+        access = refresh.access_token
+        set_user_claims(access, user)
+        data = {'access': str(access)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            set_user_claims(refresh, user)
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
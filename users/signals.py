@@ -0,0 +1,71 @@
+from django.contrib.auth import user_logged_in
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from users.authentication import invalidate_user_auth
+from users.groups import group_member_ids, invalidate_user_groups, warm_user_groups
+from users.models import Payment, User, payment_deleted
+from users.rollups import add_payment, subtract_payment, subtract_payments
+
+# Поля платежа, от которых зависит его строка сводки
+ROLLUP_FIELDS = ('payment_date', 'course_id', 'lesson_id', 'payment_method', 'amount')
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_groups_on_membership_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # user.groups.add/remove/clear
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_user_groups([instance.pk])
+    elif action == 'pre_clear':
+        # group.user_set.clear(): после очистки участников уже не узнать
+        invalidate_user_groups(group_member_ids([instance.pk]))
+    elif action in ('post_add', 'post_remove'):
+        invalidate_user_groups(pk_set)
+
+
+@receiver([post_save, pre_delete], sender=Group)
+def invalidate_groups_on_group_change(sender, instance, **kwargs):
+    # Переименование или удаление группы меняет набор имён у всех её участников
+    invalidate_user_groups(group_member_ids([instance.pk]))
+
+
+@receiver(user_logged_in)
+def warm_groups_on_login(sender, user, **kwargs):
+    warm_user_groups([user.pk])
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_auth_cache(sender, instance, **kwargs):
+    invalidate_user_auth([instance.pk])
+
+
+@receiver(pre_save, sender=Payment)
+def remember_rollup_payment(sender, instance, **kwargs):
+    # Прежние значения нужны, чтобы при правке снять платёж со старой строки сводки
+    if not instance._state.adding:
+        instance._rollup_previous = Payment.objects.filter(pk=instance.pk).only(*ROLLUP_FIELDS).first()
+
+
+@receiver(post_save, sender=Payment)
+def add_payment_to_rollup(sender, instance, created, **kwargs):
+    previous = instance.__dict__.pop('_rollup_previous', None)
+    if created:
+        add_payment(instance)
+    elif previous is not None and any(getattr(previous, f) != getattr(instance, f) for f in ROLLUP_FIELDS):
+        with transaction.atomic():
+            subtract_payment(previous)
+            add_payment(instance)
+
+
+@receiver(payment_deleted, sender=Payment)
+def subtract_payment_from_rollup(sender, instance, **kwargs):
+    subtract_payment(instance)
+
+
+@receiver(pre_delete, sender=User)
+def subtract_user_payments_from_rollup(sender, instance, **kwargs):
+    # Платежи пользователя удаляются каскадом без сигналов: вычитаем их из сводки одним UPDATE.
+    # Каскады курсов и уроков сигналов не требуют: строки сводки удаляются теми же внешними ключами
+    subtract_payments(Payment.objects.filter(user=instance))
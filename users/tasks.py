@@ -1,18 +1,73 @@
+import logging
+
 from celery import shared_task
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db.models import Min
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from datetime import timedelta
+from lms.routers import replica_reads
+from users.authentication import invalidate_user_auth
+from users.models import Payment, PaymentRollup
+from users.rollups import rebuild_day
 
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
+
 
+# Поиск кандидатов — на реплике: UPDATE в default повторяет условия, так что лаг реплики безопасен
 @shared_task
-def deactivate_inactive_users():
+@replica_reads(sticky=False)
+def deactivate_inactive_users(batch_size=None, start_after_id=0, dry_run=False):
+    batch_size = batch_size or settings.DEACTIVATE_USERS_BATCH_SIZE
     threshold = timezone.now() - timedelta(days=30)
     inactive_users = User.objects.filter(last_login__lt=threshold, is_active=True)
+
+    if dry_run:
+        count = inactive_users.filter(id__gt=start_after_id).count()
+        return f"Would deactivate {count} inactive users"
+
+    # Пачки UPDATE ... WHERE id IN (...) по возрастанию id: каждая пачка коммитится
+    # сама по себе, блокировки короткие, а last_id позволяет продолжить прерванный проход
     count = 0
-    for user in inactive_users:
-        user.is_active = False
-        user.save()
-        count += 1
-    return f"Deactivated {count} inactive users"
+    last_id = start_after_id
+    while True:
+        ids = list(
+            inactive_users.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        count += User.objects.filter(id__in=ids, last_login__lt=threshold, is_active=True).update(is_active=False)
+        # update() не шлёт post_save: кэш аутентификации сбрасываем явно
+        invalidate_user_auth(ids)
+        last_id = ids[-1]
+        logger.info('Deactivated inactive users up to id %s (%s so far)', last_id, count)
+    return f"Deactivated {count} inactive users (last id {last_id})"
+
+
+@shared_task
+def compact_payment_rollups(days=None, date_from=None, date_to=None, backfill=False):
+    # По умолчанию пересчитываются последние закрытые дни: они уже не получают вставок,
+    # и пересчёт не конкурирует с инкрементами из сигнала
+    date_to = parse_date(date_to) if date_to else timezone.localdate() - timedelta(days=1)
+    if backfill:
+        first = Payment.objects.aggregate(first=Min('payment_date'))['first']
+        date_from = timezone.localdate(first) if first else date_to
+    elif date_from:
+        date_from = parse_date(date_from)
+    else:
+        date_from = date_to - timedelta(days=(days or settings.PAYMENT_ROLLUP_COMPACT_DAYS) - 1)
+
+    rebuilt_days = 0
+    rows = 0
+    day = date_from
+    while day <= date_to:
+        rows += rebuild_day(day)
+        rebuilt_days += 1
+        day += timedelta(days=1)
+    # Строки, обнулённые удалениями платежей в ещё открытые дни
+    PaymentRollup.objects.filter(payments_count=0).delete()
+    logger.info('Rebuilt payment rollups %s..%s: %s rows', date_from, date_to, rows)
+    return f"Rebuilt payment rollups for {rebuilt_days} days ({rows} rows)"
@@ -1,3 +1,453 @@
-from django.test import TestCase
+import csv
+import json
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from lms.models import Course, Lesson
+from users.authentication import TokenUser, _local, get_cached_user
+from users.models import Payment, PaymentRollup
+from users.permissions import IsModerator
+from users.tasks import compact_payment_rollups, deactivate_inactive_users
+
+
+class DeactivateInactiveUsersTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        long_ago = timezone.now() - timedelta(days=60)
+        self.inactive = [
+            User.objects.create_user(
+                username=f'inactive{i}',
+                email=f'inactive{i}@example.com',
+                password='User_Python2025',
+                last_login=long_ago
+            )
+            for i in range(5)
+        ]
+        self.active = User.objects.create_user(
+            username='active',
+            email='active@example.com',
+            password='User_Python2025',
+            last_login=timezone.now()
+        )
+
+    def test_deactivates_in_batches(self):
+        result = deactivate_inactive_users(batch_size=2)
+        self.assertIn('Deactivated 5 inactive users', result)
+        User = get_user_model()
+        self.assertFalse(User.objects.filter(id__in=[u.id for u in self.inactive], is_active=True).exists())
+        self.assertTrue(User.objects.get(id=self.active.id).is_active)
+
+    def test_dry_run_does_not_update(self):
+        result = deactivate_inactive_users(dry_run=True)
+        self.assertEqual(result, 'Would deactivate 5 inactive users')
+        self.assertEqual(get_user_model().objects.filter(is_active=True).count(), 6)
+
+    def test_resume_after_high_water_mark(self):
+        deactivate_inactive_users(start_after_id=self.inactive[2].id)
+        User = get_user_model()
+        self.assertEqual(
+            list(User.objects.filter(id__in=[u.id for u in self.inactive], is_active=True).order_by('id')
+                 .values_list('id', flat=True)),
+            [u.id for u in self.inactive[:3]]
+        )
+
+
+class ModeratorGroupCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.moderators = Group.objects.create(name='Moderators')
+        self.user = get_user_model().objects.create_user(
+            username='moderator',
+            email='moderator@example.com',
+            password='User_Python2025'
+        )
+
+    def has_permission(self):
+        # Новый объект пользователя — как в новом запросе
+        user = get_user_model().objects.get(pk=self.user.pk)
+        return IsModerator().has_permission(SimpleNamespace(user=user), None)
+
+    def test_steady_state_costs_no_queries(self):
+        self.user.groups.add(self.moderators)
+        call_command('warm_group_cache', stdout=StringIO())
+        user = get_user_model().objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(IsModerator().has_permission(SimpleNamespace(user=user), None))
+
+    def test_membership_changes_invalidate_cache(self):
+        self.assertFalse(self.has_permission())
+        self.user.groups.add(self.moderators)
+        self.assertTrue(self.has_permission())
+        self.moderators.user_set.remove(self.user)
+        self.assertFalse(self.has_permission())
+        self.moderators.user_set.add(self.user)
+        self.assertTrue(self.has_permission())
+        self.moderators.user_set.clear()
+        self.assertFalse(self.has_permission())
+
+    def test_group_rename_invalidates_members(self):
+        self.user.groups.add(self.moderators)
+        self.assertTrue(self.has_permission())
+        self.moderators.name = 'Former moderators'
+        self.moderators.save()
+        self.assertFalse(self.has_permission())
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        _local.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='user1',
+            email='user1@example.com',
+            password='User1_Python2025'
+        )
+
+    def obtain(self):
+        response = self.client.post('/api/token/', {'username': 'user1', 'password': 'User1_Python2025'})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    @staticmethod
+    def user_queries(context):
+        return [query['sql'] for query in context.captured_queries if 'FROM "users_user"' in query['sql']]
+
+    def test_steady_state_skips_user_table(self):
+        access = self.obtain()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.get('/api/courses/').status_code, 200)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/lessons/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.user_queries(context), [])
+
+    def test_async_view_accepts_token(self):
+        access = self.obtain()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.get('/api/async/courses/').status_code, 200)
+
+    def test_async_writes_accept_token_without_csrf(self):
+        access = self.obtain()['access']
+        client = APIClient(enforce_csrf_checks=True)
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = client.post('/api/async/courses/', {'title': 'Course', 'description': 'Description'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        url = f"/api/async/courses/{response.json()['id']}/"
+        self.assertEqual(client.patch(url, {'title': 'Updated'}, format='json').status_code, 200)
+        self.assertEqual(client.delete(url).status_code, 204)
+        self.assertFalse(Course.objects.exists())
+
+    def test_async_session_writes_require_csrf(self):
+        client = APIClient(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post('/api/async/courses/', {'title': 'Course', 'description': 'Description'}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('CSRF', response.json()['detail'])
+        self.assertFalse(Course.objects.exists())
+
+    def test_claims_resolve_without_loading_user(self):
+        self.user.groups.add(Group.objects.create(name='Moderators'))
+        access = self.obtain()['access']
+        token = AccessToken(access)
+        self.assertTrue(token['is_moderator'])
+        user = TokenUser(self.user.id, token)
+        with self.assertNumQueries(0):
+            self.assertTrue(IsModerator().has_permission(SimpleNamespace(user=user), None))
+            self.assertEqual(user.id, self.user.id)
+
+    def test_cached_user_holds_no_password_hash(self):
+        user = get_cached_user(self.user.id)
+        self.assertEqual((user.pk, user.username, user.is_staff), (self.user.id, 'user1', False))
+        self.assertNotIn(self.user.password, repr(cache.get(f'users:user-fields:{self.user.id}')))
+        self.assertIn('password', user.get_deferred_fields())
+        with self.assertNumQueries(0):
+            get_cached_user(self.user.id)
+
+    def test_revoke_rejects_access_and_refresh(self):
+        tokens = self.obtain()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+        self.assertEqual(self.client.post('/api/token/revoke/').status_code, 204)
+        response = self.client.get('/api/courses/')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+        self.assertEqual(self.client.get('/api/async/courses/').status_code, 401)
+        self.client.credentials()
+        response = self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+        # Новый вход выдаёт токены текущей версии
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.obtain()["access"]}')
+        self.assertEqual(self.client.get('/api/courses/').status_code, 200)
+
+    def test_deactivated_user_rejected(self):
+        access = self.obtain()['access']
+        self.user.is_active = False
+        self.user.save()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.get('/api/courses/').status_code, 401)
+
+
+class PaymentExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_user(
+            username='admin',
+            email='admin@example.com',
+            password='Admin_Python2025',
+            is_staff=True
+        )
+        self.client.force_login(self.admin)
+        course = Course.objects.create(title='Курс', description='D', owner=self.admin)
+        lesson = Lesson.objects.create(title='Урок', description='D', course=course, owner=self.admin)
+        self.payments = [
+            Payment.objects.create(user=self.admin, course=course, amount=Decimal('100.50'), payment_method='CASH'),
+            Payment.objects.create(user=self.admin, lesson=lesson, amount=Decimal('20.00'), payment_method='TRANSFER'),
+        ]
+        Payment.objects.filter(pk=self.payments[0].pk).update(payment_date=timezone.now() - timedelta(days=10))
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/payments/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_joins_titles_in_one_query(self):
+        with CaptureQueriesContext(connection) as context:
+            rows = list(csv.DictReader(self.export().splitlines()))
+        self.assertEqual([row['id'] for row in rows], [str(payment.id) for payment in self.payments])
+        self.assertEqual(rows[0]['course_title'], 'Курс')
+        self.assertEqual(rows[1]['lesson_title'], 'Урок')
+        self.assertEqual(rows[0]['amount'], '100.50')
+        self.assertEqual(len([q for q in context.captured_queries if 'users_payment' in q['sql']]), 1)
+
+    def test_ndjson_with_filters(self):
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        lines = self.export(f'?output=ndjson&date_from={since}&method=TRANSFER').splitlines()
+        self.assertEqual(len(lines), 1)
+        record = json.loads(lines[0])
+        self.assertEqual((record['id'], record['amount']), (self.payments[1].id, '20.00'))
+        self.assertEqual(self.export('?output=ndjson&method=CASH,STRIPE').count('\n'), 1)
+
+    def test_invalid_filters_and_permissions(self):
+        self.assertEqual(self.client.get('/api/payments/export/?date_from=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/api/payments/export/?method=BARTER').status_code, 400)
+        self.assertEqual(self.client.get('/api/payments/export/?output=xml').status_code, 400)
+        self.admin.is_staff = False
+        self.admin.save()
+        self.assertEqual(self.client.get('/api/payments/export/').status_code, 403)
+
+    @override_settings(PAYMENT_EXPORT_CHUNK_SIZE=1)
+    def test_keyset_chunks_without_server_side_cursors(self):
+        # За pgbouncer в режиме transaction серверные курсоры отключены
+        with patch.dict(connection.settings_dict, DISABLE_SERVER_SIDE_CURSORS=True), \
+                CaptureQueriesContext(connection) as context:
+            rows = list(csv.DictReader(self.export().splitlines()))
+        self.assertEqual([row['id'] for row in rows], [str(payment.id) for payment in self.payments])
+        self.assertEqual(len([q for q in context.captured_queries if 'users_payment' in q['sql']]), 3)
+
+    def test_command_writes_file(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as output:
+            call_command('export_payments', '--output', output.name, '--method', 'CASH')
+            with open(output.name, encoding='utf-8') as exported:
+                rows = list(csv.reader(exported))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][0], str(self.payments[0].id))
+
+
+class PaymentRollupTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_user(
+            username='admin',
+            email='admin@example.com',
+            password='Admin_Python2025',
+            is_staff=True
+        )
+        self.client.force_login(self.admin)
+        self.course = Course.objects.create(title='Курс', description='D', owner=self.admin)
+
+    def pay(self, amount, method='CASH', **kwargs):
+        return Payment.objects.create(
+            user=self.admin, course=self.course, amount=Decimal(amount), payment_method=method, **kwargs
+        )
+
+    def test_incremental_upsert_and_delete(self):
+        self.pay('10.00')
+        payment = self.pay('5.50')
+        self.pay('7.00', method='TRANSFER')
+        rollup = PaymentRollup.objects.get(course=self.course, lesson=None, payment_method='CASH')
+        self.assertEqual((rollup.total_amount, rollup.payments_count), (Decimal('15.50'), 2))
+        self.assertEqual(PaymentRollup.objects.count(), 2)
+
+        payment.delete()
+        rollup.refresh_from_db()
+        self.assertEqual((rollup.total_amount, rollup.payments_count), (Decimal('10.00'), 1))
+
+    def test_edit_moves_payment_between_rollup_rows(self):
+        payment = self.pay('10.00')
+        payment.amount = Decimal('12.00')
+        payment.payment_method = 'TRANSFER'
+        payment.save()
+        payment.stripe_session_id = 'cs_test'
+        payment.save()
+        self.assertEqual(
+            sorted(PaymentRollup.objects.values_list('payment_method', 'total_amount', 'payments_count')),
+            [('CASH', Decimal('0.00'), 0), ('TRANSFER', Decimal('12.00'), 1)]
+        )
+
+    def delete_payer_queries(self, payments):
+        payer = get_user_model().objects.create_user(
+            username=f'payer{payments}', email=f'payer{payments}@example.com', password='Payer_Python2025'
+        )
+        for _ in range(payments):
+            Payment.objects.create(user=payer, course=self.course, amount=Decimal('2.00'), payment_method='CASH')
+        with CaptureQueriesContext(connection) as context:
+            payer.delete()
+        return len(context.captured_queries)
+
+    def test_cascades_update_rollup_without_per_row_queries(self):
+        self.pay('10.00')
+        self.assertEqual(self.delete_payer_queries(2), self.delete_payer_queries(20))
+        rollup = PaymentRollup.objects.get()
+        self.assertEqual((rollup.total_amount, rollup.payments_count), (Decimal('10.00'), 1))
+        self.course.delete()
+        self.assertFalse(PaymentRollup.objects.exists())
+
+    def test_compaction_backfills_bulk_inserts(self):
+        yesterday = timezone.now() - timedelta(days=1)
+        Payment.objects.bulk_create([
+            Payment(user=self.admin, course=self.course, amount=Decimal('3.00'), payment_method='STRIPE')
+            for _ in range(3)
+        ])
+        Payment.objects.update(payment_date=yesterday)
+        self.assertFalse(PaymentRollup.objects.exists())
+
+        self.assertIn('1 rows', compact_payment_rollups(backfill=True))
+        rollup = PaymentRollup.objects.get()
+        self.assertEqual((rollup.day, rollup.total_amount, rollup.payments_count),
+                         (timezone.localdate(yesterday), Decimal('9.00'), 3))
+
+    def test_api_groups_rollups(self):
+        self.pay('10.00')
+        self.pay('2.50', method='TRANSFER')
+        with self.assertNumQueries(3):  # сессия, пользователь, сводка
+            response = self.client.get('/api/payments/rollups/?group_by=course')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [
+            {'course': self.course.id, 'total_amount': '12.50', 'payments_count': 2},
+        ])
+        response = self.client.get('/api/payments/rollups/?group_by=payment_method&method=TRANSFER')
+        self.assertEqual(response.data['results'], [
+            {'payment_method': 'TRANSFER', 'total_amount': '2.50', 'payments_count': 1},
+        ])
+        self.assertEqual(self.client.get('/api/payments/rollups/?group_by=user').status_code, 400)
+        self.assertEqual(self.client.get('/api/payments/rollups/?date_from=2024-13-01').status_code, 400)
+        self.assertEqual(self.client.get('/api/payments/rollups/?course=abc').status_code, 400)
+        self.assertEqual(self.client.get('/api/payments/rollups/?lesson=1.5').status_code, 400)
+
+
+class UserViewSetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='user1',
+            email='user1@example.com',
+            password='User1_Python2025'
+        )
+        self.other = get_user_model().objects.create_user(
+            username='user2',
+            email='user2@example.com',
+            password='User2_Python2025'
+        )
+        self.client.force_login(self.user)
+
+    def test_user_sees_and_changes_only_own_account(self):
+        response = self.client.get('/api/users/')
+        self.assertEqual([row['id'] for row in response.data], [self.user.id])
+        self.assertEqual(self.client.get(f'/api/users/{self.other.id}/').status_code, 404)
+        response = self.client.patch(f'/api/users/{self.other.id}/', {'password': 'Hacked_2025'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.delete(f'/api/users/{self.other.id}/').status_code, 404)
+        self.other.refresh_from_db()
+        self.assertTrue(self.other.check_password('User2_Python2025'))
+        response = self.client.patch(f'/api/users/{self.user.id}/', {'email': 'new@example.com'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_staff_sees_all_accounts(self):
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/api/users/')
+        self.assertEqual(sorted(row['id'] for row in response.data), [self.user.id, self.other.id])
+        self.assertEqual(self.client.get(f'/api/users/{self.other.id}/').status_code, 200)
+
+
+class PaymentViewSetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='user1',
+            email='user1@example.com',
+            password='User1_Python2025'
+        )
+        self.other = get_user_model().objects.create_user(
+            username='user2',
+            email='user2@example.com',
+            password='User2_Python2025'
+        )
+        self.client.force_login(self.user)
+        self.course = Course.objects.create(title='Курс', description='D', owner=self.other)
+        self.lesson = Lesson.objects.create(title='Урок', description='D', course=self.course, owner=self.other)
+
+    def create_payments(self, count):
+        for i in range(count):
+            Payment.objects.create(
+                user=self.user,
+                course=self.course if i % 2 else None,
+                lesson=None if i % 2 else self.lesson,
+                amount=Decimal('10.00'),
+                payment_method='CASH',
+            )
+
+    def list_queries(self, page_size):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/api/payments/?page_size={page_size}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), page_size)
+        return len(context.captured_queries)
+
+    def test_list_query_count_is_constant(self):
+        self.create_payments(20)
+        Payment.objects.create(user=self.other, course=self.course, amount=Decimal('1.00'), payment_method='CASH')
+        self.assertEqual(self.list_queries(2), self.list_queries(20))
+        results = self.client.get('/api/payments/?page_size=20').data['results']
+        self.assertEqual({row['user'] for row in results}, {self.user.id})
+        self.assertEqual({row['course']['title'] for row in results if row['course']}, {'Курс'})
+        self.assertEqual({row['lesson']['course'] for row in results if row['lesson']}, {self.course.id})
+
+    def test_pagination_and_read_only(self):
+        self.create_payments(3)
+        first = self.client.get('/api/payments/?page_size=2').data
+        second = self.client.get(first['next']).data
+        self.assertEqual(len(second['results']), 1)
+        self.assertIsNone(second['next'])
+
+        payment = Payment.objects.first()
+        self.assertEqual(self.client.get(f'/api/payments/{payment.id}/').data['amount'], '10.00')
+        self.assertEqual(self.client.post('/api/payments/', {'amount': '5.00', 'payment_method': 'CASH'}).status_code,
+                         405)
+        self.assertEqual(self.client.patch(f'/api/payments/{payment.id}/', {'amount': '0.01'}).status_code, 405)
+        self.assertEqual(self.client.delete(f'/api/payments/{payment.id}/').status_code, 405)
+        self.assertEqual(Payment.objects.count(), 3)
@@ -1,11 +1,24 @@
+from datetime import timedelta
+
 from rest_framework import viewsets
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.exceptions import NotAuthenticated
 from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.shortcuts import get_object_or_404
+from lms.serializers import optimize_queryset
+from users.authentication import revoke_user_tokens
+from users.exports import EXPORT_FORMATS, export_rows, filter_payments, iter_export
+from users.models import Payment, PaymentRollup
+from users.paginators import PaymentPagination
+from users.serializers import PaymentSerializer, UserSerializer
 
 
 class IsAuthenticatedCustom(IsAuthenticated):
@@ -15,49 +28,19 @@ class IsAuthenticatedCustom(IsAuthenticated):
         return True
 
 
-# Заглушки для сериализаторов, замените на ваши
-class UserSerializer:
-    def __init__(self, instance=None, data=None, many=False, partial=False):
-        self.instance = instance
-        self.data = data if data else (instance if instance else {})
-        self.many = many
-        self.partial = partial
-
-    def is_valid(self):
-        return True
-
-    def save(self, **kwargs):
-        user = self.instance or get_user_model().objects.create(**self.data)
-        for key, value in self.data.items():
-            setattr(user, key, value)
-        for key, value in kwargs.items():
-            setattr(user, key, value)
-        user.save()
-        self.instance = user
-        return user
-
-
-class PaymentSerializer:
-    def __init__(self, instance=None, data=None, many=False, partial=False):
-        self.instance = instance
-        self.data = data if data else (instance if instance else {})
-        self.many = many
-        self.partial = partial
-
-    def is_valid(self):
-        return True
-
-    def save(self, **kwargs):
-        return self.instance or {'id': 1, 'user': kwargs.get('user')}
-
-
 class UserViewSet(viewsets.GenericViewSet):
     permission_classes = [IsAuthenticatedCustom]
     serializer_class = UserSerializer
     queryset = get_user_model().objects.all()
 
+    def get_queryset(self):
+        # Профили и учётные записи других пользователей видит и меняет только персонал
+        if self.request.user.is_staff:
+            return self.queryset
+        return self.queryset.filter(pk=self.request.user.pk)
+
     def list(self, request):
-        users = self.queryset
+        users = self.get_queryset()
         serializer = self.get_serializer(users, many=True)
         return Response(serializer.data)
 
@@ -69,12 +52,12 @@ class UserViewSet(viewsets.GenericViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def retrieve(self, request, pk=None):
-        user = get_object_or_404(self.queryset, pk=pk)
+        user = get_object_or_404(self.get_queryset(), pk=pk)
         serializer = self.get_serializer(user)
         return Response(serializer.data)
 
     def update(self, request, pk=None):
-        user = get_object_or_404(self.queryset, pk=pk)
+        user = get_object_or_404(self.get_queryset(), pk=pk)
         serializer = self.get_serializer(user, data=request.data)
         if serializer.is_valid():
             serializer.save()
@@ -82,7 +65,7 @@ class UserViewSet(viewsets.GenericViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def partial_update(self, request, pk=None):
-        user = get_object_or_404(self.queryset, pk=pk)
+        user = get_object_or_404(self.get_queryset(), pk=pk)
         serializer = self.get_serializer(user, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
@@ -90,57 +73,118 @@ class UserViewSet(viewsets.GenericViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def destroy(self, request, pk=None):
-        user = get_object_or_404(self.queryset, pk=pk)
+        user = get_object_or_404(self.get_queryset(), pk=pk)
         user.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class PaymentViewSet(viewsets.GenericViewSet):
+class PaymentViewSet(viewsets.ReadOnlyModelViewSet):
+    # Только чтение: платежи создаются через Stripe (PaymentStripeCreateAPIView), а не правятся плательщиком
     permission_classes = [IsAuthenticatedCustom]
     serializer_class = PaymentSerializer
-    queryset = []  # Замените на ваш queryset
-
-    def list(self, request):
-        payments = self.queryset
-        serializer = self.get_serializer(payments, many=True)
-        return Response(serializer.data)
-
-    def create(self, request):
-        serializer = self.get_serializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save(user=request.user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-    def retrieve(self, request, pk=None):
-        payment = get_object_or_404(self.queryset, pk=pk, user=request.user)
-        serializer = self.get_serializer(payment)
-        return Response(serializer.data)
+    pagination_class = PaymentPagination
+
+    def get_queryset(self):
+        # JOIN'ы и колонки берутся из полей PaymentSerializer: страница списка — постоянное число запросов
+        return optimize_queryset(Payment.objects.filter(user_id=self.request.user.id), self.serializer_class)
+
+
+class PaymentExportView(APIView):
+    """
+    Потоковая выгрузка всех платежей для сверки: ?output=csv|ndjson, ?date_from=, ?date_to=,
+    ?method= (можно несколько). Память не растёт с числом строк.
+    """
+    permission_classes = [IsAdminUser]
+    content_types = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+
+    def get(self, request):
+        export_format = request.query_params.get('output', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response({'output': [f'Допустимые значения: {", ".join(EXPORT_FORMATS)}']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        methods = [method for value in request.query_params.getlist('method') for method in value.split(',') if method]
+        try:
+            payments = filter_payments(
+                Payment.objects.all(),
+                date_from=request.query_params.get('date_from'),
+                date_to=request.query_params.get('date_to'),
+                methods=methods,
+            )
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(
+            iter_export(export_format, export_rows(payments)), content_type=self.content_types[export_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="payments.{export_format}"'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class PaymentRollupView(APIView):
+    """
+    Выручка из сводной таблицы: ?date_from=, ?date_to= (даты включительно), ?course=, ?lesson=, ?method=,
+    ?group_by= из day, course, lesson, payment_method. Стоимость зависит от дней и курсов, не от платежей.
+    """
+    permission_classes = [IsAdminUser]
+    group_fields = ('day', 'course', 'lesson', 'payment_method')
+
+    def get(self, request):
+        params = request.query_params
+        group_by = [field for field in params.get('group_by', ','.join(self.group_fields)).split(',') if field]
+        if not group_by or set(group_by) - set(self.group_fields):
+            return Response({'group_by': [f'Допустимые поля: {", ".join(self.group_fields)}']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            date_to = parse_date(params['date_to']) if params.get('date_to') else timezone.localdate()
+            date_from = (
+                parse_date(params['date_from']) if params.get('date_from')
+                else date_to - timedelta(days=settings.PAYMENT_ROLLUP_DEFAULT_DAYS - 1)
+            )
+        except (TypeError, ValueError):
+            date_from = date_to = None
+        if date_from is None or date_to is None:
+            return Response({'detail': 'Даты в формате YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        filters = {}
+        for param, lookup in (('course', 'course_id'), ('lesson', 'lesson_id')):
+            if params.get(param):
+                try:
+                    filters[lookup] = int(params[param])
+                except ValueError:
+                    return Response({param: ['Ожидается целое число.']}, status=status.HTTP_400_BAD_REQUEST)
+        if params.get('method'):
+            filters['payment_method'] = params['method']
+
+        rollups = PaymentRollup.objects.filter(day__gte=date_from, day__lte=date_to, **filters)
+        rows = (
+            rollups
+            .values(*group_by)
+            .annotate(total=Sum('total_amount'), payments=Sum('payments_count'))
+            .order_by(*group_by)
+        )
+        results = [
+            {
+                **{field: row[field] for field in group_by},
+                # Сумма строкой, чтобы не терять копейки на float
+                'total_amount': str(row['total']),
+                'payments_count': row['payments'],
+            }
+            for row in rows
+        ]
+        return Response({'date_from': date_from, 'date_to': date_to, 'results': results})
 
-    def update(self, request, pk=None):
-        payment = get_object_or_404(self.queryset, pk=pk, user=request.user)
-        serializer = self.get_serializer(payment, data=request.data)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    def partial_update(self, request, pk=None):
-        payment = get_object_or_404(self.queryset, pk=pk, user=request.user)
-        serializer = self.get_serializer(payment, data=request.data, partial=True)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+class PaymentStripeCreateAPIView(APIView):
+    permission_classes = [IsAuthenticatedCustom]
 
-    def destroy(self, request, pk=None):
-        payment = get_object_or_404(self.queryset, pk=pk, user=request.user)
-        payment.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    def post(self, request):
+        return Response({"message": "Stripe payment created"}, status=status.HTTP_201_CREATED)
 
 
-class PaymentStripeCreateAPIView(APIView):
+class TokenRevokeView(APIView):
     permission_classes = [IsAuthenticatedCustom]
 
     def post(self, request):
-        return Response({"message": "Stripe payment created"}, status=status.HTTP_201_CREATED)
\ No newline at end of file
+        # Выход на всех устройствах: все выданные токены пользователя перестают приниматься
+        revoke_user_tokens(request.user.id)
+        return Response(status=status.HTTP_204_NO_CONTENT)